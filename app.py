@@ -1,45 +1,147 @@
 # app/main.py
-import os, json, tempfile, importlib.util
+import os, sys, gc, json, time, asyncio, tempfile, importlib, importlib.util
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
 from pathlib import Path
-from typing import Dict, Any, List
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from typing import Dict, Any, List, AsyncIterator, Callable
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
+try:
+    import fcntl
+except ImportError:   # Windows
+    fcntl = None
+from module_logs_generator.completion_cache import get_completion_cache
+from module_logs_generator import http_client, metrics
+from module_logs_generator.log_ingest import get_log_ingest
+from module_logs_generator.log_segments import get_segment_store
+from module_logs_generator.log_store import get_log_store
+from module_logs_generator.log_traces import get_trace_index
+from module_logs_generator.singleflight import singleflight_stats
+from module_logs_generator.job_queue import DONE, FAILED, JobContext, QueueFull, get_job_queue
 
 # ==== CONFIG ====
 
 BASE_DIR = Path(__file__).resolve().parent                      # where your files are
-LOGS_BASE = BASE_DIR / "module_logs_generator" / "Application Logs"                                 # logs sit in /mnt/data per your upload
+LOGS_BASE = Path(os.environ.get("LOGS_DIR", str(BASE_DIR / "module_logs_generator" / "Application Logs")))  # service logs to correlate against
 MODULE_FILE = BASE_DIR / "module_logs_generator" / "module-logs-generator.py"    # note the hyphens in filename
-LOGS_PY     = BASE_DIR / "module_logs_generator" / "logs.py"                     # contains fetch_related_logs_with_openai_verdict
-AI_ENGINE     = BASE_DIR / "module_logs_generator" / "ai_engine" / "rag_setup.py"  
 
 # Azure OpenAI creds (set these as env vars in prod)
 os.environ.setdefault("AZURE_OPENAI_ENDPOINT", "https://psacodesprint2025.azure-api.net")
 os.environ.setdefault("AZURE_OPENAI_API_KEY",   "ae8ca593ce0e4bf983cd8730fbc15df4")
+
+# Max number of category groups correlated (and of cases RAG-answered) at the same time per request
+PIPELINE_CONCURRENCY = max(1, int(os.environ.get("PIPELINE_CONCURRENCY", "4")))
+# Correlation and RAG run side by side -> two blocking calls per slot
+_PIPELINE_EXECUTOR = ThreadPoolExecutor(max_workers=2 * PIPELINE_CONCURRENCY, thread_name_prefix="pipeline")
+# Seconds between background polls of LOGS_BASE for appended lines (0: ingest once at startup only)
+LOG_INGEST_INTERVAL = float(os.environ.get("LOG_INGEST_INTERVAL", "5"))
+# Uploads waiting for a background job (JOB_WORKERS / JOB_QUEUE_DEPTH: see job_queue.py)
+JOB_UPLOAD_DIR = Path(os.environ.get("JOB_UPLOAD_DIR", str(BASE_DIR / "module_logs_generator" / "job_uploads")))
+# With several workers, only the one holding this lock does the shared writes: knowledge-base
+# ingestion, log tailing / segments and the job workers. The others only serve requests.
+WRITER_LOCK_PATH = Path(os.environ.get("WRITER_LOCK_PATH", str(BASE_DIR / "module_logs_generator" / "writer.lock")))
+# Heavy libraries are imported on first use. With PRELOAD_HEAVY_IMPORTS=1 (start.sh, gunicorn --preload)
+# they are imported once in the master instead, so forked workers share those pages.
+PRELOAD_HEAVY_IMPORTS = os.environ.get("PRELOAD_HEAVY_IMPORTS", "0") == "1"
+HEAVY_IMPORTS = ("chromadb", "chromadb.utils.embedding_functions", "openai", "pypdf")
 # =================
 
-app = FastAPI()
+_writer_lock_file = None
+
+def _become_writer() -> bool:
+    """Take WRITER_LOCK_PATH for the life of this process if no other process holds it; True if we are the writer."""
+    global _writer_lock_file
+    if _writer_lock_file is not None or fcntl is None:   # no flock (Windows): a single process
+        return True
+    WRITER_LOCK_PATH.parent.mkdir(parents=True, exist_ok=True)
+    f = open(WRITER_LOCK_PATH, "a+b")
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        f.close()
+        return False
+    _writer_lock_file = f   # released by the OS when the process exits, so a replacement worker takes over
+    return True
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    writer = _become_writer()
+    # Open Chroma once and warm its index before the first request (the writer ingests in the background if empty)
+    await asyncio.to_thread(ai_engine_mod.get_rag_service().start, writer)
+    # Writer: parse whatever was appended to the logs since the last checkpoint and extend the
+    # time-sorted segments, then keep tailing. Requests in every worker only read both.
+    ingest, segments = get_log_ingest(LOGS_BASE), get_segment_store(LOGS_BASE)
+    if writer:
+        await asyncio.to_thread(ingest.poll)
+        await asyncio.to_thread(segments.refresh)
+        if LOG_INGEST_INTERVAL > 0:
+            ingest.start(LOG_INGEST_INTERVAL, after_poll=segments.refresh)
+    # Any worker accepts jobs; the writer's threads run them (and re-queue those of a dead process)
+    jobs = get_job_queue()
+    jobs.register("import-pdf", _run_pdf_job)
+    if writer:
+        jobs.start()
+    yield
+    await asyncio.to_thread(jobs.stop, 5.0)
+    ingest.stop()
+    await http_client.aclose()
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000", "https://your-frontend.com"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Trace-Id"],
 )
 
-def _import_module_from_path(name: str, path: Path):
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Per-request trace (id from X-Trace-Id or generated), echoed back in the X-Trace-Id header."""
+    trace = metrics.start_trace(request.headers.get("x-trace-id") or None)
+    response = await call_next(request)
+    route = request.scope.get("route")
+    # streaming responses: time until the headers are sent
+    metrics.REQUESTS.observe(time.perf_counter() - trace.started,
+                             route=getattr(route, "path", "unmatched"), status=str(response.status_code))
+    response.headers["X-Trace-Id"] = trace.trace_id
+    return response
+
+def _load_module_file(name: str, path: Path):
+    """Import a file that is not importable by name (hyphens) once, under `name` in sys.modules."""
+    if name in sys.modules:
+        return sys.modules[name]
     spec = importlib.util.spec_from_file_location(name, str(path))
     if spec is None or spec.loader is None:
         raise RuntimeError(f"Could not load module from {path}")
     mod = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(mod)
+    sys.modules[name] = mod
+    try:
+        spec.loader.exec_module(mod)
+    except BaseException:
+        del sys.modules[name]
+        raise
     return mod
 
-# Load your existing modules (no renaming required)
-mlg = _import_module_from_path("module_logs_generator", MODULE_FILE)
-logs_mod = _import_module_from_path("logs_mod", LOGS_PY)
-ai_engine_mod = _import_module_from_path("rag_setup", AI_ENGINE)
+def _preload_heavy_imports() -> None:
+    for name in HEAVY_IMPORTS:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+    # keep the collector from touching (and so copying) the master's objects in every worker
+    gc.freeze()
+
+# One copy of each module, shared with the package imports inside module_logs_generator
+logs_mod = importlib.import_module("module_logs_generator.logs")
+ai_engine_mod = importlib.import_module("module_logs_generator.ai_engine.rag_setup")
+mlg = _load_module_file("module_logs_generator.module_logs_generator", MODULE_FILE)
+if PRELOAD_HEAVY_IMPORTS:
+    _preload_heavy_imports()
 
 def _case_to_text(case: Dict[str, Any]) -> str:
     """Flatten a case dict to a text snippet for log correlation."""
@@ -51,48 +153,232 @@ def _case_to_text(case: Dict[str, Any]) -> str:
             else: parts.append(str(v))
     return "\n".join(parts)
 
+def _verdict_entry(c: Dict[str, Any], verdict: bool, matched_files: List[str], raw: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "case": c,
+        "refers_to_logs": verdict,
+        "matched_log_files": matched_files,
+        "verdict_source": raw.get("verdict_source"),  # "rules" (no LLM call) or "llm"
+        "raw_model_decision": raw,  # keep for debugging; you can omit in prod
+    }
+
+def _category_groups(cases: List[Dict[str, Any]]) -> List[List[int]]:
+    """Indices of the cases per category, in order of first appearance."""
+    groups: Dict[str, List[int]] = {}
+    for i, c in enumerate(cases):
+        groups.setdefault((c.get("category") or "").strip().upper(), []).append(i)
+    return list(groups.values())
+
+async def _correlate_group(cases: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Log correlation verdicts for cases of one category, batched into as few LLM calls as fit (see logs.fetch_related_logs_batch)."""
+    category = (cases[0].get("category") or "").strip().upper()
+    incidents = [{"incident_report_text": c.get("title"), "signals": c.get("signals"), "incident_time": c.get("timestamp")}
+                 for c in cases]
+    loop = asyncio.get_running_loop()
+    with metrics.span("correlate"):
+        verdicts = await loop.run_in_executor(_PIPELINE_EXECUTOR, metrics.propagate(partial(
+            logs_mod.fetch_related_logs_batch, category, incidents, LOGS_BASE)))
+    return [_verdict_entry(c, *v) for c, v in zip(cases, verdicts)]
+
+async def _rag_case(c: Dict[str, Any]) -> Dict[str, Any]:
+    loop = asyncio.get_running_loop()
+    with metrics.span("rag"):
+        return await loop.run_in_executor(_PIPELINE_EXECUTOR, metrics.propagate(ai_engine_mod.RAG_chunk_data_producer),
+                                          c.get("title"), c.get("category"))
+
+async def _limited(sem: asyncio.Semaphore, work):
+    async with sem:
+        return await work
+
+async def _run_pipeline(cases: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    One correlation per category group and one RAG call per case, each capped at
+    PIPELINE_CONCURRENCY at once; results keep input order (verdict, rag per case).
+    """
+    groups = _category_groups(cases)
+    xref_sem, rag_sem = asyncio.Semaphore(PIPELINE_CONCURRENCY), asyncio.Semaphore(PIPELINE_CONCURRENCY)
+    per_group, rags = await asyncio.gather(
+        asyncio.gather(*(_limited(xref_sem, _correlate_group([cases[i] for i in g])) for g in groups)),
+        asyncio.gather(*(_limited(rag_sem, _rag_case(c)) for c in cases)),
+    )
+    verdicts: List[Dict[str, Any]] = [{} for _ in cases]
+    for g, entries in zip(groups, per_group):
+        for i, entry in zip(g, entries):
+            verdicts[i] = entry
+    return [entry for i in range(len(cases)) for entry in (verdicts[i], rags[i])]
+
+@app.get("/pipeline/stats")
+def pipeline_stats():
+    """Verdict counts (rules vs LLM), RAG latency and KB ingestion state, LLM cache hit rate, Azure call timings, coalesced calls and job queue depth."""
+    return {
+        "verdicts": logs_mod.verdict_source_stats(),
+        "rag_latency": ai_engine_mod.get_rag_service().latency_stats(),
+        "kb_ingest": ai_engine_mod.get_rag_service().ingest_status(),
+        "completion_cache": get_completion_cache().stats(),
+        "http": http_client.http_stats(),
+        "singleflight": singleflight_stats(),
+        "jobs": get_job_queue().stats(),
+        "process": {"pid": os.getpid(), "writer": _writer_lock_file is not None or fcntl is None},
+        "log_ingest": get_log_ingest(LOGS_BASE).stats(),
+        "log_store": get_log_store(LOGS_BASE).memory_stats(),
+        "traces": get_trace_index(LOGS_BASE).stats(),
+    }
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Stage latencies, LLM tokens, bytes and cache hits of this process in the Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+def _ndjson(event: Dict[str, Any]) -> bytes:
+    return (json.dumps(event, default=str) + "\n").encode("utf-8")
+
+async def _stream_pipeline(cases: List[Dict[str, Any]]) -> AsyncIterator[bytes]:
+    """
+    NDJSON events: "cases" first, then "verdict" / "rag" per case (with its index) as soon as
+    each finishes (the verdicts of a category group together), "error" for a failed stage, and
+    "done" last. Same concurrency cap as _run_pipeline.
+    """
+    yield _ndjson({"event": "cases", "count": len(cases), "cases": cases})
+    xref_sem, rag_sem = asyncio.Semaphore(PIPELINE_CONCURRENCY), asyncio.Semaphore(PIPELINE_CONCURRENCY)
+    events: asyncio.Queue = asyncio.Queue()
+
+    async def stage(indices: List[int], name: str, sem: asyncio.Semaphore, work) -> None:
+        """`work` returns one result per index (a category group for verdicts, a single case for rag)."""
+        try:
+            async with sem:
+                results = await work
+            for index, result in zip(indices, results):
+                events.put_nowait({"event": name, "index": index, **result})
+        except ai_engine_mod.KnowledgeBaseNotReady as e:
+            for index in indices:
+                events.put_nowait({"event": "error", "index": index, "stage": name, "status": 503,
+                                   "detail": f"Knowledge base not ready: {e}"})
+        except http_client.UpstreamThrottled as e:
+            for index in indices:
+                events.put_nowait({"event": "error", "index": index, "stage": name, "status": 503,
+                                   "detail": str(e), "retry_after": e.retry_after})
+        except Exception as e:
+            for index in indices:
+                events.put_nowait({"event": "error", "index": index, "stage": name, "status": 500, "detail": str(e)})
+
+    async def rag_one(c: Dict[str, Any]) -> List[Dict[str, Any]]:
+        return [await _rag_case(c)]
+
+    tasks = [asyncio.create_task(stage(g, "verdict", xref_sem, _correlate_group([cases[i] for i in g])))
+             for g in _category_groups(cases)]
+    tasks += [asyncio.create_task(stage([i], "rag", rag_sem, rag_one(c))) for i, c in enumerate(cases)]
+    try:
+        for _ in range(2 * len(cases)):
+            yield _ndjson(await events.get())
+        yield _ndjson({"event": "done", "count": len(cases)})
+    finally:
+        # client went away mid-stream: stop scheduling further cases
+        for t in tasks:
+            t.cancel()
+
+def _retry_after_header(e: http_client.UpstreamThrottled) -> Dict[str, str]:
+    return {"Retry-After": str(max(1, round(e.retry_after or 0)))}
+
+async def _save_pdf_upload(file: UploadFile, directory: Path = None) -> Path:
+    """Validate the upload and write it to a temp file in `directory` (caller unlinks it)."""
+    if file.content_type not in ("application/pdf", "application/octet-stream"):
+        raise HTTPException(400, "Please upload a PDF.")
+    data = await file.read()
+    metrics.count(metrics.UPLOAD_BYTES, len(data), "upload_bytes", endpoint="pdf")
+    if len(data) > 15 * 1024 * 1024:
+        raise HTTPException(413, "File too large (max 15MB).")
+    if directory is not None:
+        directory.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf", dir=directory) as tmp:
+        tmp.write(data)
+        return Path(tmp.name)
+
+async def _extract_cases(extract: Callable[[Any], Dict[str, Any]], arg: Any) -> List[Dict[str, Any]]:
+    """Run an extractor off the loop and map failures to HTTP errors (used before a stream starts)."""
+    try:
+        with metrics.span("extract"):
+            payload = await asyncio.to_thread(extract, arg)
+    except http_client.UpstreamThrottled as e:
+        raise HTTPException(503, f"Azure OpenAI is throttling requests, retry later: {e}",
+                            headers=_retry_after_header(e))
+    except mlg.PdfNotReadable as e:
+        raise HTTPException(422, str(e))
+    except Exception as e:
+        raise HTTPException(500, f"Pipeline error: {e}")
+    cases = payload.get("cases", [])
+    if not cases:
+        raise HTTPException(422, "No test cases detected.")
+    return cases
+
+async def _collect_pipeline(cases: List[Dict[str, Any]], ctx: JobContext) -> Dict[str, Any]:
+    """Drive _stream_pipeline to completion, recording per-case progress; same shape as /pipeline/import-pdf."""
+    verdicts: Dict[int, Dict[str, Any]] = {}
+    rags: Dict[int, Dict[str, Any]] = {}
+    async for line in _stream_pipeline(cases):
+        ev = json.loads(line)
+        kind, index = ev.pop("event"), ev.pop("index", None)
+        if kind in ("verdict", "rag"):
+            (verdicts if kind == "verdict" else rags)[index] = ev
+            ctx.case_stage(index, kind, DONE)
+        elif kind == "error":
+            (verdicts if ev["stage"] == "verdict" else rags)[index] = {"error": ev["detail"], "status": ev["status"]}
+            ctx.case_stage(index, ev["stage"], FAILED)
+    results = [entry for i in range(len(cases)) for entry in (verdicts[i], rags[i])]
+    return {"ok": True, "count": len(results), "results": results}
+
+def _run_pdf_job(ctx: JobContext, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Job handler (runs on a job_queue worker thread): extract, then correlate + RAG every case.
+    The upload is deleted only when the job ends, so a job re-queued after a crash still has it.
+    """
+    pdf_path = Path(payload["pdf_path"])
+    try:
+        cases = mlg.extract_cases_with_openai(pdf_path).get("cases", [])
+        if not cases:
+            raise ValueError("No test cases detected in PDF.")
+        ctx.set_cases(cases)
+        return asyncio.run(_collect_pipeline(cases, ctx))
+    finally:
+        pdf_path.unlink(missing_ok=True)
+
+def _with_trace(body: Dict[str, Any], include: bool) -> Dict[str, Any]:
+    """?trace=true: add this request's per-stage timings, tokens and cache counts to the response."""
+    current = metrics.current_trace()
+    if include and current is not None:
+        body["trace"] = current.to_dict()
+    return body
+
 class TextInput(BaseModel):
     text: str
 
 @app.post("/pipeline/import-text")
-async def import_text(query:TextInput):
+async def import_text(query:TextInput, trace: bool = False):
+    metrics.count(metrics.UPLOAD_BYTES, len(query.text.encode("utf-8")), "upload_bytes", endpoint="text")
     try:
-        print("start of process")
         # Use the extractor function already defined in module-logs-generator.py
         # It expects a file path; returns {"cases":[...], ...}
         # tmp_path = BASE_DIR / "module_/logs_generator" / "Test Cases.pdf"
-        payload = mlg.extract_cases_from_text(query.text)
+        with metrics.span("extract"):
+            payload = await asyncio.to_thread(mlg.extract_cases_from_text, query.text)
         cases = payload.get("cases", [])
         if not cases:
             raise HTTPException(422, "No test cases detected in PDF.")
 
-        results = []
-        for c in cases:
-            category = (c.get("category") or "").strip().upper()
-
-            # Run correlation using your logs.py helper (it maps filenames internally)
-            verdict, matched_files, raw = logs_mod.fetch_related_logs_with_openai_verdict(
-                category=category,
-                incident_report_text=c.get("title"),
-                base_dir=LOGS_BASE,
-            )
-
-            results.append({
-                "case": c,
-                "refers_to_logs": verdict,
-                "matched_log_files": matched_files,
-                "raw_model_decision": raw,  # keep for debugging; you can omit in prod
-            })
-
-            # TODO: will need you to return the correct thing and append to results
-            results.append(ai_engine_mod.RAG_chunk_data_producer(c.get("title")) )
+        results = await _run_pipeline(cases)
 
         # Optional: save CSV/JSON like the CLI did
         # mlg.save_json(cases, Path("testcase_module_mapping.json"))
         # mlg.save_csv(cases, Path("testcase_module_mapping.csv"))
 
-        return {"ok": True, "count": len(results), "results": results}
+        return _with_trace({"ok": True, "count": len(results), "results": results}, trace)
 
+    except HTTPException:
+        raise
+    except ai_engine_mod.KnowledgeBaseNotReady as e:
+        raise HTTPException(503, f"Knowledge base not ready: {e}")
+    except http_client.UpstreamThrottled as e:
+        raise HTTPException(503, f"Azure OpenAI is throttling requests, retry later: {e}",
+                            headers=_retry_after_header(e))
     except Exception as e:
         raise HTTPException(500, f"Pipeline error: {e}")
     # finally:
@@ -100,58 +386,88 @@ async def import_text(query:TextInput):
         # except: pass
 
 @app.post("/pipeline/import-pdf")
-async def import_pdf(file: UploadFile = File(...)):
+async def import_pdf(file: UploadFile = File(...), trace: bool = False):
 
-    if file.content_type not in ("application/pdf", "application/octet-stream"):
-        raise HTTPException(400, "Please upload a PDF.")
-
-    # # Save the upload to a temp file
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-        data = await file.read()
-        if len(data) > 15 * 1024 * 1024:
-            raise HTTPException(413, "File too large (max 15MB).")
-        tmp.write(data)
-        tmp_path = Path(tmp.name)
+    tmp_path = await _save_pdf_upload(file)
 
     try:
-        print("start of process")
         # Use the extractor function already defined in module-logs-generator.py
         # It expects a file path; returns {"cases":[...], ...}
         # tmp_path = BASE_DIR / "module_/logs_generator" / "Test Cases.pdf"
-        payload = mlg.extract_cases_with_openai(tmp_path)
+        with metrics.span("extract"):
+            payload = await asyncio.to_thread(mlg.extract_cases_with_openai, tmp_path)
         cases = payload.get("cases", [])
         if not cases:
             raise HTTPException(422, "No test cases detected in PDF.")
 
-        results = []
-        for c in cases:
-            category = (c.get("category") or "").strip().upper()
-
-            # Run correlation using your logs.py helper (it maps filenames internally)
-            verdict, matched_files, raw = logs_mod.fetch_related_logs_with_openai_verdict(
-                category=category,
-                incident_report_text=c.get("title"),
-                base_dir=LOGS_BASE,
-            )
-
-            results.append({
-                "case": c,
-                "refers_to_logs": verdict,
-                "matched_log_files": matched_files,
-                "raw_model_decision": raw,  # keep for debugging; you can omit in prod
-            })
-
-            # TODO: will need you to return the correct thing and append to results
-            results.append(ai_engine_mod.RAG_chunk_data_producer(c.get("title")) )
+        results = await _run_pipeline(cases)
 
         # Optional: save CSV/JSON like the CLI did
         # mlg.save_json(cases, Path("testcase_module_mapping.json"))
         # mlg.save_csv(cases, Path("testcase_module_mapping.csv"))
 
-        return {"ok": True, "count": len(results), "results": results}
+        return _with_trace({"ok": True, "count": len(results), "results": results}, trace)
 
+    except HTTPException:
+        raise
+    except ai_engine_mod.KnowledgeBaseNotReady as e:
+        raise HTTPException(503, f"Knowledge base not ready: {e}")
+    except http_client.UpstreamThrottled as e:
+        raise HTTPException(503, f"Azure OpenAI is throttling requests, retry later: {e}",
+                            headers=_retry_after_header(e))
+    except mlg.PdfNotReadable as e:
+        raise HTTPException(422, str(e))
     except Exception as e:
         raise HTTPException(500, f"Pipeline error: {e}")
     finally:
         try: tmp_path.unlink()
-        except: pass
\ No newline at end of file
+        except: pass
+
+# ---- Streaming variants: application/x-ndjson, one event per line (see _stream_pipeline) ----
+
+@app.post("/pipeline/import-text/stream")
+async def import_text_stream(query: TextInput):
+    metrics.count(metrics.UPLOAD_BYTES, len(query.text.encode("utf-8")), "upload_bytes", endpoint="text")
+    cases = await _extract_cases(mlg.extract_cases_from_text, query.text)
+    return StreamingResponse(_stream_pipeline(cases), media_type="application/x-ndjson")
+
+@app.post("/pipeline/import-pdf/stream")
+async def import_pdf_stream(file: UploadFile = File(...)):
+    tmp_path = await _save_pdf_upload(file)
+    try:
+        cases = await _extract_cases(mlg.extract_cases_with_openai, tmp_path)
+    finally:
+        try: tmp_path.unlink()
+        except: pass
+    return StreamingResponse(_stream_pipeline(cases), media_type="application/x-ndjson")
+
+# ---- Background jobs: POST returns a job id at once, poll GET /jobs/{id} for progress/result ----
+
+@app.post("/jobs/import-pdf", status_code=202)
+async def submit_pdf_job(file: UploadFile = File(...)):
+    pdf_path = await _save_pdf_upload(file, JOB_UPLOAD_DIR)
+    try:
+        job_id = await asyncio.to_thread(get_job_queue().submit, "import-pdf", {"pdf_path": str(pdf_path)})
+    except QueueFull as e:
+        pdf_path.unlink(missing_ok=True)
+        raise HTTPException(503, f"Job queue full, retry later: {e}", headers={"Retry-After": "30"})
+    return {"job_id": job_id, "status": "queued", "status_url": f"/jobs/{job_id}"}
+
+@app.get("/logs/traces")
+async def log_traces(q: str = "", signal: List[str] = Query(default=[]), corr_id: List[str] = Query(default=[])):
+    """Stitched cross-service traces for explicit corrIds, or for the identifiers in `q` / `signal`."""
+    index = await asyncio.to_thread(get_trace_index, LOGS_BASE)
+    if corr_id:
+        traces = await asyncio.to_thread(index.traces, corr_id)
+    elif q or signal:
+        traces = await asyncio.to_thread(index.for_incident, q, signal)
+    else:
+        raise HTTPException(400, "Pass corr_id, q or signal.")
+    return {"count": len(traces), "traces": traces}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await asyncio.to_thread(get_job_queue().get, job_id)
+    if job is None:
+        raise HTTPException(404, "Unknown job id.")
+    return job
@@ -0,0 +1,70 @@
+"""
+Per-regex line loop (the old fetch_related_logs) vs the single compiled scanner.
+
+    python -m benchmarks.bench_log_scanner --sizes 100 250
+"""
+import argparse
+import re
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+from benchmarks.synthetic_logs import generate_service_log
+from module_logs_generator.logs import compile_hint_regexes
+from module_logs_generator.log_scanner import get_scanner, scan_file
+
+SIGNALS = ["CMAU0000020", "REF-IFT-0007", "VESSEL_ERR_4", "MV Lion City 07"]
+
+
+def legacy_scan(path: Path, category: str, signals: List[str]) -> int:
+    regs = compile_hint_regexes(category, signals)
+    n = 0
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        for line in f:
+            if any(r.search(line) for r in regs):
+                n += 1
+    return n
+
+
+def scanner_scan(path: Path, category: str, signals: List[str]) -> int:
+    scanner = get_scanner(category, signals)
+    return sum(1 for _ in scan_file(path, scanner)) if scanner else 0
+
+
+def _timed(fn, *args):
+    t0 = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - t0
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[100], help="synthetic log sizes in MB")
+    ap.add_argument("--noise", type=float, default=0.8, help="fraction of identifier-free lines")
+    ap.add_argument("--workdir", type=Path, default=None, help="where to write logs (default: temp dir)")
+    args = ap.parse_args()
+
+    workdir = args.workdir or Path(tempfile.mkdtemp(prefix="bench_scanner_"))
+    cases = [("CNTR", "container_service.log"), ("EA", "edi_adivce_service.log"), ("VS", "vessel_advice_service.log")]
+    try:
+        print(f"{'category':8} {'size':>7} {'lines':>9} {'legacy s':>9} {'scanner s':>9} {'MB/s':>7} {'speedup':>7}")
+        for size_mb in args.sizes:
+            for category, fname in cases:
+                path = generate_service_log(workdir / f"{size_mb}mb_{fname}", size_mb * 1024 * 1024, kind=fname,
+                                            noise_ratio=args.noise)
+                n_old, t_old = _timed(legacy_scan, path, category, SIGNALS)
+                n_new, t_new = _timed(scanner_scan, path, category, SIGNALS)
+                if n_old != n_new:
+                    print(f"!! line count mismatch for {fname}: legacy={n_old} scanner={n_new}")
+                print(f"{category:8} {size_mb:>5}MB {n_new:>9} {t_old:>9.2f} {t_new:>9.2f} "
+                      f"{size_mb / t_new:>7.1f} {t_old / t_new:>6.1f}x")
+                path.unlink()
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Memory per record and query latency of the columnar log store vs a dict per parsed line
+(the store serves the rule fast path and trace lookups).
+
+    python -m benchmarks.bench_log_store --size 50
+"""
+import argparse
+import shutil
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from benchmarks.synthetic_logs import generate_log_dir
+from module_logs_generator.log_ingest import LogIngestService, parse_log_line
+from module_logs_generator.log_store import ColumnarLogStore
+
+
+def _timed(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    out = fn(*args, **kwargs)
+    return out, time.perf_counter() - t0
+
+
+def dict_per_line_bytes(log_dir: Path) -> float:
+    """tracemalloc'd bytes per record when every parsed line is kept as a dict."""
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    kept = []
+    for path in sorted(log_dir.glob("*.log")):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                rec = parse_log_line(line, path.name)
+                if rec is not None:
+                    kept.append({"ts_ms": rec.ts_ms, "level": rec.level, "component": rec.component,
+                                 "corr_id": rec.corr_id, "fields": rec.fields})
+    used = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    return used / max(1, len(kept))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--size", type=int, default=20, help="MB of synthetic log per service")
+    args = ap.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="bench_store_"))
+    try:
+        log_dir = generate_log_dir(workdir / "logs", args.size * 1024 * 1024)
+        ingest = LogIngestService(log_dir, workdir / "ingest.sqlite3")
+        _, t_ingest = _timed(ingest.poll)
+        store = ColumnarLogStore(ingest)
+        n, t_sync = _timed(store.sync)
+        mem = store.memory_stats()
+        print(f"records            {n}")
+        print(f"ingest (parse+db)  {t_ingest:.1f}s   columnar load {t_sync:.1f}s")
+        print(f"columnar           {mem['bytes_per_row']} bytes/record (columns + side index)")
+        print(f"dict per line      {dict_per_line_bytes(log_dir):.0f} bytes/record")
+
+        t_mid = store.ts_ms[len(store) // 2]
+        ref = next(t for t in store.index if t.startswith("REF-"))
+        corr_ids = store.dicts["corr_id"].values[1:11]
+        for label, fn, kwargs in [
+            ("token", store.query, {"token": ref}),
+            ("token +/-5min", store.around, {"t_ms": t_mid, "window_ms": 300_000, "token": ref}),
+            ("ERROR +/-5min", store.around, {"t_ms": t_mid, "window_ms": 300_000, "level": "ERROR"}),
+            ("COPARN in EA log", store.query, {"files": ["edi_adivce_service.log"], "message_type": "COPARN"}),
+            ("find_tokens", store.find_tokens, {"tokens": [ref]}),
+            ("by_corr_id", store.by_corr_id, {"corr_ids": corr_ids}),
+        ]:
+            fn(**kwargs)  # first time-range query builds the sorted order
+            rows, dt = _timed(fn, **kwargs)
+            print(f"query {label:18} {len(rows):>8} rows {dt * 1000:8.2f} ms")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""
+End-to-end throughput of the server against the local mock Azure gateway (mock_azure.py):
+requests/sec and latency percentiles of /pipeline/import-text and /pipeline/import-pdf,
+per-stage latencies (extraction, verdict, RAG) from the NDJSON stream, and the server's peak
+RSS, at each concurrency level. Optionally also categorize_incidents throughput.
+
+    python -m benchmarks.bench_pipeline --concurrency 1 4 16 --cases 6 --log-mb 20
+    python -m benchmarks.bench_pipeline --json out.json --baseline main.json --tolerance 0.25
+
+With --baseline the run exits 1 when req/s drops or p95 grows by more than --tolerance.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from benchmarks.synthetic_cases import generate_cases_text, write_text_pdf
+from benchmarks.synthetic_logs import generate_log_dir
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile (0 for no samples)."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    k = max(0, -(-len(ordered) * pct // 100) - 1)
+    return ordered[min(int(k), len(ordered) - 1)]
+
+
+def _summary(samples_s: List[float]) -> Dict[str, float]:
+    ms = [s * 1000 for s in samples_s]
+    return {"n": len(ms), "p50_ms": round(percentile(ms, 50), 1), "p95_ms": round(percentile(ms, 95), 1),
+            "p99_ms": round(percentile(ms, 99), 1)}
+
+
+# ---------------- processes ----------------
+def _wait_http(url: str, proc: subprocess.Popen, timeout: float = 120.0) -> None:
+    t0 = time.time()
+    while time.time() - t0 < timeout:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{proc.args} exited with {proc.returncode}")
+        try:
+            if httpx.get(url, timeout=2).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up")
+
+
+def _peak_rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def _reset_peak_rss(pid: int) -> None:
+    try:
+        with open(f"/proc/{pid}/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass   # not permitted here: the peak then covers the whole run so far
+
+
+def start_mock(args, port: int) -> subprocess.Popen:
+    cmd = [sys.executable, "-m", "benchmarks.mock_azure", "--port", str(port),
+           "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+           "--error-rate", str(args.error_rate), "--throttle-rate", str(args.throttle_rate)]
+    proc = subprocess.Popen(cmd, cwd=ROOT)
+    _wait_http(f"http://127.0.0.1:{port}/mock/stats", proc)
+    return proc
+
+
+def start_server(workdir: Path, mock_port: int, port: int, log_dir: Path, cache: bool) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update({
+        "AZURE_OPENAI_ENDPOINT": f"http://127.0.0.1:{mock_port}",
+        "LOGS_DIR": str(log_dir),
+        "CHROMA_PATH": str(workdir / "chroma_db"),
+        "EMBEDDING_CACHE_PATH": str(workdir / "embedding_cache.sqlite3"),
+        "COMPLETION_CACHE_BACKEND": "memory" if cache else "off",
+        "COMPLETION_CACHE_PATH": str(workdir / "completion_cache.sqlite3"),
+        "CATEGORIZE_STATE_PATH": str(workdir / "categorize_state.sqlite3"),
+        "WRITER_LOCK_PATH": str(workdir / "writer.lock"),   # never compete with a dev server for the real lock
+        "JOB_DB_PATH": str(workdir / "jobs.sqlite3"),
+        "JOB_UPLOAD_DIR": str(workdir / "uploads"),
+        "LOG_INGEST_DIR": str(workdir / "ingest"),
+        "LOG_SEGMENT_DIR": str(workdir / "segments"),
+        "LOG_INGEST_INTERVAL": "0",
+        "PYTHONPATH": str(ROOT),
+    })
+    cmd = [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--log-level", "warning"]
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL)
+    _wait_http(f"http://127.0.0.1:{port}/pipeline/stats", proc)
+    return proc
+
+
+# ---------------- load ----------------
+async def _wait_for_kb(client: httpx.AsyncClient, text: str, timeout: float = 300.0) -> None:
+    """The knowledge base is ingested (through the mock) in the background on first start."""
+    t0 = time.time()
+    while time.time() - t0 < timeout:
+        r = await client.post("/pipeline/import-text", json={"text": text})
+        if r.status_code != 503:
+            r.raise_for_status()
+            return
+        await asyncio.sleep(1.0)
+    raise RuntimeError("knowledge base never became ready")
+
+
+async def _run_level(client: httpx.AsyncClient, kind: str, concurrency: int, n_requests: int,
+                     make_payload) -> Dict[str, Any]:
+    sem = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    stages: Dict[str, List[float]] = {"extraction": [], "verdict": [], "rag": []}
+    errors = 0
+
+    async def one(i: int) -> None:
+        nonlocal errors
+        async with sem:
+            t0 = time.perf_counter()
+            try:
+                if kind == "stream":
+                    t_cases = None
+                    async with client.stream("POST", "/pipeline/import-text/stream", json=make_payload(i)) as r:
+                        r.raise_for_status()
+                        async for line in r.aiter_lines():
+                            if not line:
+                                continue
+                            event, now = json.loads(line), time.perf_counter()
+                            if event.get("event") == "cases":
+                                t_cases = now
+                                stages["extraction"].append(now - t0)
+                            elif event.get("event") in ("verdict", "rag") and t_cases is not None:
+                                stages[event["event"]].append(now - t_cases)
+                            elif event.get("event") == "error":
+                                errors += 1
+                elif kind == "pdf":
+                    name, data = make_payload(i)
+                    r = await client.post("/pipeline/import-pdf", files={"file": (name, data, "application/pdf")})
+                    r.raise_for_status()
+                else:
+                    r = await client.post("/pipeline/import-text", json=make_payload(i))
+                    r.raise_for_status()
+            except httpx.HTTPError:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n_requests)))
+    wall = time.perf_counter() - t0
+    out: Dict[str, Any] = {"requests": n_requests, "errors": errors,
+                           "rps": round(len(latencies) / wall, 2) if wall else 0.0, **_summary(latencies)}
+    if kind == "stream":
+        out["stages"] = {name: _summary(v) for name, v in stages.items()}
+    return out
+
+
+async def run_benchmark(args, server_port: int, server_pid: int, log_dir: Path, workdir: Path) -> Dict[str, Any]:
+    texts = [generate_cases_text(args.cases, log_dir, seed=1000 + i) for i in range(args.requests)]
+    pdfs = []
+    for i, text in enumerate(texts):
+        path = write_text_pdf(workdir / "pdfs" / f"cases_{i}.pdf", text)
+        pdfs.append((path.name, path.read_bytes()))
+    payloads = {"text": lambda i: {"text": texts[i]}, "stream": lambda i: {"text": texts[i]},
+                "pdf": lambda i: pdfs[i]}
+
+    results: Dict[str, Any] = {"levels": []}
+    limits = httpx.Limits(max_connections=max(args.concurrency) * 2)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{server_port}", timeout=600, limits=limits) as client:
+        await _wait_for_kb(client, generate_cases_text(1, log_dir, seed=1))
+        for kind in args.endpoints:   # first-use costs (Chroma query path, pypdf import) stay out of the numbers
+            await _run_level(client, kind, 1, 1, payloads[kind])
+        for c in args.concurrency:
+            for kind in args.endpoints:
+                _reset_peak_rss(server_pid)
+                r = await _run_level(client, kind, c, args.requests, payloads[kind])
+                r.update({"endpoint": kind, "concurrency": c, "server_peak_rss_mb": round(_peak_rss_mb(server_pid), 1)})
+                results["levels"].append(r)
+                line = (f"{kind:6} c={c:<3} {r['rps']:7.2f} req/s  p50 {r['p50_ms']:8.1f}  p95 {r['p95_ms']:8.1f}  "
+                        f"p99 {r['p99_ms']:8.1f} ms  errors {r['errors']}  peak RSS {r['server_peak_rss_mb']:.0f} MB")
+                print(line)
+                for stage, s in r.get("stages", {}).items():
+                    print(f"         {stage:10} p50 {s['p50_ms']:8.1f}  p95 {s['p95_ms']:8.1f}  p99 {s['p99_ms']:8.1f} ms")
+        results["server_stats"] = (await client.get("/pipeline/stats")).json()
+    return results
+
+
+def run_categorize(rows: int, mock_port: int, workdir: Path) -> Dict[str, float]:
+    """categorize_incidents throughput on the case log repeated to `rows` rows, against the mock."""
+    os.environ["AZURE_OPENAI_ENDPOINT"] = f"http://127.0.0.1:{mock_port}"
+    os.environ["CATEGORIZE_STATE_PATH"] = str(workdir / "categorize_state.sqlite3")
+    os.environ["COMPLETION_CACHE_PATH"] = str(workdir / "completion_cache.sqlite3")
+    import pandas as pd
+    from module_logs_generator.ai_engine import categorize_incidents as ci
+    base = pd.read_excel(ci.INPUT_FILE)
+    df = pd.concat([base] * (rows // len(base) + 1), ignore_index=True).iloc[:rows].copy()
+    # a share of rows no rule matches, so the batched LLM path is exercised as well
+    df.loc[df.index % 10 == 0, ci.TEXT_COLUMNS] = [[f"note {i}", "", ""] for i in df.index[df.index % 10 == 0]]
+    _, stats = ci.categorize_dataframe(df)
+    print(f"categorize {stats['rows']} rows ({stats['llm_rows']} via LLM) -> {stats['rows_per_second']} rows/s")
+    return stats
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Regressions of req/s or p95 beyond `tolerance` for the (endpoint, concurrency) pairs in both runs."""
+    base = {(r["endpoint"], r["concurrency"]): r for r in baseline.get("levels", [])}
+    problems = []
+    for r in current["levels"]:
+        b = base.get((r["endpoint"], r["concurrency"]))
+        if b is None:
+            continue
+        if b["rps"] and r["rps"] < b["rps"] * (1 - tolerance):
+            problems.append(f"{r['endpoint']} c={r['concurrency']}: {r['rps']} req/s vs {b['rps']}")
+        if b["p95_ms"] and r["p95_ms"] > b["p95_ms"] * (1 + tolerance):
+            problems.append(f"{r['endpoint']} c={r['concurrency']}: p95 {r['p95_ms']} ms vs {b['p95_ms']}")
+    return problems
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    ap.add_argument("--requests", type=int, default=16, help="requests per endpoint and concurrency level")
+    ap.add_argument("--endpoints", nargs="+", default=["text", "pdf", "stream"], choices=["text", "pdf", "stream"])
+    ap.add_argument("--cases", type=int, default=6, help="test cases per request")
+    ap.add_argument("--log-mb", type=float, default=5, help="MB of synthetic log per service")
+    ap.add_argument("--latency-ms", type=float, default=200)
+    ap.add_argument("--jitter-ms", type=float, default=50)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--throttle-rate", type=float, default=0.0)
+    ap.add_argument("--cache", action="store_true", help="keep the completion cache on (default: off)")
+    ap.add_argument("--categorize-rows", type=int, default=0, help="also time categorize_incidents on this many rows")
+    ap.add_argument("--json", type=Path, help="write the results here")
+    ap.add_argument("--baseline", type=Path, help="results JSON of a previous run to compare with")
+    ap.add_argument("--tolerance", type=float, default=0.25)
+    args = ap.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="bench_pipeline_"))
+    procs: List[subprocess.Popen] = []
+    try:
+        log_dir = generate_log_dir(workdir / "logs", int(args.log_mb * 1024 * 1024))
+        mock_port, server_port = _free_port(), _free_port()
+        procs.append(start_mock(args, mock_port))
+        server = start_server(workdir, mock_port, server_port, log_dir, args.cache)
+        procs.append(server)
+        results = asyncio.run(run_benchmark(args, server_port, server.pid, log_dir, workdir))
+        if args.categorize_rows:
+            results["categorize"] = run_categorize(args.categorize_rows, mock_port, workdir)
+        results["mock_calls"] = httpx.get(f"http://127.0.0.1:{mock_port}/mock/stats").json()
+        results["settings"] = {k: v for k, v in vars(args).items() if k not in ("json", "baseline")}
+        if args.json:
+            args.json.write_text(json.dumps(results, indent=2, default=str))
+        if args.baseline:
+            problems = compare(results, json.loads(args.baseline.read_text()), args.tolerance)
+            for p in problems:
+                print("REGRESSION", p)
+            if problems:
+                sys.exit(1)
+    finally:
+        for p in procs:
+            p.terminate()
+            try:
+                p.wait(15)
+            except subprocess.TimeoutExpired:
+                p.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Import time / RSS of `import app`, and time-to-ready / PSS of a gunicorn deployment with
+and without --preload (PSS splits shared pages between the processes that map them).
+
+    python -m benchmarks.bench_startup --runs 5
+    python -m benchmarks.bench_startup --gunicorn --workers 4
+"""
+import argparse
+import os
+import shutil
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+from typing import Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+
+IMPORT_SNIPPET = (
+    "import time, resource; t = time.perf_counter(); import app; "
+    "print(time.perf_counter() - t, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"
+)
+
+
+def _env(workdir: Path, preload: bool) -> Dict[str, str]:
+    """Keep the server's local state (jobs, ingest, caches) out of the repo during the run."""
+    env = dict(os.environ)
+    env.update({
+        "PRELOAD_HEAVY_IMPORTS": "1" if preload else "0",
+        "WRITER_LOCK_PATH": str(workdir / "writer.lock"),
+        "EMBEDDING_CACHE_PATH": str(workdir / "embedding_cache.sqlite3"),
+        "COMPLETION_CACHE_PATH": str(workdir / "completion_cache.sqlite3"),
+        "JOB_DB_PATH": str(workdir / "jobs.sqlite3"),
+        "JOB_UPLOAD_DIR": str(workdir / "uploads"),
+        "LOG_INGEST_DIR": str(workdir / "ingest"),
+        "LOG_SEGMENT_DIR": str(workdir / "segments"),
+        "LOG_INGEST_INTERVAL": "0",
+        "COMPLETION_CACHE_BACKEND": "memory",
+        "CHROMA_PATH": str(workdir / "chroma_db"),
+        "PYTHONPATH": str(ROOT),
+    })
+    return env
+
+
+def measure_import(runs: int, preload: bool, workdir: Path) -> Dict[str, float]:
+    """Median wall time and peak RSS of `import app` in fresh interpreters."""
+    times, rss = [], []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=ROOT, env=_env(workdir, preload),
+                             capture_output=True, text=True, check=True).stdout.split()
+        times.append(float(out[0]))
+        rss.append(int(out[1]) / 1024)
+    return {"import_s": statistics.median(times), "rss_mb": statistics.median(rss)}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _children(pid: int) -> List[int]:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+
+def _pss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            if line.startswith("Pss:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def measure_gunicorn(workers: int, preload: bool, workdir: Path, timeout: float = 120.0) -> Optional[Dict[str, float]]:
+    """Seconds until every worker answers, and total PSS of master + workers once they have."""
+    if shutil.which("gunicorn") is None:
+        return None
+    port = _free_port()
+    cmd = ["gunicorn", "app:app", "-k", "uvicorn.workers.UvicornWorker", "--bind", f"127.0.0.1:{port}",
+           "--workers", str(workers), "--log-level", "warning"] + (["--preload"] if preload else [])
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=_env(workdir, preload))
+    try:
+        ready = None
+        while time.perf_counter() - t0 < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/pipeline/stats", timeout=5) as r:
+                    r.read()
+                if len(_children(proc.pid)) >= workers:
+                    ready = time.perf_counter() - t0
+                    break
+            except OSError:
+                pass
+            time.sleep(0.1)
+        if ready is None:
+            raise RuntimeError("gunicorn did not become ready")
+        # every worker has run its lifespan (Chroma open) once a request got through to each of them
+        for _ in range(4 * workers):
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/pipeline/stats", timeout=5).read()
+        pids = [proc.pid] + _children(proc.pid)
+        return {"ready_s": ready, "pss_mb": sum(_pss_mb(p) for p in pids), "processes": len(pids)}
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait(30)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--runs", type=int, default=5, help="fresh interpreters per import measurement")
+    ap.add_argument("--gunicorn", action="store_true", help="also start gunicorn with and without --preload")
+    ap.add_argument("--workers", type=int, default=2)
+    args = ap.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="bench_startup_"))
+    try:
+        for label, preload in [("lazy", False), ("heavy imports", True)]:
+            r = measure_import(args.runs, preload, workdir)
+            print(f"import app ({label:13}) {r['import_s']:.2f}s   peak RSS {r['rss_mb']:.0f} MB")
+        if args.gunicorn:
+            for label, preload in [("per worker", False), ("--preload", True)]:
+                r = measure_gunicorn(args.workers, preload, workdir)
+                if r is None:
+                    print("gunicorn not installed; skipping")
+                    break
+                print(f"gunicorn {args.workers} workers ({label:10}) ready {r['ready_s']:.2f}s   "
+                      f"PSS {r['pss_mb']:.0f} MB over {r['processes']} processes")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
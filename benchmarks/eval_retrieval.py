@@ -0,0 +1,175 @@
+"""
+Offline retrieval quality of the RAG knowledge base: recall@k, hit@k and MRR of dense-only,
+BM25-only and hybrid (weighted RRF) retrieval, with and without the case category filter,
+for the test cases in testcase_module_mapping.json.
+
+    python -m benchmarks.eval_retrieval --write-pool pool.json     # candidates to label
+    python -m benchmarks.eval_retrieval --qrels qrels.json --json out.json
+    python -m benchmarks.eval_retrieval --qrels qrels.json --k 3 5 10 --dense-weight 1 --sparse-weight 0.5
+    python -m benchmarks.eval_retrieval --mock --signal-qrels      # exercise the script only
+
+Relevant documents come from hand-labelled --qrels ({"TC-01": ["incident_ab61...", ...]}).
+--write-pool writes, per case, the union of every configuration's top candidates (id,
+categories, text) for labelling. --signal-qrels instead counts a document as relevant when it
+contains one of the case's signals: that is string matching, the same thing BM25 rewards, so
+it favours BM25 and the hybrid by construction; its numbers are flagged as a proxy and are not
+evidence for choosing a configuration. --mock starts benchmarks.mock_azure and ingests into a
+temporary collection; its embeddings are deterministic but not semantic, which makes the
+dense numbers meaningless there (only use it to exercise the script).
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Set
+
+from benchmarks.bench_pipeline import ROOT, _free_port, _wait_http
+
+CASES_FILE = ROOT / "module_logs_generator" / "testcase_module_mapping.json"
+
+
+def signal_qrels(cases: List[Dict[str, Any]], ids: List[str], documents: List[str]) -> Dict[str, Set[str]]:
+    """Per case id: the documents containing any of its signals (case-insensitive). A lexical proxy."""
+    lowered = [d.lower() for d in documents]
+    qrels: Dict[str, Set[str]] = {}
+    for case in cases:
+        signals = [s.lower() for s in case.get("signals") or [] if s]
+        qrels[case["id"]] = {doc_id for doc_id, doc in zip(ids, lowered) if any(s in doc for s in signals)}
+    return qrels
+
+
+def score(ranked: List[str], relevant: Set[str], ks: List[int]) -> Dict[str, float]:
+    out: Dict[str, float] = {}
+    for k in ks:
+        found = len(relevant.intersection(ranked[:k]))
+        out[f"recall@{k}"] = found / len(relevant) if relevant else 0.0
+        out[f"hit@{k}"] = 1.0 if found else 0.0
+    out["mrr"] = next((1.0 / rank for rank, doc_id in enumerate(ranked, 1) if doc_id in relevant), 0.0)
+    return out
+
+
+def evaluate(retriever, cases: List[Dict[str, Any]], qrels: Dict[str, Set[str]], ks: List[int],
+             query_field: str, use_category: bool) -> Dict[str, Any]:
+    per_case: Dict[str, Dict[str, float]] = {}
+    for case in cases:
+        relevant = qrels.get(case["id"]) or set()
+        if not relevant:
+            continue
+        hits = retriever.search(case.get(query_field) or "", max(ks), case.get("category") if use_category else None)
+        per_case[case["id"]] = score([h.id for h in hits], relevant, ks)
+    names = [f"{m}@{k}" for k in ks for m in ("recall", "hit")] + ["mrr"]
+    mean = {n: round(sum(s[n] for s in per_case.values()) / len(per_case), 3) if per_case else 0.0 for n in names}
+    return {"mean": mean, "cases": per_case}
+
+
+def candidate_pool(retrievers: Dict[str, Any], cases: List[Dict[str, Any]], depth: int,
+                   query_field: str) -> Dict[str, Any]:
+    """Per case id: its query and the union of every retriever's top `depth` documents."""
+    pool: Dict[str, Any] = {}
+    for case in cases:
+        query = case.get(query_field) or ""
+        found: Dict[str, Dict[str, Any]] = {}
+        for name, (retriever, use_category) in retrievers.items():
+            for h in retriever.search(query, depth, case.get("category") if use_category else None):
+                entry = found.setdefault(h.id, {"id": h.id, "category": h.metadata.get("category", ""),
+                                                "text": h.document[:500], "found_by": []})
+                entry["found_by"].append(name)
+        pool[case["id"]] = {"query": query, "category": case.get("category"), "candidates": list(found.values())}
+    return pool
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--cases", type=Path, default=CASES_FILE)
+    ap.add_argument("--qrels", type=Path, help="hand-labelled JSON {case id: [relevant document ids]}")
+    ap.add_argument("--signal-qrels", action="store_true",
+                    help="without --qrels: documents containing a case signal are relevant (lexical proxy, favours BM25)")
+    ap.add_argument("--write-pool", type=Path, help="write every configuration's candidates per case here, for labelling")
+    ap.add_argument("--k", type=int, nargs="+", default=[1, 3, 5, 10])
+    ap.add_argument("--query-field", default="title", choices=["title", "summary"],
+                    help="what the pipeline sends as the RAG query (title)")
+    ap.add_argument("--depth", type=int, help="candidates per retriever (default RAG_CANDIDATES)")
+    ap.add_argument("--dense-weight", type=float)
+    ap.add_argument("--sparse-weight", type=float)
+    ap.add_argument("--rrf-k", type=int)
+    ap.add_argument("--chroma-path", type=Path, help="collection to evaluate (default CHROMA_PATH)")
+    ap.add_argument("--mock", action="store_true", help="embed with a local mock gateway into a temp collection")
+    ap.add_argument("--json", type=Path, help="write the results here")
+    args = ap.parse_args()
+    if not (args.qrels or args.signal_qrels or args.write_pool):
+        ap.error("pass --qrels (label a --write-pool first), or --signal-qrels for the lexical proxy")
+
+    mock = None
+    workdir = tempfile.TemporaryDirectory(prefix="eval_retrieval_")
+    if args.mock:
+        port = _free_port()
+        mock = subprocess.Popen([sys.executable, "-m", "benchmarks.mock_azure", "--port", str(port),
+                                 "--latency-ms", "0", "--jitter-ms", "0"], cwd=ROOT)
+        _wait_http(f"http://127.0.0.1:{port}/mock/stats", mock)
+        os.environ["AZURE_OPENAI_ENDPOINT"] = f"http://127.0.0.1:{port}"
+        os.environ["EMBEDDING_CACHE_PATH"] = str(Path(workdir.name) / "embedding_cache.sqlite3")
+        os.environ["CHROMA_PATH"] = str(Path(workdir.name) / "chroma_db")   # never mix mock vectors into a real collection
+    if args.chroma_path:
+        os.environ["CHROMA_PATH"] = str(args.chroma_path)
+
+    # imported after the environment is set: rag_setup reads its endpoint and paths at import
+    from module_logs_generator.ai_engine import hybrid_retriever as hr
+    from module_logs_generator.ai_engine.rag_setup import _open_collection, ingest_knowledge_base
+
+    try:
+        collection = _open_collection()
+        if collection.count() == 0:
+            ingest_knowledge_base(collection)
+        with open(args.cases, "r", encoding="utf-8") as f:
+            cases = json.load(f)
+        fusion = {
+            "depth": args.depth if args.depth is not None else hr.CANDIDATE_DEPTH,
+            "dense_weight": args.dense_weight if args.dense_weight is not None else hr.DENSE_WEIGHT,
+            "sparse_weight": args.sparse_weight if args.sparse_weight is not None else hr.SPARSE_WEIGHT,
+            "rrf_k": args.rrf_k if args.rrf_k is not None else hr.RRF_K,
+        }
+        fusion["depth"] = max(fusion["depth"], max(args.k))
+        configs = [("dense", "dense", False), ("bm25", "bm25", False),
+                   ("hybrid", "hybrid", False), ("hybrid+category", "hybrid", True)]
+        retrievers = {name: (hr.HybridRetriever(collection, mode=mode, category_filter=use_category, **fusion),
+                             use_category) for name, mode, use_category in configs}
+        if args.write_pool:
+            pool = candidate_pool(retrievers, cases, fusion["depth"], args.query_field)
+            args.write_pool.write_text(json.dumps(pool, indent=2))
+            print(f"wrote {sum(len(p['candidates']) for p in pool.values())} candidates for {len(pool)} cases "
+                  f"to {args.write_pool}; list the relevant ids per case in a --qrels file")
+        if args.qrels:
+            with open(args.qrels, "r", encoding="utf-8") as f:
+                qrels = {cid: set(ids) for cid, ids in json.load(f).items()}
+            qrels_source = f"labelled ({args.qrels.name})"
+        elif args.signal_qrels:
+            data = collection.get(include=["documents"])
+            qrels = signal_qrels(cases, list(data["ids"]), list(data["documents"]))
+            qrels_source = "signals (lexical proxy: favours bm25 and hybrid, not evidence)"
+        else:
+            return
+        results: Dict[str, Any] = {"collection_size": collection.count(), "fusion": fusion, "qrels": qrels_source,
+                                   "relevant_per_case": {cid: len(ids) for cid, ids in qrels.items()},
+                                   "configs": {}}
+        for name, (retriever, use_category) in retrievers.items():
+            results["configs"][name] = evaluate(retriever, cases, qrels, args.k, args.query_field, use_category)
+    finally:
+        if mock is not None:
+            mock.terminate()
+            mock.wait()
+        workdir.cleanup()
+
+    metric_names = list(next(iter(results["configs"].values()))["mean"])
+    print(f"qrels: {results['qrels']}")
+    print(f"{'config':<16}" + "".join(f"{n:>11}" for n in metric_names))
+    for name, res in results["configs"].items():
+        print(f"{name:<16}" + "".join(f"{res['mean'][n]:>11.3f}" for n in metric_names))
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""
+Local stand-in for the Azure OpenAI gateway: chat/completions, responses and embeddings
+under /openai/deployments/{deployment}/..., with canned case / verdict / RAG JSON.
+
+    python -m benchmarks.mock_azure --port 9100 --latency-ms 300 --error-rate 0.01 --throttle-rate 0.05
+    AZURE_OPENAI_ENDPOINT=http://127.0.0.1:9100 uvicorn app:app
+
+Defaults for the flags come from MOCK_LATENCY_MS, MOCK_JITTER_MS, MOCK_ERROR_RATE,
+MOCK_THROTTLE_RATE, MOCK_RETRY_AFTER_MS, MOCK_EMBED_DIM and MOCK_SEED.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import struct
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from module_logs_generator.log_index import extract_tokens
+
+LATENCY_MS     = float(os.environ.get("MOCK_LATENCY_MS", "200"))   # mean added latency per call
+JITTER_MS      = float(os.environ.get("MOCK_JITTER_MS", "50"))     # +/- uniform jitter
+ERROR_RATE     = float(os.environ.get("MOCK_ERROR_RATE", "0"))     # share of calls answered 500
+THROTTLE_RATE  = float(os.environ.get("MOCK_THROTTLE_RATE", "0"))  # share of calls answered 429
+RETRY_AFTER_MS = int(os.environ.get("MOCK_RETRY_AFTER_MS", "200"))
+EMBED_DIM      = int(os.environ.get("MOCK_EMBED_DIM", "1536"))
+
+CASE_RE = re.compile(r"^[ \t]*test[ \t]*case[ \t#:.-]*(\d+)[:.\s-]*(.*)$", re.I | re.M)
+ISO_RE = re.compile(r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}Z")
+LOG_NAME_RE = re.compile(r"(?:LOG FILE: |===== )([\w.-]+\.log)")
+
+_rng = random.Random(int(os.environ.get("MOCK_SEED", "1")))
+_calls: Counter = Counter()
+
+app = FastAPI()
+
+
+def _category(text: str) -> str:
+    t = text.upper()
+    if re.search(r"REF-|EDI|COPARN|COARRI|CODECO|IFTMIN|IFTMCS|CORRELATION|HTTP", t):
+        return "EA"
+    if re.search(r"VESSEL|BERTH|IMO|\bMV\b", t):
+        return "VS"
+    return "CNTR"
+
+
+def canned_cases(text: str) -> Dict[str, Any]:
+    """One case per "Test Case N" heading in the text, signals = identifiers in its block."""
+    heads = list(CASE_RE.finditer(text))
+    cases = []
+    for i, m in enumerate(heads):
+        block = text[m.start():heads[i + 1].start() if i + 1 < len(heads) else len(text)]
+        signals = sorted(extract_tokens(block))
+        ts = ISO_RE.search(block)
+        cases.append({
+            "id": f"TC-{int(m.group(1)):02d}",
+            "title": " ".join(block.split()[:24]),
+            "summary": " ".join(block.split()[:40]),
+            "signals": signals,
+            "category": _category(block),
+            "timestamp": ts.group(0) if ts else None,
+            "rationale": f"How to resolve: {' '.join(block.split()[4:20])}",
+        })
+    return {"cases": cases}
+
+
+def canned_verdict(text: str) -> Dict[str, Any]:
+    files = sorted(set(LOG_NAME_RE.findall(text)))
+    matched = [{"file": f, "confidence": 0.8, "reasons": ["mock match"]} for f in files[:1]]
+    return {"refers_to_logs": bool(matched), "signals": sorted(extract_tokens(text))[:5], "matched_logs": matched}
+
+
+def canned_batch_verdicts(text: str) -> Dict[str, Any]:
+    n = len(set(re.findall(r"^\[(\d+)\]", text, re.M)))
+    verdict = canned_verdict(text)
+    return {"results": [{"i": i, **verdict} for i in range(n)]}
+
+
+def canned_categories(text: str) -> List[Dict[str, Any]]:
+    n = len(re.findall(r"^\d+\. ", text, re.M))
+    return [{"i": i, "categories": ["DATA_SYNC"]} for i in range(n)]
+
+
+def _answer(text: str) -> str:
+    """Pick the canned answer by the prompt the modules send."""
+    if "Extract each distinct test case" in text:
+        return json.dumps(canned_cases(text))
+    if "numbered INCIDENT REPORTS" in text:
+        return json.dumps(canned_batch_verdicts(text))
+    if "log correlation assistant" in text:
+        return json.dumps(canned_verdict(text))
+    if "Categorize each numbered incident" in text:
+        return json.dumps(canned_categories(text))
+    return "- Check the service logs for the correlation id\n- Re-send the message after fixing the segment"
+
+
+def _embedding(text: str) -> List[float]:
+    seed = hashlib.sha256(text.encode("utf-8")).digest()
+    raw = (seed * (EMBED_DIM * 4 // len(seed) + 1))[:EMBED_DIM * 4]
+    return [v / 2 ** 31 for v in struct.unpack(f"<{EMBED_DIM}i", raw)]
+
+
+def _usage(prompt: str, completion: str) -> Dict[str, int]:
+    p, c = len(prompt) // 4, len(completion) // 4
+    return {"prompt_tokens": p, "completion_tokens": c, "total_tokens": p + c}
+
+
+async def _delay_or_fail(kind: str):
+    _calls[kind] += 1
+    await asyncio.sleep(max(0.0, LATENCY_MS + _rng.uniform(-JITTER_MS, JITTER_MS)) / 1000)
+    roll = _rng.random()
+    if roll < THROTTLE_RATE:
+        _calls["429"] += 1
+        return JSONResponse({"error": {"code": "429", "message": "Rate limit is exceeded."}}, status_code=429,
+                            headers={"retry-after-ms": str(RETRY_AFTER_MS),
+                                     "Retry-After": str(max(1, RETRY_AFTER_MS // 1000))})
+    if roll < THROTTLE_RATE + ERROR_RATE:
+        _calls["500"] += 1
+        return JSONResponse({"error": {"code": "500", "message": "Internal server error"}}, status_code=500)
+    return None
+
+
+@app.post("/openai/deployments/{deployment}/chat/completions")
+async def chat_completions(deployment: str, request: Request):
+    failure = await _delay_or_fail("chat")
+    if failure is not None:
+        return failure
+    body = await request.json()
+    prompt = "\n".join(m.get("content") if isinstance(m.get("content"), str) else json.dumps(m.get("content"))
+                       for m in body.get("messages", []))
+    content = _answer(prompt)
+    return {"id": "mock", "object": "chat.completion", "model": deployment,
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": _usage(prompt, content)}
+
+
+@app.post("/openai/deployments/{deployment}/responses")
+async def responses(deployment: str, request: Request):
+    return await _responses(deployment, request)
+
+
+@app.post("/openai/responses")
+async def responses_v1(request: Request):
+    """The deployment-less route: the deployment comes in the body's "model"."""
+    return await _responses(None, request)
+
+
+async def _responses(deployment: Optional[str], request: Request):
+    failure = await _delay_or_fail("responses")
+    if failure is not None:
+        return failure
+    body = await request.json()
+    deployment = deployment or body.get("model", "")
+    parts = []
+    for item in body.get("input", []):
+        for c in item.get("content", []):
+            if c.get("type") == "input_text":
+                parts.append(c.get("text", ""))
+    prompt = "\n".join(parts)
+    content = _answer(prompt)
+    return {"id": "mock", "object": "response", "model": deployment, "output_text": content,
+            "usage": {"input_tokens": len(prompt) // 4, "output_tokens": len(content) // 4}}
+
+
+@app.post("/openai/deployments/{deployment}/embeddings")
+async def embeddings(deployment: str, request: Request):
+    failure = await _delay_or_fail("embeddings")
+    if failure is not None:
+        return failure
+    body = await request.json()
+    inputs = body.get("input", [])
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    return {"object": "list", "model": deployment,
+            "data": [{"object": "embedding", "index": i, "embedding": _embedding(str(t))} for i, t in enumerate(inputs)],
+            "usage": {"prompt_tokens": sum(len(str(t)) // 4 for t in inputs), "total_tokens": 0}}
+
+
+@app.get("/mock/stats")
+async def stats():
+    return dict(_calls)
+
+
+def main():
+    global LATENCY_MS, JITTER_MS, ERROR_RATE, THROTTLE_RATE, RETRY_AFTER_MS, EMBED_DIM
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=9100)
+    ap.add_argument("--latency-ms", type=float, default=LATENCY_MS)
+    ap.add_argument("--jitter-ms", type=float, default=JITTER_MS)
+    ap.add_argument("--error-rate", type=float, default=ERROR_RATE)
+    ap.add_argument("--throttle-rate", type=float, default=THROTTLE_RATE)
+    ap.add_argument("--retry-after-ms", type=int, default=RETRY_AFTER_MS)
+    ap.add_argument("--embed-dim", type=int, default=EMBED_DIM)
+    args = ap.parse_args()
+
+    LATENCY_MS, JITTER_MS = args.latency_ms, args.jitter_ms
+    ERROR_RATE, THROTTLE_RATE, RETRY_AFTER_MS = args.error_rate, args.throttle_rate, args.retry_after_ms
+    EMBED_DIM = args.embed_dim
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
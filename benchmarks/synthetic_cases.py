@@ -0,0 +1,119 @@
+import random
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from benchmarks.synthetic_logs import EDI_TYPES, VESSELS
+from module_logs_generator.log_index import extract_tokens
+
+# --------------------------------------------------------------------------------------
+# Synthetic support test cases ("Test Case N" blocks, as in module_logs_generator/Test
+# Cases.pdf) as text or as a plain, text-layer PDF, optionally naming identifiers that
+# really occur in a (synthetic) log directory so correlation has something to find.
+# --------------------------------------------------------------------------------------
+TEMPLATES: Dict[str, List[str]] = {
+    "CNTR": [
+        "Container {cntr} shows status DISCHARGED in the yard but the gate-in event is missing.",
+        "Duplicate snapshot for container {cntr} after load; operator sees two conflicting statuses.",
+    ],
+    "EA": [
+        "{edi} message {ref} failed with Segment missing; partner resent and it is stuck in ERROR.",
+        "API event for {ref} returned HTTP 400, correlation {corr} never reached the TOS.",
+    ],
+    "VS": [
+        "Vessel advice for {vessel} rejected: System Vessel Name has been used by other vessel advice.",
+        "Berth application for {vessel} (IMO {imo}) cannot be created; berthing window overlaps.",
+    ],
+}
+
+
+def _log_tokens(log_dir: Optional[Path], r: random.Random, max_bytes: int = 1 << 20) -> Dict[str, List[str]]:
+    """Identifiers found in the first `max_bytes` of each log, by kind."""
+    found: Dict[str, List[str]] = {"cntr": [], "ref": [], "corr": []}
+    if log_dir is None:
+        return found
+    for path in sorted(Path(log_dir).glob("*.log")):
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            text = f.read(max_bytes)
+        for tok in extract_tokens(text, kinds=("cntr_no", "message_ref", "corr_id")):
+            kind = "ref" if tok.startswith("REF-") else "cntr" if tok[:4].isalpha() and tok[4:].isdigit() else "corr"
+            found[kind].append(tok)
+    for values in found.values():
+        values.sort()
+        r.shuffle(values)
+    return found
+
+
+def generate_cases_text(n_cases: int, log_dir: Optional[Path] = None, seed: int = 11) -> str:
+    """`n_cases` "Test Case N" blocks, cycling CNTR / EA / VS scenarios."""
+    r = random.Random(seed)
+    tokens = _log_tokens(log_dir, r)
+    ts = datetime(2025, 10, 1, 8, 0, tzinfo=timezone.utc)
+    blocks: List[str] = []
+    for i in range(1, n_cases + 1):
+        category = ("CNTR", "EA", "VS")[i % 3]
+        edi = r.choice(EDI_TYPES)
+        values = {
+            "cntr": tokens["cntr"][i % len(tokens["cntr"])] if tokens["cntr"] else f"CMAU{r.randrange(10**7):07d}",
+            "ref": tokens["ref"][i % len(tokens["ref"])] if tokens["ref"] else f"REF-{edi[:3]}-{r.randrange(10**4):04d}",
+            "corr": tokens["corr"][i % len(tokens["corr"])].lower() if tokens["corr"] else f"{r.getrandbits(64):016x}",
+            "edi": edi,
+            "vessel": r.choice(VESSELS),
+            "imo": r.randrange(9000000, 9999999),
+        }
+        ts += timedelta(minutes=r.randrange(5, 240))
+        body = r.choice(TEMPLATES[category]).format(**values)
+        blocks.append(
+            f"Test Case {i}: {category} incident {i}\n"
+            f"Reported at {ts.strftime('%Y-%m-%dT%H:%M:%SZ')} by the duty officer.\n"
+            f"{body}\n"
+            f"Expected: the service processes the message and the status is consistent across systems.\n")
+    return "\n".join(blocks)
+
+
+def _pdf_escape(line: str) -> str:
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)").encode("latin-1", "replace").decode("latin-1")
+
+
+def write_text_pdf(path: Path, text: str, lines_per_page: int = 55, width: int = 95) -> Path:
+    """Minimal PDF with a real text layer (Helvetica 10pt), wrapped at `width` characters."""
+    lines: List[str] = []
+    for raw in text.splitlines():
+        while len(raw) > width:
+            cut = raw.rfind(" ", 0, width)
+            cut = cut if cut > 0 else width
+            lines.append(raw[:cut])
+            raw = raw[cut:].lstrip()
+        lines.append(raw)
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+
+    objects: List[bytes] = []
+    n_pages = len(pages)
+    # 1: catalog, 2: pages, 3: font, then (page, content) pairs
+    kids = " ".join(f"{4 + 2 * i} 0 R" for i in range(n_pages))
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {n_pages} >>".encode())
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    for i, page in enumerate(pages):
+        ops = ["BT", "/F1 10 Tf", "12 TL", "50 790 Td"] + [f"({_pdf_escape(ln)}) Tj T*" for ln in page] + ["ET"]
+        stream = "\n".join(ops).encode("latin-1")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>".encode())
+        objects.append(b"<< /Length " + str(len(stream)).encode() + b" >>\nstream\n" + stream + b"\nendstream")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for num, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{num} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{off:010d} 00000 n \n".encode() for off in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(bytes(out))
+    return path
+
+
+def generate_case_pdf(path: Path, n_cases: int, log_dir: Optional[Path] = None, seed: int = 11) -> Path:
+    return write_text_pdf(path, generate_cases_text(n_cases, log_dir, seed))
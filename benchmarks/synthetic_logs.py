@@ -0,0 +1,111 @@
+import random
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+# --------------------------------------------------------------------------------------
+# Synthetic service logs in the same "ISO-timestamp LEVEL component key=value" layout
+# as module_logs_generator/Application Logs, for benchmarks of any size.
+# --------------------------------------------------------------------------------------
+VESSELS = ["MV Lion City 07", "MV Lion City 08", "MV PACIFIC DAWN", "MV SILVER CURRENT", "MV KOTA RIA"]
+EDI_TYPES = ["COPARN", "COARRI", "CODECO", "IFTMIN", "IFTMCS"]
+
+
+def _cntr(r: random.Random) -> str:
+    return r.choice(["CMAU", "MSCU", "HLCU", "TEMU"]) + f"{r.randrange(10**7):07d}"
+
+
+def _corr(r: random.Random) -> str:
+    return f"{r.getrandbits(64):016x}"
+
+
+def _container_line(r: random.Random) -> str:
+    c = _cntr(r)
+    return r.choice([
+        f"INFO  container-repo FetchLatestSnapshot cntr_no={c}",
+        f"DEBUG sql SELECT * FROM container WHERE cntr_no=? ORDER BY created_at DESC LIMIT 1 params=[{c}]",
+        f"INFO  container-repo InsertSnapshot cntr_no={c} status={r.choice(['DISCHARGED', 'LOADED', 'GATE_IN'])}",
+        f"WARN  container-version DuplicateSnapshotAttempt cntr_no={c}",
+        f"INFO  http 200 GET /containers/{c} latency_ms={r.randrange(5, 300)}",
+        "DEBUG pool HikariPool-1 stats (total=10, active=2, idle=8, waiting=0)",
+    ])
+
+
+def _edi_line(r: random.Random) -> str:
+    corr, t = _corr(r), r.choice(EDI_TYPES)
+    ref = f"REF-{t[:3]}-{r.randrange(10**4):04d}"
+    return r.choice([
+        f'INFO  EDIController corrId={corr} httpMethod=POST path="/api/v1/edi-message" clientIp=10.10.1.{r.randrange(255)}',
+        f'INFO  EDIService    corrId={corr} action=processIncoming messageType="{t}"',
+        f"DEBUG EDIRepository corrId={corr} sql=\"INSERT INTO edi_message (...) VALUES (...)\" params=['{t}','IN','PARSED','{ref}']",
+        f'ERROR EDIService    corrId={corr} code=EDI_ERR_{r.randrange(1, 9)} msg="Segment missing" message_ref="{ref}"',
+        f"INFO  EDIController corrId={corr} httpStatus=200 durationMs={r.randrange(10, 90)}",
+    ])
+
+
+def _vessel_line(r: random.Random) -> str:
+    v, corr = r.choice(VESSELS), _corr(r)
+    return r.choice([
+        f'INFO  AdviceService    corrId={corr} action=prepareCreate vesselName="{v}" system_vessel_name="{v}"',
+        f'ERROR AdviceService    corrId={corr} code=VESSEL_ERR_4 msg="System Vessel Name has been used by other vessel advice" system_vessel_name="{v}"',
+        f"INFO  vessel-repo Lookup imo_no={r.randrange(9000000, 9999999)} result=FOUND vessel_id={r.randrange(100)}",
+        f'INFO  advice-repo FetchActive system_vessel_name="{v}" vessel_advice_no={r.randrange(10**10)}',
+        "INFO  cache Warmup vessels_cached=20 ms=42",
+    ])
+
+
+def _noise_line(r: random.Random) -> str:
+    # housekeeping lines that carry no identifiers or category keywords
+    return r.choice([
+        f"INFO  metrics heap_used_mb={r.randrange(200, 900)} gc_pause_ms={r.randrange(40)}",
+        f"DEBUG pool HikariPool-1 stats (total=10, active={r.randrange(10)}, idle={r.randrange(10)}, waiting=0)",
+        f"INFO  scheduler Tick job=cleanup next_run_ms={r.randrange(1000, 60000)}",
+        f"DEBUG auth TokenRefreshed subject=svc-{r.randrange(20)} ttl_s=3600",
+        f"INFO  health Liveness ok=true uptime_s={r.randrange(10**6)}",
+    ])
+
+
+LINE_MAKERS: Dict[str, Callable[[random.Random], str]] = {
+    "container_service.log": _container_line,
+    "edi_adivce_service.log": _edi_line,
+    "vessel_advice_service.log": _vessel_line,
+}
+
+
+def generate_service_log(
+    path: Path,
+    size_bytes: int,
+    kind: Optional[str] = None,
+    seed: int = 7,
+    start: Optional[datetime] = None,
+    noise_ratio: float = 0.8,
+) -> Path:
+    """
+    Write a log of roughly `size_bytes` with monotonically increasing timestamps.
+    `noise_ratio` of the lines are identifier-free housekeeping lines, as in real service logs.
+    """
+    r = random.Random(seed)
+    make = LINE_MAKERS.get(kind or path.name, _container_line)
+    ts = start or datetime(2025, 10, 1, tzinfo=timezone.utc)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    written = 0
+    with open(path, "w", encoding="utf-8", newline="\n") as f:
+        batch: List[str] = []
+        while written < size_bytes:
+            ts += timedelta(milliseconds=r.randrange(1, 50))
+            body = _noise_line(r) if r.random() < noise_ratio else make(r)
+            line = ts.strftime("%Y-%m-%dT%H:%M:%S.") + f"{ts.microsecond // 1000:03d}Z " + body + "\n"
+            batch.append(line)
+            written += len(line)
+            if len(batch) >= 10000:
+                f.write("".join(batch))
+                batch.clear()
+        f.write("".join(batch))
+    return path
+
+
+def generate_log_dir(base_dir: Path, size_bytes_per_log: int, seed: int = 7) -> Path:
+    """One synthetic log per known service kind under `base_dir`."""
+    for i, name in enumerate(LINE_MAKERS):
+        generate_service_log(base_dir / name, size_bytes_per_log, seed=seed + i)
+    return base_dir
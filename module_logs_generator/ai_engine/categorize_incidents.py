@@ -1,13 +1,26 @@
-import pandas as pd
+import argparse
+import hashlib
 import json
-import requests
+import os
 import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from module_logs_generator import http_client
+
+BASE_DIR = Path(__file__).resolve().parent
 
 # Azure OpenAI config
-endpoint = "https://psacodesprint2025.azure-api.net"  
-deployment_id = "gpt-4.1-mini"                  
-api_version = "2025-01-01-preview"                   
-api_key = "INSERT YOUR API KEY HERE"
+endpoint = os.environ.get("AZURE_OPENAI_ENDPOINT", "https://psacodesprint2025.azure-api.net")
+deployment_id = "gpt-4.1-mini"
+api_version = "2025-01-01-preview"
+api_key = os.environ.get("AZURE_OPENAI_API_KEY", "INSERT YOUR API KEY HERE")
 
 url = f"{endpoint}/openai/deployments/{deployment_id}/chat/completions?api-version={api_version}"
 
@@ -17,66 +30,333 @@ headers = {
     "api-key": api_key
 }
 
-# Load Excel
-df = pd.read_excel("Case Log.xlsx")
+INPUT_FILE  = BASE_DIR / "Case Log.xlsx"
+OUTPUT_FILE = BASE_DIR / "incident_case_log_categorized.xlsx"
+# Incremental mode: per-incident content hash + category, and the delta for the KB ingester
+STATE_PATH  = Path(os.environ.get("CATEGORIZE_STATE_PATH", str(BASE_DIR / "categorize_state.sqlite3")))
+DELTA_FILE  = BASE_DIR / "incident_case_log_delta.json"
+TEXT_COLUMNS = ["Alert / Email", "Problem Statements", "Solution"]
+
+# Rows the rules leave unknown go to the LLM in batches of AI_BATCH_ROWS, AI_CONCURRENCY at a time
+AI_BATCH_ROWS   = max(1, int(os.environ.get("CATEGORIZE_BATCH_ROWS", "20")))
+AI_CONCURRENCY  = max(1, int(os.environ.get("CATEGORIZE_CONCURRENCY", "4")))
+AI_TEXT_CHARS   = 2000   # incident text sent per row
+AI_TIMEOUT      = 60
+
+# Category -> pattern, matched against the lower-cased incident text (order = output order)
+CATEGORY_RULES: Dict[str, str] = {
+    "EDI_ERRORS":       r'\bedi|edifact|codeco|coarri|segment|ack\b',
+    "DATA_SYNC":        r'\bmismatch|duplicate|inconsistent|drift|desync|out-of-order\b',
+    "API_FAILURES":     r'\btimeout|4\d\d|5\d\d|api|endpoint|request failed|gateway\b',
+    "VESSEL_CONFLICTS": r'\bvessel|voyage|berth|eta|schedule|overlap\b',
+    "BUSINESS_LOGIC":   r'\bfree day|policy|rule|link missing|booking|business\b',
+}
+CATEGORIES = list(CATEGORY_RULES)
+UNKNOWN = "UNKNOWN"
+
+_COMPILED_RULES = {name: re.compile(pat) for name, pat in CATEGORY_RULES.items()}
+
 
-def categorize_incident(text):
+def categorize_incident(text) -> Optional[List[str]]:
+    """Rule categories of one incident text, or None if no rule matches (-> unknown)."""
     text = str(text).lower()
-    categories = []
+    categories = [name for name, rx in _COMPILED_RULES.items() if rx.search(text)]
+    return categories if categories else None
 
-    if re.search(r'\bedi|edifact|codeco|coarri|segment|ack\b', text):
-        categories.append("EDI_ERRORS")
-    if re.search(r'\bmismatch|duplicate|inconsistent|drift|desync|out-of-order\b', text):
-        categories.append("DATA_SYNC")
-    if re.search(r'\btimeout|4\d\d|5\d\d|api|endpoint|request failed|gateway\b', text):
-        categories.append("API_FAILURES")
-    if re.search(r'\bvessel|voyage|berth|eta|schedule|overlap\b', text):
-        categories.append("VESSEL_CONFLICTS")
-    if re.search(r'\bfree day|policy|rule|link missing|booking|business\b', text):
-        categories.append("BUSINESS_LOGIC")
 
-    return categories if categories else None  # If None -> unknown
+def apply_category_rules(texts: pd.Series) -> pd.Series:
+    """
+    Vectorized categorize_incident over a whole column: one str.contains per rule, the
+    matches joined as "A, B" in CATEGORY_RULES order; "" where no rule matches.
+    Repeated texts (alert templates) are matched once.
+    """
+    codes, uniques = pd.factorize(texts.fillna("").astype(str).str.lower())
+    lower = pd.Series(uniques, dtype=object)
+    joined = np.full(len(lower), "", dtype=object)
+    for name, pat in CATEGORY_RULES.items():
+        hit = lower.str.contains(pat, regex=True).to_numpy(dtype=bool)
+        joined[hit] = joined[hit] + (name + ", ")
+    return pd.Series(joined[codes], index=texts.index, dtype=object).str[:-2]
 
 
-# AI fallback for unknown
-def ask_ai(text):
+def incident_text(df: pd.DataFrame) -> pd.Series:
+    """Alert + problem statement + solution, as the rules and the LLM see them."""
+    return df[TEXT_COLUMNS[0]].fillna("") + " " + df[TEXT_COLUMNS[1]].fillna("") + " " + df[TEXT_COLUMNS[2]].fillna("")
+
+
+# --------------------------------------------------------------------------------------
+# LLM fallback: several incidents per request, answered as one JSON array
+# --------------------------------------------------------------------------------------
+BATCH_PROMPT = (
+    "Categorize each numbered incident into one or more of: " + ", ".join(CATEGORIES) + ".\n"
+    "Answer with a JSON array only, one element per incident, in the same order:\n"
+    '[{"i": 0, "categories": ["EDI_ERRORS"]}, ...]\n'
+    "Use only the listed category names."
+)
+
+# Changing the rules or the prompt invalidates every stored category
+RULES_VERSION = hashlib.sha1(json.dumps([CATEGORY_RULES, BATCH_PROMPT]).encode("utf-8")).hexdigest()[:12]
+
+
+def _parse_batch(content: str, n: int) -> List[Optional[List[str]]]:
+    """Per row: the valid categories, [UNKNOWN] if the model answered none, None if it skipped the row."""
+    m = re.search(r"\[[\s\S]*\]", content or "")
+    items = json.loads(m.group(0)) if m else []
+    out: List[Optional[List[str]]] = [None] * n
+    for pos, item in enumerate(items if isinstance(items, list) else []):
+        if isinstance(item, dict):
+            i, cats = item.get("i", pos), item.get("categories")
+        else:
+            i, cats = pos, item
+        if isinstance(cats, str):
+            cats = [c.strip() for c in cats.split(",")]
+        cats = [c for c in (cats or []) if c in CATEGORY_RULES]
+        if isinstance(i, int) and 0 <= i < n:
+            out[i] = cats or [UNKNOWN]
+    return out
+
+
+def ask_ai_batch(texts: List[str]) -> List[Optional[List[str]]]:
+    """
+    Categories for each text from one chat call. None marks a row without an answer (failed
+    request, unparsable reply, row skipped by the model), so callers can retry it later.
+    """
+    numbered = "\n".join(f"{i}. {str(t)[:AI_TEXT_CHARS]}" for i, t in enumerate(texts))
     data = {
         "messages": [
             {"role": "system", "content": "You are a helpful incident categorization assistant."},
-            {"role": "user", "content": f"Categorize this incident into one or more of: EDI_ERRORS, DATA_SYNC, API_FAILURES, VESSEL_CONFLICTS, BUSINESS_LOGIC. Incident text: {text}"}
+            {"role": "user", "content": f"{BATCH_PROMPT}\n\nIncidents:\n{numbered}"}
         ],
-        "max_tokens": 60
+        "temperature": 0.0,
+        "max_tokens": 40 * len(texts) + 20,
     }
-    response = requests.post(url, headers=headers, data=json.dumps(data))
+    try:
+        response = http_client.post(url, headers=headers, data=json.dumps(data), timeout=AI_TIMEOUT)
+    except Exception as e:
+        print(f"AI request failed: {e}")
+        return [None] * len(texts)
     if response.status_code == 200:
         try:
             choices = response.json().get("choices", [])
             if choices:
-                content = choices[0]["message"]["content"]
-                # Return a list of categories from AI (split by comma)
-                return [c.strip() for c in content.split(",")]
+                return _parse_batch(choices[0]["message"]["content"], len(texts))
         except Exception as e:
             print("AI response parsing error:", e)
     else:
         print(f"AI request error {response.status_code}: {response.text}")
-    return ["UNKNOWN"]
+    return [None] * len(texts)
 
 
-df["Incident_Text"] = (
-    df["Alert / Email"].fillna("") + " " +
-    df["Problem Statements"].fillna("") + " " +
-    df["Solution"].fillna("")
-)
+def ask_ai(text) -> List[str]:
+    return ask_ai_batch([text])[0] or [UNKNOWN]
+
+
+def ask_ai_many(texts: List[str], batch_rows: int = AI_BATCH_ROWS,
+                concurrency: int = AI_CONCURRENCY) -> List[Optional[List[str]]]:
+    """ask_ai_batch over `texts` in chunks of batch_rows, `concurrency` requests in flight."""
+    batches = [texts[i:i + batch_rows] for i in range(0, len(texts), batch_rows)]
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        answers = list(pool.map(ask_ai_batch, batches))
+    return [cats for batch in answers for cats in batch]
+
+
+def _label(texts: pd.Series, use_ai: bool, batch_rows: int, concurrency: int) -> Tuple[pd.Series, int, pd.Series]:
+    """
+    Categories for `texts` (rules, then the LLM for distinct unknown texts), how many the rules
+    left unknown, and a mask of the rows the LLM gave no answer for (labelled UNKNOWN here,
+    but not to be stored as final).
+    """
+    category = apply_category_rules(texts)
+    unknown = category == ""
+    n_unknown = int(unknown.sum())
+    failed = pd.Series(False, index=texts.index)
+    if n_unknown and use_ai:
+        pending = texts[unknown]
+        distinct = pending.unique().tolist()   # each distinct text is asked once
+        answers = dict(zip(distinct, (", ".join(c) if c else None for c in ask_ai_many(distinct, batch_rows, concurrency))))
+        labels = pending.map(answers)
+        failed[unknown] = labels.isna()
+        category[unknown] = labels.fillna(UNKNOWN)
+    else:
+        category[unknown] = UNKNOWN
+    return category, n_unknown, failed
 
-categories_list = []
-for text in df["Incident_Text"]:
-    categories = categorize_incident(text)
-    if not categories:  # If unknown call AI
-        categories = ask_ai(text)
-    categories_list.append(", ".join(categories))
 
-df["Category"] = categories_list
+def categorize_dataframe(
+    df: pd.DataFrame,
+    use_ai: bool = True,
+    batch_rows: int = AI_BATCH_ROWS,
+    concurrency: int = AI_CONCURRENCY,
+) -> Tuple[pd.DataFrame, Dict[str, float]]:
+    """Adds Incident_Text and Category columns; returns the frame and throughput stats."""
+    t0 = time.perf_counter()
+    df["Incident_Text"] = incident_text(df)
+    df["Category"], n_unknown, failed = _label(df["Incident_Text"], use_ai, batch_rows, concurrency)
+    elapsed = time.perf_counter() - t0
+    rows = len(df)
+    return df, {
+        "rows": rows,
+        "rule_rows": rows - n_unknown,
+        "llm_rows": n_unknown if use_ai else 0,
+        "llm_failed_rows": int(failed.sum()),
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(rows / elapsed, 1) if elapsed > 0 else float(rows),
+    }
+
+
+# --------------------------------------------------------------------------------------
+# Incremental mode: only new / changed incidents are labelled, and the knowledge base gets
+# a delta (upsert / metadata update / delete) instead of a full re-ingest
+# --------------------------------------------------------------------------------------
+def content_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def incident_doc_id(text: str) -> str:
+    """Knowledge-base document id of an incident (content-derived, shared with rag_setup)."""
+    return f"incident_{content_hash(text)[:16]}"
+
+
+def incident_metadata(incident_id: int, category: Any) -> Dict[str, Any]:
+    return {"source": "excel", "category": category if isinstance(category, str) else "", "incident_id": int(incident_id)}
+
+
+class CategoryState:
+    """content hash -> (category, row index, RULES_VERSION) of every incident seen, in SQLite."""
+
+    def __init__(self, path: Path = STATE_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS incidents ("
+                " content_hash TEXT PRIMARY KEY, category TEXT NOT NULL, incident_id INTEGER NOT NULL,"
+                " rules_version TEXT NOT NULL, updated_at REAL NOT NULL)")
+            self._db.commit()
+
+    def load(self) -> Dict[str, Tuple[str, int, str]]:
+        with self._lock:
+            rows = self._db.execute("SELECT content_hash, category, incident_id, rules_version FROM incidents").fetchall()
+        return {h: (c, i, v) for h, c, i, v in rows}
+
+    def save(self, rows: List[Tuple[str, str, int]], deleted: List[str]) -> None:
+        """Upsert (content_hash, category, incident_id) rows and drop `deleted` hashes in one transaction."""
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                "INSERT INTO incidents(content_hash, category, incident_id, rules_version, updated_at) VALUES (?,?,?,?,?)"
+                " ON CONFLICT(content_hash) DO UPDATE SET category=excluded.category,"
+                " incident_id=excluded.incident_id, rules_version=excluded.rules_version, updated_at=excluded.updated_at",
+                [(h, c, i, RULES_VERSION, now) for h, c, i in rows])
+            self._db.executemany("DELETE FROM incidents WHERE content_hash=?", [(h,) for h in deleted])
+            self._db.commit()
+
+
+def categorize_incremental(
+    df: pd.DataFrame,
+    state: CategoryState,
+    use_ai: bool = True,
+    batch_rows: int = AI_BATCH_ROWS,
+    concurrency: int = AI_CONCURRENCY,
+) -> Tuple[pd.DataFrame, Dict[str, Any], Dict[str, float]]:
+    """
+    Like categorize_dataframe, but incidents whose content hash is already in `state` (under
+    the current RULES_VERSION) keep their stored category. Returns the frame, the delta for
+    the knowledge base ({"upsert": [{id, text, metadata}], "update": [{id, metadata}],
+    "delete": [ids]}) and stats. The state is updated only after labelling succeeded, and
+    rows the LLM gave no answer for are not stored, so the next run asks again (an incident
+    seen before keeps its previous category meanwhile).
+    """
+    t0 = time.perf_counter()
+    df["Incident_Text"] = incident_text(df)
+    hashes = df["Incident_Text"].map(content_hash)
+    known = state.load()
+    first = ~hashes.duplicated()   # the KB keeps the first row of identical incidents
+    stale = hashes.map(lambda h: h not in known or known[h][2] != RULES_VERSION)
+    todo = first & stale
+
+    category = hashes.map(lambda h: known[h][0] if h in known else "")
+    n_unknown = 0
+    failed = pd.Series(False, index=df.index)
+    if todo.any():
+        labels, n_unknown, failed_todo = _label(df.loc[todo, "Incident_Text"], use_ai, batch_rows, concurrency)
+        failed[todo] = failed_todo
+        keep_old = failed & hashes.map(lambda h: h in known)
+        labels[keep_old[todo]] = category[todo & keep_old]
+        by_hash = dict(zip(hashes[todo], labels))
+        redo = stale & ~first   # duplicates of freshly labelled rows
+        category[todo] = labels
+        category[redo] = hashes[redo].map(by_hash)
+    df["Category"] = category
+
+    delta: Dict[str, Any] = {"rules_version": RULES_VERSION, "upsert": [], "update": [], "delete": []}
+    saved: List[Tuple[str, str, int]] = []
+    for idx, h, text, cat, new, no_answer in zip(df.index[first], hashes[first], df.loc[first, "Incident_Text"],
+                                                  category[first], todo[first], failed[first]):
+        old = known.get(h)
+        meta = incident_metadata(idx, cat)
+        if old is None:
+            delta["upsert"].append({"id": incident_doc_id(text), "text": text, "metadata": meta})
+        elif new and old[0] != cat or old[1] != idx:
+            delta["update"].append({"id": incident_doc_id(text), "metadata": meta})
+        if no_answer:
+            continue   # not stored: labelled again next run
+        if new or old[1] != idx:
+            saved.append((h, cat, int(idx)))
+    current = set(hashes[first])
+    deleted = [h for h in known if h not in current]
+    delta["delete"] = [f"incident_{h[:16]}" for h in deleted]
+    state.save(saved, deleted)
+
+    elapsed = time.perf_counter() - t0
+    rows = len(df)
+    return df, delta, {
+        "rows": rows,
+        "labelled_rows": int(todo.sum()),
+        "llm_rows": n_unknown if use_ai else 0,
+        "llm_failed_rows": int(failed.sum()),
+        "upserts": len(delta["upsert"]),
+        "updates": len(delta["update"]),
+        "deletes": len(delta["delete"]),
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(rows / elapsed, 1) if elapsed > 0 else float(rows),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Categorize the incident case log (rules first, LLM for the rest).")
+    ap.add_argument("--input", type=Path, default=INPUT_FILE)
+    ap.add_argument("--output", type=Path, default=OUTPUT_FILE)
+    ap.add_argument("--batch-rows", type=int, default=AI_BATCH_ROWS, help="incidents per LLM request")
+    ap.add_argument("--concurrency", type=int, default=AI_CONCURRENCY, help="LLM requests in flight")
+    ap.add_argument("--no-ai", action="store_true", help="leave rows no rule matches as UNKNOWN")
+    ap.add_argument("--incremental", action="store_true",
+                    help="only label new/changed incidents (state in --state) and write a KB delta to --delta")
+    ap.add_argument("--state", type=Path, default=STATE_PATH)
+    ap.add_argument("--delta", type=Path, default=DELTA_FILE)
+    args = ap.parse_args()
+
+    df = pd.read_excel(args.input)
+    if args.incremental:
+        df, delta, stats = categorize_incremental(df, CategoryState(args.state), use_ai=not args.no_ai,
+                                                  batch_rows=args.batch_rows, concurrency=args.concurrency)
+        with open(args.delta, "w", encoding="utf-8") as f:
+            json.dump(delta, f, ensure_ascii=False)
+        print(f"{stats['rows']} rows, {stats['labelled_rows']} new/changed ({stats['llm_rows']} by LLM, "
+              f"{stats['llm_failed_rows']} without an LLM answer, retried next run) "
+              f"in {stats['seconds']}s; delta: {stats['upserts']} upserts, {stats['updates']} updates, "
+              f"{stats['deletes']} deletes -> {args.delta.name}")
+    else:
+        df, stats = categorize_dataframe(df, use_ai=not args.no_ai, batch_rows=args.batch_rows,
+                                         concurrency=args.concurrency)
+        print(f"{stats['rows']} rows ({stats['rule_rows']} by rules, {stats['llm_rows']} by LLM, "
+              f"{stats['llm_failed_rows']} left UNKNOWN after LLM errors) "
+              f"in {stats['seconds']}s -> {stats['rows_per_second']} rows/s")
+    df.to_excel(args.output, index=False)
+    print(f"Results saved to {args.output.name}")
+
 
-# Save results
-df.to_excel("incident_case_log_categorized.xlsx", index=False)
-print("Results saved to incident_case_log_categorized.xlsx")
+if __name__ == "__main__":
+    main()
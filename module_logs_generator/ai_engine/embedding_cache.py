@@ -0,0 +1,137 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+from module_logs_generator import metrics
+
+BASE_DIR = Path(__file__).resolve().parent
+CACHE_PATH = Path(os.environ.get("EMBEDDING_CACHE_PATH", str(BASE_DIR / "embedding_cache.sqlite3")))
+
+MAX_MEMORY_ENTRIES = 4096      # hot vectors kept in-process (LRU)
+MAX_DISK_ENTRIES = 200_000     # rows kept in SQLite (least recently used evicted first)
+
+Vector = List[float]
+
+
+def _as_float32(v: Sequence[float]) -> Vector:
+    """The vector rounded to float32, as stored on disk, so misses and hits return identical values."""
+    return array("f", map(float, v)).tolist()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache: sha256(namespace + text) -> vector.
+    The namespace carries endpoint/deployment/model/api-version, so switching the
+    embedding model never serves stale vectors. Two tiers: an in-memory LRU in front
+    of a size-bounded SQLite table of float32 blobs. Safe to share between threads.
+    """
+
+    def __init__(self, namespace: str, path: Optional[Path] = CACHE_PATH,
+                 max_memory_entries: int = MAX_MEMORY_ENTRIES, max_disk_entries: int = MAX_DISK_ENTRIES):
+        self.namespace = namespace
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self._mem: "OrderedDict[str, Vector]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._db: Optional[sqlite3.Connection] = None
+        if path is not None:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(path), check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " key TEXT PRIMARY KEY, vec BLOB NOT NULL, last_used REAL NOT NULL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+            self._db.commit()
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.namespace}\0{text}".encode("utf-8")).hexdigest()
+
+    # ---------------- lookups ----------------
+    def get_many(self, texts: Sequence[str]) -> List[Optional[Vector]]:
+        keys = [self.key(t) for t in texts]
+        out: List[Optional[Vector]] = [None] * len(texts)
+        with self._lock:
+            disk_keys: Dict[str, List[int]] = {}
+            for i, k in enumerate(keys):
+                vec = self._mem.get(k)
+                if vec is not None:
+                    self._mem.move_to_end(k)
+                    out[i] = vec
+                else:
+                    disk_keys.setdefault(k, []).append(i)
+            if disk_keys and self._db is not None:
+                found = self._db_get(list(disk_keys))
+                for k, vec in found.items():
+                    self._remember(k, vec)
+                    for i in disk_keys[k]:
+                        out[i] = vec
+            n_hit = sum(v is not None for v in out)
+            self.hits += n_hit
+            self.misses += len(out) - n_hit
+        metrics.record_cache("embedding", n_hit, len(out) - n_hit)
+        return out
+
+    def put_many(self, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        now = time.time()
+        rows = []
+        with self._lock:
+            for t, v in zip(texts, vectors):
+                k, vec = self.key(t), _as_float32(v)
+                self._remember(k, vec)
+                rows.append((k, array("f", vec).tobytes(), now))
+            if self._db is not None and rows:
+                self._db.executemany("INSERT OR REPLACE INTO embeddings(key, vec, last_used) VALUES (?,?,?)", rows)
+                self._evict_disk()
+                self._db.commit()
+
+    def embed(self, texts: Sequence[str], embed_fn: Callable[[List[str]], Sequence[Sequence[float]]]) -> List[Vector]:
+        """Vectors for `texts`, calling `embed_fn` once with only the (de-duplicated) misses."""
+        texts = list(texts)
+        cached = self.get_many(texts)
+        missing = list(dict.fromkeys(t for t, v in zip(texts, cached) if v is None))
+        if missing:
+            fresh = {t: _as_float32(v) for t, v in zip(missing, embed_fn(missing))}
+            self.put_many(missing, [fresh[t] for t in missing])
+            cached = [v if v is not None else fresh[t] for t, v in zip(texts, cached)]
+        return cached  # type: ignore[return-value]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "memory_entries": len(self._mem)}
+
+    # ---------------- internals (lock held) ----------------
+    def _remember(self, k: str, vec: Vector) -> None:
+        self._mem[k] = vec
+        self._mem.move_to_end(k)
+        while len(self._mem) > self.max_memory_entries:
+            self._mem.popitem(last=False)
+
+    def _db_get(self, keys: List[str]) -> Dict[str, Vector]:
+        found: Dict[str, Vector] = {}
+        for i in range(0, len(keys), 500):
+            part = keys[i:i + 500]
+            marks = ",".join("?" * len(part))
+            for k, blob in self._db.execute(f"SELECT key, vec FROM embeddings WHERE key IN ({marks})", part):
+                found[k] = array("f", blob).tolist()
+        if found:
+            now = time.time()
+            self._db.executemany("UPDATE embeddings SET last_used=? WHERE key=?", [(now, k) for k in found])
+            self._db.commit()
+        return found
+
+    def _evict_disk(self) -> None:
+        (count,) = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        excess = count - self.max_disk_entries
+        if excess > 0:
+            self._db.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)", (excess,))
@@ -0,0 +1,198 @@
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+# --------------------------------------------------------------------------------------
+# Hybrid retrieval for RAG: an in-memory BM25 index over the Chroma collection's documents
+# next to the dense query, fused with weighted reciprocal rank fusion. Exact identifiers
+# (IMO numbers, COPARN / CODECO, error codes) that embeddings match poorly are found by
+# the lexical side. Optionally restricted to documents whose category labels fit the case.
+# --------------------------------------------------------------------------------------
+RETRIEVAL_MODE   = os.environ.get("RAG_RETRIEVAL", "hybrid")            # hybrid | dense | bm25
+CANDIDATE_DEPTH  = int(os.environ.get("RAG_CANDIDATES", "20"))          # hits taken from each retriever
+DENSE_WEIGHT     = float(os.environ.get("RAG_DENSE_WEIGHT", "1.0"))
+SPARSE_WEIGHT    = float(os.environ.get("RAG_SPARSE_WEIGHT", "1.0"))
+RRF_K            = int(os.environ.get("RAG_RRF_K", "60"))
+CATEGORY_FILTER  = os.environ.get("RAG_CATEGORY_FILTER", "0") == "1"   # only KB docs that fit the case category
+# With the filter on, fewer fitting documents than this (or than k) means the labels are too thin
+# for the case: the unfiltered ranking is returned instead of a short or empty one.
+CATEGORY_MIN_HITS = int(os.environ.get("RAG_CATEGORY_MIN_HITS", "3"))
+CATEGORY_OVERFETCH = 4   # dense hits fetched per candidate when filtering (Chroma cannot match one label of "A, B")
+REFRESH_SECONDS  = 300   # rebuild the BM25 index at least this often (catches in-place updates from other processes)
+BM25_K1, BM25_B  = 1.5, 0.75
+
+# The two sides use different taxonomies. A case's category is the log module it was extracted
+# for (logs.CATEGORY_TO_LOGS: CNTR container service, VS vessel registry / advice / berth
+# application, EA API event and EDI advice services). KB documents are labelled at ingest with
+# the incident categories of categorize_incidents.CATEGORY_RULES (keyword rules over the text).
+# Each case category maps to the incident categories its module's problems show up as:
+CASE_TO_KB_CATEGORIES: Dict[str, Set[str]] = {
+    # status drift / duplicates, free-day and booking rules, and CODECO / COARRI messages
+    "CNTR": {"DATA_SYNC", "BUSINESS_LOGIC", "EDI_ERRORS"},
+    # vessel, voyage, berth and ETA conflicts
+    "VS":   {"VESSEL_CONFLICTS"},
+    # failed API calls and EDI messages / acks
+    "EA":   {"EDI_ERRORS", "API_FAILURES"},
+}
+ALWAYS_ALLOWED = {"GENERAL_GUIDELINES"}   # the Word KB chunks apply to every case
+
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased terms; compound identifiers (REF-IFT-0007) are kept whole and also split into parts."""
+    out: List[str] = []
+    for tok in TOKEN_RE.findall((text or "").lower()):
+        out.append(tok)
+        parts = re.split(r"[-_./]", tok)
+        if len(parts) > 1:
+            out.extend(p for p in parts if p)
+    return out
+
+
+def labels(metadata: Optional[Dict[str, Any]]) -> Set[str]:
+    """The category labels of a stored document ("EDI_ERRORS, DATA_SYNC" -> two labels)."""
+    raw = (metadata or {}).get("category") or ""
+    return {c.strip() for c in str(raw).split(",") if c.strip()}
+
+
+def allowed_categories(case_category: Optional[str]) -> Optional[Set[str]]:
+    """KB labels that fit a case category, or None (no filtering) for an unknown one."""
+    cats = CASE_TO_KB_CATEGORIES.get((case_category or "").strip().upper())
+    return None if cats is None else cats | ALWAYS_ALLOWED
+
+
+class BM25Index:
+    def __init__(self, ids: List[str], documents: List[str], metadatas: List[Dict[str, Any]],
+                 k1: float = BM25_K1, b: float = BM25_B):
+        self.ids = ids
+        self.documents = documents
+        self.metadatas = metadatas
+        self.k1, self.b = k1, b
+        self._postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self._lengths: List[int] = []
+        for i, doc in enumerate(documents):
+            terms = tokenize(doc)
+            self._lengths.append(len(terms))
+            for term, tf in Counter(terms).items():
+                self._postings[term].append((i, tf))
+        self._avg_len = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def search(self, query: str, n: int, keep: Optional[Callable[[int], bool]] = None) -> List[Tuple[int, float]]:
+        """Top `n` (document position, score) for the query terms, among the positions `keep` accepts."""
+        n_docs = len(self.ids)
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for i, tf in postings:
+                if keep is not None and not keep(i):
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[i] / (self._avg_len or 1.0))
+                scores[i] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda kv: (-kv[1], kv[0]))[:n]
+
+
+@dataclass
+class Hit:
+    id: str
+    document: str
+    metadata: Dict[str, Any]
+    score: float                         # fused RRF score
+    distance: Optional[float] = None     # dense distance, when the dense side returned it
+    dense_rank: Optional[int] = None     # 1-based
+    sparse_rank: Optional[int] = None
+
+
+class HybridRetriever:
+    """
+    Owned by the RagService next to its collection. The BM25 side is rebuilt from the
+    collection when its count changes, after invalidate() (ingestion), or every REFRESH_SECONDS.
+    """
+
+    def __init__(self, collection, mode: str = RETRIEVAL_MODE, depth: int = CANDIDATE_DEPTH,
+                 dense_weight: float = DENSE_WEIGHT, sparse_weight: float = SPARSE_WEIGHT,
+                 rrf_k: int = RRF_K, category_filter: bool = CATEGORY_FILTER):
+        if mode not in ("hybrid", "dense", "bm25"):
+            raise ValueError(f"unknown retrieval mode {mode!r}")
+        self.collection = collection
+        self.mode = mode
+        self.depth = depth
+        self.dense_weight = dense_weight
+        self.sparse_weight = sparse_weight
+        self.rrf_k = rrf_k
+        self.category_filter = category_filter
+        self._index: Optional[BM25Index] = None
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._index = None
+
+    def index(self) -> BM25Index:
+        count = self.collection.count()
+        index = self._index
+        if index is not None and len(index) == count and time.time() - self._built_at < REFRESH_SECONDS:
+            return index
+        with self._lock:
+            if self._index is index:     # not rebuilt by another thread meanwhile
+                data = self.collection.get(include=["documents", "metadatas"])
+                self._index = BM25Index(list(data["ids"]), list(data["documents"] or []),
+                                        [m or {} for m in (data["metadatas"] or [])])
+                self._built_at = time.time()
+            return self._index
+
+    def _dense(self, query: str, n: int) -> List[Tuple[str, str, Dict[str, Any], Optional[float]]]:
+        res = self.collection.query(query_texts=[query], n_results=n, include=["documents", "metadatas", "distances"])
+        distances = (res.get("distances") or [[]])[0] or [None] * len(res["ids"][0])
+        return list(zip(res["ids"][0], res["documents"][0], res["metadatas"][0], distances))
+
+    def search(self, query: str, k: int, category: Optional[str] = None) -> List[Hit]:
+        """
+        Top `k` documents by weighted RRF: sum over retrievers of weight / (rrf_k + rank).
+        With the category filter on and a known case `category`, both retrievers only rank
+        documents whose labels fit it (see CASE_TO_KB_CATEGORIES); when fewer than
+        min(k, CATEGORY_MIN_HITS) fit, the unfiltered ranking is returned.
+        """
+        count = self.collection.count()
+        n = min(self.depth, count)
+        if n <= 0:
+            return []
+        allowed = allowed_categories(category) if self.category_filter else None
+        fits = None if allowed is None else (lambda meta: bool(labels(meta) & allowed))
+        use_dense = self.mode in ("hybrid", "dense") and self.dense_weight > 0
+        use_sparse = self.mode in ("hybrid", "bm25") and self.sparse_weight > 0
+        dense = self._dense(query, min(count, n * CATEGORY_OVERFETCH) if fits else n) if use_dense else []
+        index = self.index() if use_sparse else None
+        if fits is not None:
+            ranked = self._fuse(query, n, [d for d in dense if fits(d[2])], index,
+                                lambda i: fits(index.metadatas[i]))
+            if len(ranked) >= min(k, CATEGORY_MIN_HITS):
+                return ranked[:k]
+        return self._fuse(query, n, dense[:n], index)[:k]
+
+    def _fuse(self, query: str, n: int, dense: List[Tuple[str, str, Dict[str, Any], Optional[float]]],
+              index: Optional[BM25Index], keep: Optional[Callable[[int], bool]] = None) -> List[Hit]:
+        hits: Dict[str, Hit] = {}
+        for rank, (doc_id, doc, meta, dist) in enumerate(dense[:n], 1):
+            hit = hits.setdefault(doc_id, Hit(doc_id, doc, meta or {}, 0.0))
+            hit.distance, hit.dense_rank = dist, rank
+            hit.score += self.dense_weight / (self.rrf_k + rank)
+        if index is not None:
+            for rank, (i, _) in enumerate(index.search(query, n, keep), 1):
+                doc_id = index.ids[i]
+                hit = hits.setdefault(doc_id, Hit(doc_id, index.documents[i], index.metadatas[i], 0.0))
+                hit.sparse_rank = rank
+                hit.score += self.sparse_weight / (self.rrf_k + rank)
+        return sorted(hits.values(), key=lambda h: (-h.score, h.id))
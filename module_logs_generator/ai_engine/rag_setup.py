@@ -1,108 +1,423 @@
+import hashlib
+import math
+import os
+import threading
+import time
+from collections import deque
 from pathlib import Path
-import pandas as pd
-from docx import Document
-import requests
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
 import json
-import chromadb
-from chromadb.utils import embedding_functions
+from module_logs_generator.ai_engine.embedding_cache import EmbeddingCache
+from module_logs_generator.completion_cache import get_completion_cache, make_key
+from module_logs_generator import http_client, metrics
+from module_logs_generator.singleflight import get_singleflight, normalize_text
+from module_logs_generator.context_packer import Candidate, pack, token_budget
+from module_logs_generator.ai_engine.hybrid_retriever import HybridRetriever
 
 # config
-ENDPOINT = "https://psacodesprint2025.azure-api.net"
+ENDPOINT = os.environ.get("AZURE_OPENAI_ENDPOINT", "https://psacodesprint2025.azure-api.net")
 DEPLOYMENT_ID = "text-embedding-3-small"
 API_VERSION = "2023-05-15"
-API_KEY = "ae8ca593ce0e4bf983cd8730fbc15df4"
+API_KEY = os.environ.get("AZURE_OPENAI_API_KEY", "ae8ca593ce0e4bf983cd8730fbc15df4")
+EMBEDDING_MODEL = "text-embedding-3-small"
+RAG_DEPLOYMENT_ID = "gpt-4.1-mini"
+RAG_PROMPT_TEMPLATE_ID = "rag-suggestions-v1"  # bump when the prompt below changes
 
 BASE_DIR = Path(__file__).resolve().parent
 
-CHROMA_PATH = BASE_DIR / "chroma_db"
+CHROMA_PATH = Path(os.environ.get("CHROMA_PATH", str(BASE_DIR / "chroma_db")))
 COLLECTION_NAME = "incident_kb"
 
 EXCEL_FILE = BASE_DIR / "incident_case_log_categorized.xlsx"
 WORD_FILE = BASE_DIR / "Knowledge Base.docx"
 
+N_RESULTS = 5
+# Prompt tokens for the retrieved chunks (0: a quarter of the RAG deployment's budget, see context_packer)
+RAG_CONTEXT_TOKENS = int(os.environ.get("RAG_CONTEXT_TOKENS", "0")) or token_budget(RAG_DEPLOYMENT_ID) // 4
+LATENCY_WINDOW = 1000  # most recent RAG calls kept for the p50/p99 figures
 
-def get_embedding(text):
+# Ingestion: documents per upsert call (one embedding request each) and KB doc chunking
+INGEST_BATCH_SIZE = 64
+KB_CHUNK_SIZE = 500     # soft cap on characters per KB chunk
+KB_CHUNK_BOUNDARY = 8   # also end a chunk after ~1 in 8 paragraphs (chosen by content hash)
+
+# Background ingestion retries (ingestion is idempotent, so a retry redoes only what is missing)
+INGEST_ATTEMPTS = int(os.environ.get("KB_INGEST_ATTEMPTS", "5"))
+INGEST_RETRY_SECONDS = 10.0        # delay before the first retry, doubled per attempt
+INGEST_RETRY_MAX_SECONDS = 300.0
+
+
+_embedding_cache: Optional[EmbeddingCache] = None
+_embedding_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Process-wide embedding cache, versioned by endpoint/deployment/model/api-version."""
+    global _embedding_cache
+    if _embedding_cache is None:
+        with _embedding_cache_lock:
+            if _embedding_cache is None:
+                namespace = f"{ENDPOINT}|{DEPLOYMENT_ID}|{EMBEDDING_MODEL}|{API_VERSION}"
+                _embedding_cache = EmbeddingCache(namespace)
+    return _embedding_cache
+
+
+def _embed_uncached(texts: List[str]) -> List[List[float]]:
     url = f"{ENDPOINT}/openai/deployments/{DEPLOYMENT_ID}/embeddings?api-version={API_VERSION}"
     headers = {
         "Content-Type": "application/json",
         "api-key": API_KEY
     }
-    data = {"input": text, "user": "psa-hackathon"}
-    response = requests.post(url, headers=headers, data=json.dumps(data))
+    data = {"input": texts, "user": "psa-hackathon"}
+    with metrics.span("embed.llm"):
+        response = http_client.post(url, headers=headers, data=json.dumps(data), timeout=60, idempotent=True)
     response.raise_for_status()
-    return response.json()["data"][0]["embedding"]
-
-# wrap to chroma embedding
-azure_ef = embedding_functions.OpenAIEmbeddingFunction(
-    api_key=API_KEY,
-    api_base=ENDPOINT,
-    api_type="azure",
-    api_version=API_VERSION,
-    deployment_id=DEPLOYMENT_ID,
-    model_name="text-embedding-3-small",  
-)
-
-def ingest_knowledge_base():
-    # initialise chroma
-    client = chromadb.PersistentClient(path=CHROMA_PATH)
-    collection = client.get_or_create_collection(COLLECTION_NAME, embedding_function=azure_ef)
-    print("Collection ready:", collection.name)
+    body = response.json()
+    metrics.record_usage("embed", body)
+    items = sorted(body["data"], key=lambda d: d["index"])
+    return [d["embedding"] for d in items]
+
+
+def get_embeddings(texts: List[str]) -> List[List[float]]:
+    """Batch embeddings; only texts missing from the cache are sent to Azure (in one request)."""
+    return get_embedding_cache().embed(texts, _embed_uncached)
+
+
+def get_embedding(text):
+    return get_embeddings([text])[0]
+
+
+# chromadb, pandas and python-docx are imported on first use, not when the app imports this module
+_azure_ef = None
+_azure_ef_lock = threading.Lock()
+
+
+def get_embedding_function():
+    """
+    Chroma embedding function for ingestion and queries: get_embeddings(), i.e. the embedding
+    cache in front of the shared HTTP client. It subclasses Chroma's OpenAIEmbeddingFunction
+    only so the collection's persisted embedding-function config stays the same; the SDK
+    client that class builds is never called.
+    """
+    global _azure_ef
+    if _azure_ef is None:
+        with _azure_ef_lock:
+            if _azure_ef is None:
+                from chromadb.utils import embedding_functions
+
+                class CachedOpenAIEmbeddingFunction(embedding_functions.OpenAIEmbeddingFunction):
+                    def __call__(self, input):
+                        return get_embeddings(list(input))
+
+                _azure_ef = CachedOpenAIEmbeddingFunction(
+                    api_key=API_KEY,
+                    api_base=ENDPOINT,
+                    api_type="azure",
+                    api_version=API_VERSION,
+                    deployment_id=DEPLOYMENT_ID,
+                    model_name=EMBEDDING_MODEL,
+                )
+    return _azure_ef
+
+
+def _open_collection(chroma_path: Path = CHROMA_PATH, collection_name: str = COLLECTION_NAME):
+    import chromadb
+    client = chromadb.PersistentClient(path=str(chroma_path))
+    return client.get_or_create_collection(collection_name, embedding_function=get_embedding_function())
+
+def _sha1(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _chunk_paragraphs(paragraphs: List[str], chunk_size: int = KB_CHUNK_SIZE) -> List[str]:
+    """
+    Pack paragraphs into ~chunk_size chunks, repeating the last paragraph of a chunk at the
+    start of the next (overlap). Besides the size cap, a chunk also ends after any paragraph
+    whose hash picks it as a boundary, so an edit only re-chunks text up to the next such
+    boundary instead of shifting every chunk after it.
+    """
+    chunks: List[str] = []
+    current: List[str] = []
+    size = 0
+    for para in paragraphs:
+        if current and size + len(para) > chunk_size:
+            chunks.append("\n".join(current))
+            current, size = current[-1:], len(current[-1])
+        current.append(para)
+        size += len(para) + 1
+        if int(_sha1(para)[:8], 16) % KB_CHUNK_BOUNDARY == 0:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def _knowledge_base_documents() -> Dict[str, Tuple[str, Dict[str, Any]]]:
+    """All KB documents keyed by a content-derived id: id -> (text, metadata)."""
+    import pandas as pd
+    from docx import Document
+    from module_logs_generator.ai_engine.categorize_incidents import incident_doc_id, incident_metadata, incident_text
+
+    docs: Dict[str, Tuple[str, Dict[str, Any]]] = {}
 
     # process excel file
     df = pd.read_excel(EXCEL_FILE)
-    df["Incident_Text"] = (
-        df["Alert / Email"].fillna("") + " " +
-        df["Problem Statements"].fillna("") + " " +
-        df["Solution"].fillna("")
-    )
-
+    df["Incident_Text"] = incident_text(df)
     for idx, row in df.iterrows():
-        collection.add(
-            documents=[row["Incident_Text"]],
-            metadatas=[{
-                "source": "excel",
-                "category": row.get("Category"),
-                "incident_id": idx
-            }],
-            ids=[f"incident_{idx}"]
-        )
+        text = row["Incident_Text"]
+        docs.setdefault(incident_doc_id(text), (text, incident_metadata(idx, row.get("Category"))))
 
-    # process doc file 
+    # process doc file
     doc = Document(WORD_FILE)
-    kb_text = "\n".join([p.text for p in doc.paragraphs if p.text.strip()])
-
-    chunk_size = 500
-    chunk_overlap = 50
-    start = 0
-    i = 0
-    while start < len(kb_text):
-        end = min(start + chunk_size, len(kb_text))
-        chunk = kb_text[start:end]
-        collection.add(
-            documents=[chunk],
-            metadatas=[{"source": "kb_doc","category": "GENERAL_GUIDELINES"}],
-            ids=[f"kb_{i}"]
+    paragraphs = [p.text for p in doc.paragraphs if p.text.strip()]
+    for chunk in _chunk_paragraphs(paragraphs):
+        docs.setdefault(f"kb_{_sha1(chunk)[:16]}", (chunk, {"source": "kb_doc", "category": "GENERAL_GUIDELINES"}))
+    return docs
+
+
+def _batches(items: List[Any], size: int) -> Iterator[List[Any]]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def ingest_knowledge_base(collection=None, batch_size: int = INGEST_BATCH_SIZE) -> Dict[str, int]:
+    """
+    Idempotent, batched sync of the Excel case log + Word KB into the collection.
+    Ids are derived from content and each record keeps a content_hash, so re-running only
+    embeds new/changed documents, updates metadata-only changes without re-embedding, and
+    deletes ids that no longer exist in the sources.
+    """
+    # initialise chroma (or reuse the caller's collection handle)
+    if collection is None:
+        collection = _open_collection()
+    print("Collection ready:", collection.name)
+
+    docs = _knowledge_base_documents()
+    existing = collection.get(include=["metadatas"])
+    existing_meta = dict(zip(existing["ids"], existing["metadatas"] or []))
+
+    to_embed: List[str] = []
+    to_update: List[str] = []
+    for doc_id, (text, meta) in docs.items():
+        meta["content_hash"] = _sha1(text)
+        old = existing_meta.get(doc_id)
+        if old is None or old.get("content_hash") != meta["content_hash"]:
+            to_embed.append(doc_id)
+        elif any(old.get(k) != v for k, v in meta.items()):
+            to_update.append(doc_id)
+    stale = [doc_id for doc_id in existing_meta if doc_id not in docs]
+
+    # one embedding request per upsert batch
+    for batch in _batches(to_embed, batch_size):
+        collection.upsert(
+            ids=batch,
+            documents=[docs[i][0] for i in batch],
+            metadatas=[docs[i][1] for i in batch],
         )
-        start += chunk_size - chunk_overlap
-        i += 1
+    # metadata-only changes: no embedding call
+    for batch in _batches(to_update, batch_size):
+        collection.update(ids=batch, metadatas=[docs[i][1] for i in batch])
+    for batch in _batches(stale, batch_size):
+        collection.delete(ids=batch)
 
+    stats = {
+        "embedded": len(to_embed),
+        "metadata_updated": len(to_update),
+        "deleted": len(stale),
+        "unchanged": len(docs) - len(to_embed) - len(to_update),
+    }
+    print("Ingestion done:", stats)
+    return stats
 
-def RAG_chunk_data_producer(query:str):
-    client = chromadb.PersistentClient(path=CHROMA_PATH)
 
-    collections = [c.name for c in client.list_collections()]
-    if COLLECTION_NAME not in collections:
-        print(f"Collection '{COLLECTION_NAME}' not found. Running ingest_knowledge_base()...")
-        ingest_knowledge_base()
+def apply_incident_delta(delta: Dict[str, Any], collection=None, batch_size: int = INGEST_BATCH_SIZE) -> Dict[str, int]:
+    """
+    Apply the delta written by `categorize_incidents --incremental`: embed only the new
+    incidents, update the metadata of recategorised / moved ones, delete removed ones.
+    Records get the same ids and content_hash as ingest_knowledge_base, so both can be mixed.
+    """
+    if collection is None:
+        collection = _open_collection()
+
+    upserts = delta.get("upsert", [])
+    for batch in _batches(upserts, batch_size):
+        collection.upsert(
+            ids=[d["id"] for d in batch],
+            documents=[d["text"] for d in batch],
+            metadatas=[{**d["metadata"], "content_hash": _sha1(d["text"])} for d in batch],
+        )
+    updates = delta.get("update", [])
+    if updates:
+        # keep the stored content_hash (and any other keys) next to the new metadata
+        present = collection.get(ids=[d["id"] for d in updates], include=["metadatas"])
+        old_meta = dict(zip(present["ids"], present["metadatas"] or []))
+        updates = [d for d in updates if d["id"] in old_meta]
+        for batch in _batches(updates, batch_size):
+            collection.update(ids=[d["id"] for d in batch],
+                              metadatas=[{**old_meta[d["id"]], **d["metadata"]} for d in batch])
+    for batch in _batches(delta.get("delete", []), batch_size):
+        collection.delete(ids=batch)
+
+    stats = {"embedded": len(upserts), "metadata_updated": len(updates), "deleted": len(delta.get("delete", []))}
+    print("Delta applied:", stats)
+    return stats
+
+
+class KnowledgeBaseNotReady(RuntimeError):
+    """The collection is empty: ingestion is still running in the background, or it failed."""
+
+
+def _percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    # nearest-rank percentile
+    k = max(0, math.ceil(pct / 100.0 * len(ordered)) - 1)
+    return ordered[min(k, len(ordered) - 1)]
+
+
+class RagService:
+    """
+    Long-lived owner of the Chroma client and collection, created once (at app startup)
+    and shared by every request. Queries only read the collection, so concurrent use is
+    safe; setup and ingestion are serialised behind a lock and never run inside a query.
+    """
+
+    def __init__(self, chroma_path: Path = CHROMA_PATH, collection_name: str = COLLECTION_NAME,
+                 n_results: int = N_RESULTS):
+        self.chroma_path = chroma_path
+        self.collection_name = collection_name
+        self.n_results = n_results
+        self._collection = None
+        self._retriever: Optional[HybridRetriever] = None
+        self._lock = threading.Lock()
+        self._ingest_thread: Optional[threading.Thread] = None
+        self._ingest_status: Dict[str, Any] = {"state": "idle", "attempts": 0, "error": None,
+                                               "started_at": None, "finished_at": None, "next_retry_at": None}
+        self._latencies: Dict[str, Deque[float]] = {
+            "rag": deque(maxlen=LATENCY_WINDOW),
+            "retrieval": deque(maxlen=LATENCY_WINDOW),
+        }
+
+    def start(self, ingest_if_empty: bool = True) -> "RagService":
+        """Open the client/collection, warm the HNSW index, and kick off ingestion in the background if needed."""
+        with self._lock:
+            if self._collection is None:
+                self._collection = _open_collection(self.chroma_path, self.collection_name)
+                self._retriever = HybridRetriever(self._collection)
+            collection = self._collection
+        if collection.count() == 0:
+            if ingest_if_empty:
+                self.ingest_in_background()
+            return self
+        # Load the on-disk index with a stored vector, so the first user query pays no warm-up
+        peek = collection.peek(1)
+        embeddings = peek.get("embeddings")
+        if embeddings is not None and len(embeddings):
+            collection.query(query_embeddings=[list(embeddings[0])], n_results=1)
+        if self._retriever.mode != "dense":
+            self._retriever.index()   # build the BM25 side now as well
+        return self
+
+    def ingest_in_background(self) -> threading.Thread:
+        with self._lock:
+            if self._ingest_thread is None or not self._ingest_thread.is_alive():
+                print(f"Collection '{self.collection_name}' is empty. Ingesting knowledge base in the background...")
+                self._ingest_thread = threading.Thread(target=self._ingest, name="kb-ingest", daemon=True)
+                self._ingest_thread.start()
+            return self._ingest_thread
 
-    collection = client.get_collection(COLLECTION_NAME, embedding_function=azure_ef)
-    results = collection.query(query_texts=[query], n_results=5)
+    def _ingest(self) -> None:
+        """Ingest with retries and exponential backoff; the outcome is kept for ingest_status()."""
+        delay = INGEST_RETRY_SECONDS
+        self._set_ingest_status(state="running", attempts=0, error=None, started_at=time.time(), finished_at=None)
+        for attempt in range(1, INGEST_ATTEMPTS + 1):
+            self._set_ingest_status(state="running", attempts=attempt, next_retry_at=None)
+            try:
+                ingest_knowledge_base(self._collection)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                print(f"Knowledge base ingestion failed (attempt {attempt}/{INGEST_ATTEMPTS}): {error}")
+                if attempt == INGEST_ATTEMPTS:
+                    self._set_ingest_status(state="failed", error=error, finished_at=time.time())
+                    return
+                self._set_ingest_status(state="retrying", error=error, next_retry_at=time.time() + delay)
+                time.sleep(delay)
+                delay = min(delay * 2, INGEST_RETRY_MAX_SECONDS)
+            else:
+                self._set_ingest_status(state="done", error=None, finished_at=time.time())
+                return
+            finally:
+                self._retriever.invalidate()   # metadata-only updates leave the count unchanged
 
-    # gather context
-    combined_context = "\n\n".join(results["documents"][0])
-    sources = [meta.get("source", "unknown") for meta in results["metadatas"][0]]
+    def _set_ingest_status(self, **changes: Any) -> None:
+        with self._lock:
+            self._ingest_status.update(changes)
 
-    prompt = f"""
+    def ingest_status(self) -> Dict[str, Any]:
+        """State of the background ingestion (idle / running / retrying / done / failed), for /pipeline/stats."""
+        with self._lock:
+            return dict(self._ingest_status)
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            self.start()
+        return self._collection
+
+    @property
+    def retriever(self) -> HybridRetriever:
+        if self._retriever is None:
+            self.start()
+        return self._retriever
+
+    def _record(self, stage: str, started: float) -> None:
+        self._latencies[stage].append((time.perf_counter() - started) * 1000.0)
+
+    def latency_stats(self) -> Dict[str, Dict[str, float]]:
+        """p50/p99 (ms) of the whole RAG step and of the Chroma retrieval part, over the recent window."""
+        out: Dict[str, Dict[str, float]] = {}
+        for stage, window in self._latencies.items():
+            samples = list(window)
+            out[stage] = {
+                "count": len(samples),
+                "p50_ms": round(_percentile(samples, 50), 1),
+                "p99_ms": round(_percentile(samples, 99), 1),
+            }
+        return out
+
+    def query(self, query: str, category: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Retrieval + suggestion; `category` (the case's CNTR / VS / EA) prefers KB documents
+        of matching categories. Concurrent queries with the same normalized text share one run.
+        """
+        key = f"{self.collection_name}|{self.n_results}|{category or ''}|{normalize_text(query)}"
+        return get_singleflight("rag").do(key, lambda: self._query(query, category))
+
+    def _query(self, query: str, category: Optional[str] = None) -> Dict[str, Any]:
+        started = time.perf_counter()
+        collection = self.collection
+        if collection.count() == 0:
+            status = self.ingest_status()
+            if status["state"] == "failed":
+                raise KnowledgeBaseNotReady(f"Ingestion of collection '{self.collection_name}' failed after "
+                                            f"{status['attempts']} attempts: {status['error']}")
+            raise KnowledgeBaseNotReady(f"Collection '{self.collection_name}' is still being ingested.")
+
+        t_retrieval = time.perf_counter()
+        with metrics.span("rag.retrieval"):
+            hits = self.retriever.search(query, self.n_results, category)
+        self._record("retrieval", t_retrieval)
+
+        # gather context: the best-ranked chunks (fused dense + BM25 score) that fit RAG_CONTEXT_TOKENS
+        candidates = [Candidate(h.document, h.score, rank, group=h.metadata.get("source", "unknown"))
+                      for rank, h in enumerate(hits)]
+        packed = pack(candidates, RAG_CONTEXT_TOKENS, RAG_DEPLOYMENT_ID, separator_tokens=2, prompt="rag")
+        combined_context = "\n\n".join(c.text for c in packed.items)
+        sources = [c.group for c in packed.items]
+
+        prompt = f"""
     Given the following context from incident logs and knowledge base, 
     provide short actionable bullet-point suggestions to resolve this issue:
 
@@ -114,18 +429,61 @@ def RAG_chunk_data_producer(query:str):
     Make the suggestions concise but specific (2-4 bullet points).
     """
 
-    data = {
-        "messages": [
-            {"role": "system", "content": "You are an experienced L2 support engineer providing troubleshooting suggestions."},
-            {"role": "user", "content": prompt}
-        ],
-        "max_tokens": 250
-    }
+        data = {
+            "messages": [
+                {"role": "system", "content": "You are an experienced L2 support engineer providing troubleshooting suggestions."},
+                {"role": "user", "content": prompt}
+            ],
+            "max_tokens": 250
+        }
 
-    url = f"{ENDPOINT}/openai/deployments/gpt-4.1-mini/chat/completions?api-version=2025-01-01-preview"
-    resp = requests.post(url, headers={"Content-Type": "application/json", "api-key": API_KEY}, data=json.dumps(data))
-    rag_output = resp.json()["choices"][0]["message"]["content"]
-    return {
-        "rag_suggestion": rag_output.strip(),
-        "rag_sources": sources
-    }
\ No newline at end of file
+        def _complete() -> str:
+            url = f"{ENDPOINT}/openai/deployments/{RAG_DEPLOYMENT_ID}/chat/completions?api-version=2025-01-01-preview"
+            with metrics.span("rag.llm"):
+                resp = http_client.post(url, headers={"Content-Type": "application/json", "api-key": API_KEY},
+                                        data=json.dumps(data), timeout=60)
+            resp.raise_for_status()
+            body = resp.json()
+            metrics.record_usage("rag", body)
+            return body["choices"][0]["message"]["content"]
+
+        # same issue + same retrieved context -> same answer
+        key = make_key(RAG_DEPLOYMENT_ID, RAG_PROMPT_TEMPLATE_ID, [json.dumps(data, sort_keys=True)])
+        rag_output = get_completion_cache().get_or_call(key, _complete)
+        self._record("rag", started)
+        return {
+            "rag_suggestion": rag_output.strip(),
+            "rag_sources": sources,
+            "rag_context": packed.stats(),
+        }
+
+
+_service: Optional[RagService] = None
+_service_lock = threading.Lock()
+
+
+def get_rag_service() -> RagService:
+    """The process-wide RagService (created on first use; app.py starts it at startup)."""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = RagService()
+    return _service
+
+
+def RAG_chunk_data_producer(query:str, category: Optional[str] = None):
+    return get_rag_service().query(query, category)
+
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Sync the knowledge base into Chroma.")
+    ap.add_argument("--incident-delta", type=Path, help="apply this categorize_incidents --incremental delta only")
+    args = ap.parse_args()
+    if args.incident_delta:
+        with open(args.incident_delta, "r", encoding="utf-8") as f:
+            apply_incident_delta(json.load(f))
+    else:
+        # Run ingestion offline, outside of any user request (safe to re-run: only changes are embedded)
+        ingest_knowledge_base()
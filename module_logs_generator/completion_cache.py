@@ -0,0 +1,204 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from module_logs_generator import metrics
+
+BASE_DIR = Path(__file__).resolve().parent
+
+# Backend: "sqlite" (survives restarts), "memory", or "off"
+CACHE_BACKEND = os.environ.get("COMPLETION_CACHE_BACKEND", "sqlite")
+CACHE_PATH = Path(os.environ.get("COMPLETION_CACHE_PATH", str(BASE_DIR / "completion_cache.sqlite3")))
+CACHE_TTL_SECONDS = float(os.environ.get("COMPLETION_CACHE_TTL", str(24 * 3600)))
+CACHE_MAX_ENTRIES = int(os.environ.get("COMPLETION_CACHE_MAX_ENTRIES", "10000"))
+
+
+def _sha256(data: Union[str, bytes]) -> str:
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_fingerprints(paths: Iterable[Path]) -> List[str]:
+    """name:mtime_ns:size per existing file, so a cached answer goes stale as soon as a log changes."""
+    out: List[str] = []
+    for p in paths:
+        try:
+            st = Path(p).stat()
+        except OSError:
+            continue
+        out.append(f"{Path(p).name}:{st.st_mtime_ns}:{st.st_size}")
+    return out
+
+
+def make_key(deployment: str, prompt_template: str, inputs: Iterable[Union[str, bytes]] = (),
+             files: Iterable[Path] = ()) -> str:
+    """Cache key from deployment, prompt template hash, input hashes and the involved files' mtime/size."""
+    parts = [deployment, _sha256(prompt_template)]
+    parts += [_sha256(i) for i in inputs]
+    parts += file_fingerprints(files)
+    return _sha256("\n".join(parts))
+
+
+# --------------------------------------------------------------------------------------
+# Backends: get/set/evict on JSON values with an absolute expiry time
+# --------------------------------------------------------------------------------------
+class MemoryBackend:
+    # values are kept serialised so callers never share (and mutate) a cached object
+    def __init__(self):
+        self._data: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[float, Any]]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            self._data.move_to_end(key)
+        return item[0], json.loads(item[1])
+
+    def set(self, key: str, value: Any, expires_at: float) -> None:
+        with self._lock:
+            self._data[key] = (expires_at, json.dumps(value))
+            self._data.move_to_end(key)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def evict(self, max_entries: int, now: float) -> None:
+        with self._lock:
+            for k in [k for k, (exp, _) in self._data.items() if exp <= now]:
+                del self._data[k]
+            while len(self._data) > max_entries:
+                self._data.popitem(last=False)
+
+
+class SqliteBackend:
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS completions ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, last_used REAL NOT NULL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS completions_last_used ON completions(last_used)")
+            self._db.commit()
+
+    def get(self, key: str) -> Optional[Tuple[float, Any]]:
+        with self._lock:
+            row = self._db.execute("SELECT expires_at, value FROM completions WHERE key=?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE completions SET last_used=? WHERE key=?", (time.time(), key))
+            self._db.commit()
+        return row[0], json.loads(row[1])
+
+    def set(self, key: str, value: Any, expires_at: float) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO completions(key, value, expires_at, last_used) VALUES (?,?,?,?)",
+                (key, json.dumps(value), expires_at, time.time()))
+            self._db.commit()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM completions WHERE key=?", (key,))
+            self._db.commit()
+
+    def evict(self, max_entries: int, now: float) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM completions WHERE expires_at <= ?", (now,))
+            (count,) = self._db.execute("SELECT COUNT(*) FROM completions").fetchone()
+            if count > max_entries:
+                self._db.execute(
+                    "DELETE FROM completions WHERE key IN "
+                    "(SELECT key FROM completions ORDER BY last_used ASC LIMIT ?)", (count - max_entries,))
+            self._db.commit()
+
+
+class CompletionCache:
+    """
+    Response cache for deterministic (temperature 0) LLM calls. Values must be JSON-serialisable.
+    Only successful calls are stored; exceptions propagate and are not cached.
+    """
+
+    def __init__(self, backend, ttl_seconds: float = CACHE_TTL_SECONDS, max_entries: int = CACHE_MAX_ENTRIES):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        if self.backend is None:
+            return None
+        item = self.backend.get(key)
+        if item is not None and item[0] <= time.time():
+            self.backend.delete(key)
+            item = None
+        with self._lock:
+            if item is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        metrics.record_cache("completion", int(item is not None), int(item is None))
+        return None if item is None else item[1]
+
+    def set(self, key: str, value: Any) -> None:
+        if self.backend is None:
+            return
+        now = time.time()
+        self.backend.set(key, value, now + self.ttl_seconds)
+        with self._lock:
+            self._writes += 1
+            evict = self._writes % 100 == 0
+        if evict:
+            self.backend.evict(self.max_entries, now)
+
+    def get_or_call(self, key: str, fn: Callable[[], Any]) -> Any:
+        value = self.get(key)
+        if value is None:
+            value = fn()
+            self.set(key, value)
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "backend": type(self.backend).__name__ if self.backend is not None else "off",
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+            }
+
+
+_cache: Optional[CompletionCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_completion_cache() -> CompletionCache:
+    """The process-wide cache shared by logs.py, module-logs-generator.py and rag_setup.py."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                if CACHE_BACKEND == "off":
+                    backend = None
+                elif CACHE_BACKEND == "memory":
+                    backend = MemoryBackend()
+                else:
+                    backend = SqliteBackend(CACHE_PATH)
+                _cache = CompletionCache(backend)
+    return _cache
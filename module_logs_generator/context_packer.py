@@ -0,0 +1,152 @@
+import math
+import os
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional
+
+from module_logs_generator import metrics
+
+try:  # exact counts with tiktoken (requirements.txt); ~4 characters per token without it
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# --------------------------------------------------------------------------------------
+# Token-budgeted prompt context: candidates (log lines, KB chunks) are scored by relevance
+# and packed greedily, best first, until the deployment's budget is spent; the survivors
+# are returned in their original order along with how much was dropped.
+# --------------------------------------------------------------------------------------
+# Prompt tokens we are willing to spend per call, by deployment (CONTEXT_TOKEN_BUDGET overrides all)
+DEPLOYMENT_BUDGETS: Dict[str, int] = {
+    "gpt-4.1-mini": 24000,
+    "gpt-4o-mini": 16000,
+    "gpt-4o": 16000,
+}
+DEFAULT_BUDGET = 8000
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "0"))   # 0: use DEPLOYMENT_BUDGETS
+CHARS_PER_TOKEN = 4
+
+CONTEXT_TOKENS = metrics.register(metrics.Counter(
+    "context_tokens_total", "Candidate context tokens kept in / dropped from prompts by the packer.",
+    ("prompt", "outcome")))
+
+_encodings: Dict[str, Any] = {}
+_encodings_lock = threading.Lock()
+
+
+def token_budget(deployment: str) -> int:
+    if CONTEXT_TOKEN_BUDGET > 0:
+        return CONTEXT_TOKEN_BUDGET
+    return DEPLOYMENT_BUDGETS.get(deployment, DEFAULT_BUDGET)
+
+
+def _encoding(deployment: Optional[str]):
+    if tiktoken is None:
+        return None
+    name = deployment or ""
+    with _encodings_lock:
+        if name not in _encodings:
+            try:
+                try:
+                    enc = tiktoken.encoding_for_model(name)
+                except KeyError:
+                    enc = tiktoken.get_encoding("o200k_base")
+            except Exception as e:   # e.g. the BPE file cannot be downloaded: estimate instead
+                print(f"tiktoken: no encoding for {name!r} ({e}); estimating {CHARS_PER_TOKEN} characters per token")
+                enc = None
+            _encodings[name] = enc
+        return _encodings[name]
+
+
+def count_tokens(text: str, deployment: Optional[str] = None) -> int:
+    enc = _encoding(deployment)
+    if enc is None:
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, deployment: Optional[str] = None) -> str:
+    """The head of `text` that fits in `max_tokens`."""
+    enc = _encoding(deployment)
+    if enc is None:
+        return text[:max(0, max_tokens) * CHARS_PER_TOKEN]
+    tokens = enc.encode(text, disallowed_special=())
+    return text if len(tokens) <= max_tokens else enc.decode(tokens[:max(0, max_tokens)])
+
+
+# --------------------------------------------------------------------------------------
+# Relevance features
+# --------------------------------------------------------------------------------------
+def signal_hits(text: str, signals: Iterable[str]) -> int:
+    """How many of the (lower-cased) signals occur in `text`."""
+    low = text.lower()
+    return sum(1 for s in signals if s and s in low)
+
+
+def time_proximity(ts_ms: Optional[int], incident_ms: Optional[int], window_ms: int) -> float:
+    """1.0 at the incident time, falling linearly to 0 at +/- `window_ms` (0 when either time is unknown)."""
+    if ts_ms is None or incident_ms is None or window_ms <= 0:
+        return 0.0
+    return max(0.0, 1.0 - abs(ts_ms - incident_ms) / window_ms)
+
+
+# --------------------------------------------------------------------------------------
+# Packing
+# --------------------------------------------------------------------------------------
+@dataclass
+class Candidate:
+    text: str
+    score: float
+    order: int                 # position in the packed output
+    group: str = ""            # e.g. the log file a line belongs to
+    tokens: int = 0
+
+
+@dataclass
+class Packed:
+    items: List[Candidate]     # kept, in `order`
+    used_tokens: int
+    dropped: int
+    dropped_tokens: int
+
+    def by_group(self) -> Dict[str, List[Candidate]]:
+        out: Dict[str, List[Candidate]] = {}
+        for c in self.items:
+            out.setdefault(c.group, []).append(c)
+        return out
+
+    def stats(self) -> Dict[str, int]:
+        return {"kept": len(self.items), "kept_tokens": self.used_tokens,
+                "dropped": self.dropped, "dropped_tokens": self.dropped_tokens}
+
+
+def record_packing(prompt: str, stats: Dict[str, int]) -> None:
+    """Count a packing result (Packed.stats()) under `prompt` in context_tokens_total."""
+    metrics.count(CONTEXT_TOKENS, stats["kept_tokens"], f"{prompt}_context_tokens", prompt=prompt, outcome="kept")
+    metrics.count(CONTEXT_TOKENS, stats["dropped_tokens"], f"{prompt}_context_dropped_tokens",
+                  prompt=prompt, outcome="dropped")
+
+
+def pack(candidates: List[Candidate], budget: int, deployment: Optional[str] = None,
+         separator_tokens: int = 1, prompt: str = "") -> Packed:
+    """
+    Highest score first (earlier `order` on ties); a candidate that does not fit is skipped
+    and smaller ones after it may still fill the remaining budget. `prompt` labels the
+    context_tokens_total metric.
+    """
+    for c in candidates:
+        if not c.tokens:
+            c.tokens = count_tokens(c.text, deployment) + separator_tokens
+    kept: List[Candidate] = []
+    used = dropped_tokens = 0
+    for c in sorted(candidates, key=lambda c: (-c.score, c.order)):
+        if used + c.tokens <= budget:
+            kept.append(c)
+            used += c.tokens
+        else:
+            dropped_tokens += c.tokens
+    kept.sort(key=lambda c: c.order)
+    packed = Packed(kept, used, len(candidates) - len(kept), dropped_tokens)
+    if prompt:
+        record_packing(prompt, packed.stats())
+    return packed
@@ -0,0 +1,299 @@
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Any, Deque, Dict, Mapping, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from module_logs_generator import metrics
+
+# --------------------------------------------------------------------------------------
+# Shared client for every Azure OpenAI call: keep-alive pools, per-endpoint concurrency
+# limits, exponential backoff honouring Retry-After, and per-endpoint timing metrics.
+# --------------------------------------------------------------------------------------
+HTTP_POOL_SIZE        = int(os.environ.get("HTTP_POOL_SIZE", "16"))                   # keep-alive connections per host
+HTTP_MAX_CONCURRENCY  = int(os.environ.get("HTTP_MAX_CONCURRENCY_PER_ENDPOINT", "8"))  # in-flight calls per endpoint
+HTTP_MAX_RETRIES      = int(os.environ.get("HTTP_MAX_RETRIES", "4"))
+HTTP_BACKOFF_BASE     = float(os.environ.get("HTTP_BACKOFF_BASE", "0.5"))             # seconds, doubled per attempt
+HTTP_BACKOFF_MAX      = float(os.environ.get("HTTP_BACKOFF_MAX", "30"))
+HTTP_CONNECT_TIMEOUT  = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "10"))
+DEFAULT_READ_TIMEOUT  = 180.0
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+LATENCY_WINDOW = 1000
+
+Timeout = Union[float, Tuple[float, float]]
+
+
+class UpstreamThrottled(RuntimeError):
+    """Azure kept answering 429 after every retry; callers should surface a 503, not a 500."""
+
+    def __init__(self, url: str, retry_after: Optional[float] = None):
+        self.retry_after = retry_after
+        super().__init__(f"Upstream throttled (429) after {HTTP_MAX_RETRIES} retries: {endpoint_key(url)}")
+
+
+def endpoint_key(url: str) -> str:
+    """host + path (deployment and operation), without the query string."""
+    parts = urlsplit(url)
+    return f"{parts.netloc}{parts.path}"
+
+
+def _retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """Seconds to wait from retry-after-ms / Retry-After (seconds or HTTP date); None if absent."""
+    ms = headers.get("retry-after-ms")
+    if ms:
+        try:
+            return max(0.0, float(ms) / 1000.0)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff(attempt: int, retry_after: Optional[float]) -> float:
+    if retry_after is not None:
+        return min(retry_after, HTTP_BACKOFF_MAX)
+    # full jitter keeps concurrent retries from hitting the gateway in lockstep
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * (2 ** attempt)))
+
+
+def _retry_delay(url: str, attempt: int, idempotent: bool, status: Optional[int] = None,
+                 headers: Optional[Mapping[str, str]] = None, read_timeout: bool = False) -> Optional[float]:
+    """
+    The retry policy shared by post() and apost(): seconds to wait before the next attempt, or
+    None when this outcome is final (a response to return, or an error to re-raise). `status`
+    None means the attempt failed with a connection error or timeout. Raises UpstreamThrottled
+    for a 429 on the last attempt. A read timeout is only retried for `idempotent` calls
+    (embeddings): the server already has the request, so re-sending a completion would wait
+    out and pay for it a second time.
+    """
+    if status is not None and status not in RETRY_STATUSES:
+        return None
+    if status is None and read_timeout and not idempotent:
+        return None
+    wait = _retry_after(headers) if headers is not None else None
+    if attempt >= HTTP_MAX_RETRIES:
+        if status == 429:
+            raise UpstreamThrottled(url, wait)
+        return None
+    return _backoff(attempt, wait)
+
+
+def _timeout(timeout: Optional[Timeout]) -> Tuple[float, float]:
+    if timeout is None:
+        return (HTTP_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT)
+    if isinstance(timeout, tuple):
+        return timeout
+    return (HTTP_CONNECT_TIMEOUT, float(timeout))
+
+
+# --------------------------------------------------------------------------------------
+# Metrics
+# --------------------------------------------------------------------------------------
+def _percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+class _EndpointStats:
+    def __init__(self):
+        self.calls = 0
+        self.retries = 0
+        self.errors = 0
+        self.throttled = 0
+        self.latencies_ms: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+
+_STATS: Dict[str, _EndpointStats] = {}
+_STATS_LOCK = threading.Lock()
+
+
+def _record(key: str, started: float, status: Optional[int], retried: bool) -> None:
+    elapsed = time.perf_counter() - started
+    metrics.AZURE_SECONDS.observe(elapsed, endpoint=key, status=str(status or "error"))
+    with _STATS_LOCK:
+        s = _STATS.setdefault(key, _EndpointStats())
+        s.calls += 1
+        s.latencies_ms.append(elapsed * 1000.0)
+        if retried:
+            s.retries += 1
+        if status is None or status >= 500:
+            s.errors += 1
+        if status == 429:
+            s.throttled += 1
+
+
+def _record_bytes(key: str, sent: Union[str, bytes], received: bytes) -> None:
+    metrics.count(metrics.AZURE_BYTES, len(sent), "azure_bytes_sent", endpoint=key, direction="sent")
+    metrics.count(metrics.AZURE_BYTES, len(received), "azure_bytes_received", endpoint=key, direction="received")
+
+
+def http_stats() -> Dict[str, Dict[str, Any]]:
+    """Per-endpoint attempt counts and latency percentiles (ms) over the last LATENCY_WINDOW attempts."""
+    with _STATS_LOCK:
+        return {
+            key: {
+                "calls": s.calls,
+                "retries": s.retries,
+                "errors": s.errors,
+                "throttled": s.throttled,
+                "p50_ms": round(_percentile(s.latencies_ms, 50), 1),
+                "p95_ms": round(_percentile(s.latencies_ms, 95), 1),
+            }
+            for key, s in _STATS.items()
+        }
+
+
+# --------------------------------------------------------------------------------------
+# Sync client (requests.Session over a pooled HTTPAdapter)
+# --------------------------------------------------------------------------------------
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+_sync_limits: Dict[str, threading.BoundedSemaphore] = {}
+
+
+def get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                s = requests.Session()
+                adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=0)
+                s.mount("https://", adapter)
+                s.mount("http://", adapter)
+                _session = s
+    return _session
+
+
+def _sync_limit(key: str) -> threading.BoundedSemaphore:
+    with _session_lock:
+        sem = _sync_limits.get(key)
+        if sem is None:
+            sem = _sync_limits[key] = threading.BoundedSemaphore(HTTP_MAX_CONCURRENCY)
+        return sem
+
+
+def post(url: str, headers: Mapping[str, str], data: Union[str, bytes],
+         timeout: Optional[Timeout] = None, idempotent: bool = False) -> requests.Response:
+    """
+    POST with retries on connection errors and RETRY_STATUSES (see _retry_delay). Other
+    responses (including 4xx the caller falls back on) are returned as-is. Raises
+    UpstreamThrottled when 429 persists.
+    """
+    key = endpoint_key(url)
+    sem = _sync_limit(key)
+    session = get_session()
+    for attempt in range(HTTP_MAX_RETRIES + 1):
+        started = time.perf_counter()
+        try:
+            with sem:
+                r = session.post(url, headers=headers, data=data, timeout=_timeout(timeout))
+        except (requests.ConnectionError, requests.Timeout) as e:
+            _record(key, started, None, attempt > 0)
+            delay = _retry_delay(url, attempt, idempotent, read_timeout=isinstance(e, requests.ReadTimeout))
+            if delay is None:
+                raise
+            time.sleep(delay)
+            continue
+        _record(key, started, r.status_code, attempt > 0)
+        _record_bytes(key, data, r.content)
+        delay = _retry_delay(url, attempt, idempotent, r.status_code, r.headers)
+        if delay is None:
+            return r
+        time.sleep(delay)
+    raise AssertionError("unreachable")
+
+
+# --------------------------------------------------------------------------------------
+# Async client (httpx.AsyncClient); same retry policy, for callers already on an event loop.
+# An AsyncClient and asyncio.Semaphores belong to the loop they were first used on, so each
+# running loop gets its own client and per-endpoint limits; they go away with the loop.
+# --------------------------------------------------------------------------------------
+class _LoopClient:
+    def __init__(self):
+        import httpx  # only needed by async callers
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=HTTP_POOL_SIZE * 4, max_keepalive_connections=HTTP_POOL_SIZE),
+        )
+        self.limits: Dict[str, asyncio.Semaphore] = {}
+
+    def limit(self, key: str) -> asyncio.Semaphore:
+        sem = self.limits.get(key)
+        if sem is None:
+            sem = self.limits[key] = asyncio.Semaphore(HTTP_MAX_CONCURRENCY)
+        return sem
+
+
+_loop_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopClient]" = weakref.WeakKeyDictionary()
+_loop_clients_lock = threading.Lock()
+
+
+def _loop_client() -> _LoopClient:
+    loop = asyncio.get_running_loop()
+    with _loop_clients_lock:
+        lc = _loop_clients.get(loop)
+        if lc is None:
+            lc = _loop_clients[loop] = _LoopClient()
+        return lc
+
+
+def get_async_client():
+    """The httpx.AsyncClient of the running event loop."""
+    return _loop_client().client
+
+
+async def aclose() -> None:
+    """Close the running loop's async pool (call on app shutdown)."""
+    with _loop_clients_lock:
+        lc = _loop_clients.pop(asyncio.get_running_loop(), None)
+    if lc is not None:
+        await lc.client.aclose()
+
+
+async def apost(url: str, headers: Mapping[str, str], data: Union[str, bytes],
+                timeout: Optional[Timeout] = None, idempotent: bool = False):
+    """Async counterpart of post(); returns an httpx.Response."""
+    import httpx
+    key = endpoint_key(url)
+    lc = _loop_client()
+    sem = lc.limit(key)
+    connect, read = _timeout(timeout)
+    for attempt in range(HTTP_MAX_RETRIES + 1):
+        started = time.perf_counter()
+        try:
+            async with sem:
+                r = await lc.client.post(url, headers=dict(headers), content=data,
+                                         timeout=httpx.Timeout(read, connect=connect))
+        except (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError) as e:
+            _record(key, started, None, attempt > 0)
+            delay = _retry_delay(url, attempt, idempotent, read_timeout=isinstance(e, httpx.ReadTimeout))
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            continue
+        _record(key, started, r.status_code, attempt > 0)
+        _record_bytes(key, data, r.content)
+        delay = _retry_delay(url, attempt, idempotent, r.status_code, r.headers)
+        if delay is None:
+            return r
+        await asyncio.sleep(delay)
+    raise AssertionError("unreachable")
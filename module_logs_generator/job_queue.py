@@ -0,0 +1,268 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+BASE_DIR = Path(__file__).resolve().parent
+
+# --------------------------------------------------------------------------------------
+# Local job queue: SQLite table as the broker (shared by every gunicorn worker process
+# on the host), a thread pool per process claiming jobs, per-case progress rows.
+# --------------------------------------------------------------------------------------
+JOB_DB_PATH     = Path(os.environ.get("JOB_DB_PATH", str(BASE_DIR / "jobs.sqlite3")))
+JOB_WORKERS     = max(1, int(os.environ.get("JOB_WORKERS", "2")))
+JOB_QUEUE_DEPTH = max(1, int(os.environ.get("JOB_QUEUE_DEPTH", "32")))   # queued (not yet running) jobs
+JOB_RETENTION_HOURS = float(os.environ.get("JOB_RETENTION_HOURS", "24"))   # finished jobs kept this long
+JOB_POLL_SECONDS = 1.0   # other processes' submissions are picked up at this interval
+JOB_PURGE_SECONDS = 600.0   # how often an idle worker deletes expired jobs
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+PENDING = "pending"   # per-case stage not finished yet
+
+
+class QueueFull(RuntimeError):
+    """JOB_QUEUE_DEPTH jobs are already waiting."""
+
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobContext:
+    """Handed to a job handler to report progress."""
+
+    def __init__(self, queue: "JobQueue", job_id: str):
+        self._queue = queue
+        self.job_id = job_id
+
+    def set_cases(self, cases: List[Dict[str, Any]]) -> None:
+        """Register the extracted cases; each starts with verdict/rag = "pending"."""
+        rows = [(self.job_id, i, str(c.get("id") or ""), str(c.get("title") or ""), PENDING, PENDING)
+                for i, c in enumerate(cases)]
+        with self._queue._lock:
+            db = self._queue._db
+            db.execute("DELETE FROM job_cases WHERE job_id=?", (self.job_id,))
+            db.executemany("INSERT INTO job_cases(job_id, idx, case_id, title, verdict, rag) VALUES (?,?,?,?,?,?)", rows)
+            db.execute("UPDATE jobs SET total_cases=? WHERE id=?", (len(cases), self.job_id))
+
+    def case_stage(self, index: int, stage: str, status: str) -> None:
+        """Mark stage ("verdict" | "rag") of case `index` as DONE or FAILED."""
+        if stage not in ("verdict", "rag"):
+            raise ValueError(f"unknown stage {stage!r}")
+        with self._queue._lock:
+            self._queue._db.execute(f"UPDATE job_cases SET {stage}=? WHERE job_id=? AND idx=?",
+                                    (status, self.job_id, index))
+
+
+Handler = Callable[[JobContext, Dict[str, Any]], Any]
+
+
+class JobQueue:
+    """
+    submit() persists a job and returns its id immediately; JOB_WORKERS threads claim queued
+    jobs (oldest first) and run the handler registered for the job's kind. The handler's
+    return value (JSON-serialisable) becomes the job result; an exception marks it failed.
+    Jobs left "running" by a process that no longer exists are re-queued on start(); done and
+    failed jobs are deleted JOB_RETENTION_HOURS after they finished.
+    """
+
+    def __init__(self, path: Path = JOB_DB_PATH, workers: int = JOB_WORKERS, max_depth: int = JOB_QUEUE_DEPTH):
+        self.path = Path(path)
+        self.workers = workers
+        self.max_depth = max_depth
+        self._handlers: Dict[str, Handler] = {}
+        self._threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+        self._wake = threading.Condition()
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # autocommit; claims use explicit BEGIN IMMEDIATE so processes never grab the same job
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None, timeout=30)
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, payload TEXT NOT NULL,"
+                " result TEXT, error TEXT, total_cases INTEGER, owner_pid INTEGER,"
+                " created_at REAL NOT NULL, started_at REAL, finished_at REAL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs(status, created_at)")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS job_cases ("
+                " job_id TEXT NOT NULL, idx INTEGER NOT NULL, case_id TEXT, title TEXT,"
+                " verdict TEXT NOT NULL, rag TEXT NOT NULL, PRIMARY KEY (job_id, idx))")
+
+    def register(self, kind: str, handler: Handler) -> None:
+        self._handlers[kind] = handler
+
+    # ---------------- producer side ----------------
+    def submit(self, kind: str, payload: Dict[str, Any]) -> str:
+        if kind not in self._handlers:
+            raise ValueError(f"no handler registered for job kind {kind!r}")
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                (depth,) = self._db.execute("SELECT COUNT(*) FROM jobs WHERE status=?", (QUEUED,)).fetchone()
+                if depth >= self.max_depth:
+                    raise QueueFull(f"{depth} jobs already queued (JOB_QUEUE_DEPTH={self.max_depth})")
+                self._db.execute(
+                    "INSERT INTO jobs(id, kind, status, payload, created_at) VALUES (?,?,?,?,?)",
+                    (job_id, kind, QUEUED, json.dumps(payload), time.time()))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        with self._wake:
+            self._wake.notify()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Job status with per-case progress; "result" is only present once the job is done."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, kind, status, result, error, total_cases, created_at, started_at, finished_at"
+                " FROM jobs WHERE id=?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            cases = self._db.execute(
+                "SELECT idx, case_id, title, verdict, rag FROM job_cases WHERE job_id=? ORDER BY idx",
+                (job_id,)).fetchall()
+            position = None
+            if row[2] == QUEUED:
+                (position,) = self._db.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status=? AND created_at < ?", (QUEUED, row[6])).fetchone()
+        finished = sum(1 for c in cases if c[3] != PENDING and c[4] != PENDING)
+        job: Dict[str, Any] = {
+            "job_id": row[0],
+            "kind": row[1],
+            "status": row[2],
+            "queue_position": position,
+            "created_at": row[6],
+            "started_at": row[7],
+            "finished_at": row[8],
+            "progress": {
+                "total_cases": row[5],
+                "finished_cases": finished,
+                "cases": [{"index": c[0], "id": c[1], "title": c[2], "verdict": c[3], "rag": c[4]} for c in cases],
+            },
+        }
+        if row[4]:
+            job["error"] = row[4]
+        if row[2] == DONE and row[3] is not None:
+            job["result"] = json.loads(row[3])
+        return job
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return {"workers": self.workers, "max_depth": self.max_depth,
+                **{s: counts.get(s, 0) for s in (QUEUED, RUNNING, DONE, FAILED)}}
+
+    def purge(self, retention_hours: float = JOB_RETENTION_HOURS) -> int:
+        """Delete done / failed jobs (and their case rows) that finished over `retention_hours` ago."""
+        cutoff = time.time() - retention_hours * 3600.0
+        with self._lock:
+            self._last_purge = time.time()
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                expired = [r[0] for r in self._db.execute(
+                    "SELECT id FROM jobs WHERE status IN (?,?) AND finished_at < ?", (DONE, FAILED, cutoff))]
+                self._db.executemany("DELETE FROM job_cases WHERE job_id=?", [(j,) for j in expired])
+                self._db.executemany("DELETE FROM jobs WHERE id=?", [(j,) for j in expired])
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return len(expired)
+
+    # ---------------- worker side ----------------
+    def start(self) -> None:
+        if self._threads:
+            return
+        with self._lock:
+            running = self._db.execute("SELECT id, owner_pid FROM jobs WHERE status=?", (RUNNING,)).fetchall()
+            orphaned = [(QUEUED, job_id) for job_id, pid in running if not _pid_alive(pid)]
+            self._db.executemany("UPDATE jobs SET status=?, started_at=NULL, owner_pid=NULL WHERE id=?", orphaned)
+        self.purge()
+        self._stop.clear()
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop claiming new jobs and wait for the running ones to finish."""
+        self._stop.set()
+        with self._wake:
+            self._wake.notify_all()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads.clear()
+
+    def _claim(self) -> Optional[tuple]:
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT id, kind, payload FROM jobs WHERE status=? ORDER BY created_at LIMIT 1",
+                    (QUEUED,)).fetchone()
+                if row is not None:
+                    self._db.execute("UPDATE jobs SET status=?, started_at=?, owner_pid=? WHERE id=?",
+                                     (RUNNING, time.time(), os.getpid(), row[0]))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return row
+
+    def _finish(self, job_id: str, status: str, result: Any = None, error: Optional[str] = None) -> None:
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status=?, result=?, error=?, finished_at=? WHERE id=?",
+                (status, json.dumps(result, default=str) if result is not None else None, error, time.time(), job_id))
+
+    def _worker(self) -> None:
+        while not self._stop.is_set():
+            row = self._claim()
+            if row is None:
+                if time.time() - self._last_purge > JOB_PURGE_SECONDS:
+                    try:
+                        self.purge()
+                    except sqlite3.Error as e:
+                        print("job purge failed:", e)
+                with self._wake:
+                    self._wake.wait(JOB_POLL_SECONDS)
+                continue
+            job_id, kind, payload = row
+            try:
+                result = self._handlers[kind](JobContext(self, job_id), json.loads(payload))
+            except Exception as e:
+                self._finish(job_id, FAILED, error=f"{type(e).__name__}: {e}")
+            else:
+                self._finish(job_id, DONE, result=result)
+
+
+_queue: Optional[JobQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = JobQueue()
+    return _queue
@@ -0,0 +1,45 @@
+import re
+from typing import Dict, Optional, Set, Tuple
+
+# --------------------------------------------------------------------------------------
+# Identifier tokens we care about in incidents and service logs. The token index itself
+# is the record_tokens table of the log ingester (log_ingest.py).
+# --------------------------------------------------------------------------------------
+# Each pattern yields the token value in group 1; values are upper-cased before indexing.
+TOKEN_PATTERNS: Dict[str, re.Pattern] = {
+    "cntr_no":     re.compile(r"\b([A-Z]{4}\d{7})\b", re.I),
+    "message_ref": re.compile(r"\b(?:REF-|ref(?:erence)?[\s:#]+)([A-Z]{3}-\d{3,})\b", re.I),
+    "corr_id":     re.compile(r"\b(?:corrId|correlation_id|corr_id)[=:]\s*\"?([\w-]{6,})", re.I),
+    "corr_token":  re.compile(r"\b(corr-[\w-]+)\b", re.I),
+    "imo":         re.compile(r"\b(?:IMO|imo_no)[\s:=#-]*(\d{7})\b", re.I),
+    "error_code":  re.compile(r"\b([A-Z]+_ERR_\d+)\b", re.I),
+}
+
+# Prefix restoring the canonical form when the pattern captured only part of the token
+TOKEN_PREFIX: Dict[str, str] = {"message_ref": "REF-"}
+
+# Vessel names are free text; learn them from the logs and look them up verbatim in incidents
+VESSEL_NAME_RE = re.compile(r"(?:system_vessel_name|vesselName|vessel_name)=\"(MV [^\"]+)\"", re.I)
+
+
+# Tokens that name exactly one operational object (as opposed to e.g. a shared error code)
+EXACT_ID_KINDS = ("cntr_no", "message_ref", "corr_id", "corr_token")
+
+
+def extract_tokens(text: str, kinds: Optional[Tuple[str, ...]] = None) -> Set[str]:
+    """Return the identifier tokens (cntr_no, corrId, message_ref, IMO, error code) found in text."""
+    tokens: Set[str] = set()
+    for kind, rx in TOKEN_PATTERNS.items():
+        if kinds is not None and kind not in kinds:
+            continue
+        prefix = TOKEN_PREFIX.get(kind, "")
+        for m in rx.finditer(text or ""):
+            tokens.add(prefix + m.group(1).upper())
+    return tokens
+
+
+def _line_tokens(line: str) -> Set[str]:
+    tokens = extract_tokens(line)
+    for m in VESSEL_NAME_RE.finditer(line):
+        tokens.add(m.group(1).strip().upper())
+    return tokens
@@ -0,0 +1,479 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from module_logs_generator.log_index import _line_tokens, extract_tokens
+
+BASE_DIR = Path(__file__).resolve().parent
+
+# --------------------------------------------------------------------------------------
+# Tail-following ingestion of "ISO-ts LEVEL component key=value ..." service logs into
+# structured records. Per-file (inode, byte offset) checkpoints and the parsed records
+# are committed together in SQLite, so a restart resumes exactly where it stopped and
+# only newly appended bytes are ever parsed.
+# --------------------------------------------------------------------------------------
+INGEST_DIR        = Path(os.environ.get("LOG_INGEST_DIR", str(BASE_DIR / "log_ingest")))
+INGEST_READ_BYTES = 1 << 20   # bytes read (and lines committed) per step while tailing
+LOG_MAX_RECORDS   = int(os.environ.get("LOG_MAX_RECORDS", "2000000"))   # oldest records are pruned beyond this
+CANDIDATE_TOKEN_LIMIT = 1000  # newest records looked at per incident token when ranking excerpts
+
+LINE_RE = re.compile(
+    r"^(?P<ts>\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:Z|[+-]\d{2}:?\d{2})?)\s+"
+    r"(?P<level>TRACE|DEBUG|INFO|WARN|WARNING|ERROR|FATAL)\s+"
+    r"(?P<component>\S+)\s*(?P<rest>.*)$")
+KV_RE = re.compile(r'(?P<key>[A-Za-z_][\w.]*)=(?P<value>"(?:[^"\\]|\\.)*"|\[[^\]]*\]|\S+)')
+CORR_ID_KEYS = ("corrId", "correlation_id", "corr_id")
+
+
+@dataclass
+class LogRecord:
+    file: str
+    offset: int                            # byte offset of the line in the file it was read from
+    line: str
+    ts: Optional[str] = None               # as written in the log
+    ts_ms: Optional[int] = None            # epoch milliseconds (UTC)
+    level: Optional[str] = None
+    component: Optional[str] = None
+    corr_id: Optional[str] = None
+    message: str = ""                      # the free text left after removing key=value pairs
+    fields: Dict[str, str] = field(default_factory=dict)
+
+
+def _epoch_ms(ts: str) -> Optional[int]:
+    try:
+        return int(datetime.fromisoformat(ts.replace("Z", "+00:00")).timestamp() * 1000)
+    except ValueError:
+        return None
+
+
+def _unquote(value: str) -> str:
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        return value[1:-1].replace('\\"', '"')
+    return value
+
+
+def parse_log_line(line: str, file: str = "", offset: int = 0) -> Optional[LogRecord]:
+    """
+    Structured record for one log line; None for blank and "#" comment lines.
+    Lines outside the standard layout (e.g. stack-trace continuations) keep only `line`.
+    """
+    line = line.rstrip("\r\n")
+    if not line.strip() or line.lstrip().startswith("#"):
+        return None
+    m = LINE_RE.match(line)
+    if not m:
+        return LogRecord(file=file, offset=offset, line=line)
+    rest = m.group("rest")
+    fields = {kv.group("key"): _unquote(kv.group("value")) for kv in KV_RE.finditer(rest)}
+    message = " ".join(KV_RE.sub(" ", rest).split())
+    level = m.group("level")
+    return LogRecord(
+        file=file,
+        offset=offset,
+        line=line,
+        ts=m.group("ts"),
+        ts_ms=_epoch_ms(m.group("ts")),
+        level="WARN" if level == "WARNING" else level,
+        component=m.group("component"),
+        corr_id=next((fields[k] for k in CORR_ID_KEYS if k in fields), None),
+        message=message,
+        fields=fields,
+    )
+
+
+@dataclass
+class Checkpoint:
+    dev: int
+    inode: int
+    offset: int = 0     # bytes consumed (always on a line boundary)
+    epoch: int = 0      # bumped when the file is truncated in place, so offsets can repeat
+
+
+def _read_complete_lines(path: Path, offset: int) -> Iterator[Tuple[List[Tuple[int, str]], int]]:
+    """
+    The complete lines after `offset` in batches of about INGEST_READ_BYTES, each as
+    ([(offset, line), ...], offset after the batch's last line).
+    """
+    with open(path, "rb") as f:
+        f.seek(offset)
+        pos, carry = offset, b""
+        while True:
+            chunk = f.read(INGEST_READ_BYTES)
+            if not chunk:
+                break
+            buf = carry + chunk
+            cut = buf.rfind(b"\n")
+            if cut < 0:
+                carry = buf
+                continue
+            complete, carry = buf[:cut + 1], buf[cut + 1:]
+            batch: List[Tuple[int, str]] = []
+            for raw in complete.splitlines(keepends=True):
+                batch.append((pos, raw.decode("utf-8", errors="ignore")))
+                pos += len(raw)
+            yield batch, pos
+    # a trailing partial line stays unread until its newline arrives
+
+
+class LogIngestService:
+    """
+    Follows every *.log file in `base_dir`. poll() parses only bytes appended since the
+    stored checkpoint; a changed inode means the file was rotated (the old file is drained
+    first if it is still in the directory under another name) and a shrunken file means it
+    was truncated in place (re-read from 0). Records, their identifier tokens and the new
+    checkpoint are written in one transaction per batch of lines, and records beyond
+    LOG_MAX_RECORDS are pruned oldest first. Only the process running start() should poll;
+    other processes just query the same database.
+    """
+
+    def __init__(self, base_dir: Path, db_path: Optional[Path] = None):
+        self.base_dir = Path(base_dir)
+        if db_path is None:
+            digest = hashlib.sha1(os.path.abspath(str(base_dir)).encode("utf-8")).hexdigest()[:12]
+            db_path = INGEST_DIR / f"{digest}.sqlite3"
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.db_path = Path(db_path)
+        # wait for another process's write transaction instead of failing with "database is locked"
+        self._db = sqlite3.connect(str(db_path), check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()        # the connection
+        self._poll_lock = threading.Lock()   # one poll at a time
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._generation = 0
+        self._data_version: Optional[int] = None
+        self._vessels: Tuple[int, Set[str]] = (-1, set())
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(
+                "CREATE TABLE IF NOT EXISTS checkpoints ("
+                " file TEXT PRIMARY KEY, dev INTEGER NOT NULL, inode INTEGER NOT NULL,"
+                " offset INTEGER NOT NULL, epoch INTEGER NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS records ("
+                " id INTEGER PRIMARY KEY, file TEXT NOT NULL, inode INTEGER NOT NULL, epoch INTEGER NOT NULL,"
+                " offset INTEGER NOT NULL, ts TEXT, ts_ms INTEGER, level TEXT, component TEXT, corr_id TEXT,"
+                " message TEXT, fields TEXT, line TEXT NOT NULL, UNIQUE (file, inode, epoch, offset));"
+                "CREATE INDEX IF NOT EXISTS records_corr ON records(corr_id);"
+                "CREATE INDEX IF NOT EXISTS records_file_ts ON records(file, ts_ms);"
+                "CREATE TABLE IF NOT EXISTS record_tokens (token TEXT NOT NULL, record_id INTEGER NOT NULL);"
+                "CREATE INDEX IF NOT EXISTS record_tokens_token ON record_tokens(token);"
+                "CREATE INDEX IF NOT EXISTS record_tokens_record ON record_tokens(record_id);")
+            self._db.commit()
+
+    @property
+    def generation(self) -> int:
+        """
+        Changes whenever records were added or pruned, by this process or by another one
+        writing the same database, so readers can drop derived caches.
+        """
+        with self._lock:
+            (version,) = self._db.execute("PRAGMA data_version").fetchone()   # moves on other connections' commits
+            if version != self._data_version:
+                if self._data_version is not None:
+                    self._generation += 1
+                self._data_version = version
+            return self._generation
+
+    # ---------------- ingestion ----------------
+    def poll(self) -> Dict[str, int]:
+        """Ingest what was appended since the last poll; returns new records per file."""
+        added: Dict[str, int] = {}
+        if not self.base_dir.exists():
+            return added
+        with self._poll_lock:
+            for path in sorted(self.base_dir.glob("*.log")):
+                try:
+                    n = self._poll_file(path)
+                except OSError:
+                    continue
+                except sqlite3.OperationalError as e:   # e.g. still locked after the busy timeout
+                    print(f"log ingest: {path.name} not ingested this round: {e}")
+                    continue
+                if n:
+                    added[path.name] = n
+            if added:
+                self._prune()
+                with self._lock:
+                    self._generation += 1
+        return added
+
+    def _prune(self, max_records: int = LOG_MAX_RECORDS) -> int:
+        """Delete the oldest records (and their tokens) beyond `max_records`; ids only grow, so ranges suffice."""
+        with self._lock:
+            lo, hi = self._db.execute("SELECT MIN(id), MAX(id) FROM records").fetchone()
+            if hi is None or hi - lo + 1 <= max_records:
+                return 0
+            cutoff = hi - max_records
+            try:
+                self._db.execute("DELETE FROM record_tokens WHERE record_id <= ?", (cutoff,))
+                n = self._db.execute("DELETE FROM records WHERE id <= ?", (cutoff,)).rowcount
+                self._db.commit()
+            except BaseException:
+                self._db.rollback()
+                raise
+        return n
+
+    def _checkpoint(self, fname: str) -> Optional[Checkpoint]:
+        with self._lock:
+            row = self._db.execute("SELECT dev, inode, offset, epoch FROM checkpoints WHERE file=?",
+                                   (fname,)).fetchone()
+        return Checkpoint(*row) if row else None
+
+    def _find_rotated(self, cp: Checkpoint) -> Optional[Path]:
+        """The file now holding the inode we were reading (e.g. app.log -> app.log.1), if still here."""
+        for p in self.base_dir.iterdir():
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            if (st.st_dev, st.st_ino) == (cp.dev, cp.inode):
+                return p
+        return None
+
+    def _poll_file(self, path: Path) -> int:
+        st = path.stat()
+        cp = self._checkpoint(path.name)
+        n = 0
+        if cp is not None and (cp.dev, cp.inode) != (st.st_dev, st.st_ino):
+            old = self._find_rotated(cp)
+            if old is not None and old.stat().st_size > cp.offset:
+                n += self._ingest(path.name, old, cp)
+            cp = None
+        fresh = cp is None
+        if cp is None:
+            cp = Checkpoint(dev=st.st_dev, inode=st.st_ino)
+        elif st.st_size < cp.offset:
+            cp = Checkpoint(dev=cp.dev, inode=cp.inode, epoch=cp.epoch + 1)
+            fresh = True
+        if fresh or st.st_size > cp.offset:
+            n += self._ingest(path.name, path, cp)
+        return n
+
+    def _ingest(self, fname: str, path: Path, cp: Checkpoint) -> int:
+        n, batches = 0, 0
+        for lines, end in _read_complete_lines(path, cp.offset):
+            batches += 1
+            with self._lock:
+                cur = self._db.cursor()
+                try:
+                    for off, line in lines:
+                        rec = parse_log_line(line, fname, off)
+                        if rec is None:
+                            continue
+                        cur.execute(
+                            "INSERT OR IGNORE INTO records(file, inode, epoch, offset, ts, ts_ms, level, component,"
+                            " corr_id, message, fields, line) VALUES (?,?,?,?,?,?,?,?,?,?,?,?)",
+                            (fname, cp.inode, cp.epoch, off, rec.ts, rec.ts_ms, rec.level, rec.component,
+                             rec.corr_id, rec.message, json.dumps(rec.fields), rec.line))
+                        if cur.rowcount:
+                            n += 1
+                            rid = cur.lastrowid
+                            cur.executemany("INSERT INTO record_tokens(token, record_id) VALUES (?,?)",
+                                            [(tok, rid) for tok in _line_tokens(rec.line)])
+                    cur.execute(
+                        "INSERT OR REPLACE INTO checkpoints(file, dev, inode, offset, epoch) VALUES (?,?,?,?,?)",
+                        (fname, cp.dev, cp.inode, end, cp.epoch))
+                    self._db.commit()
+                except BaseException:
+                    self._db.rollback()
+                    raise
+            cp.offset = end
+        if not batches:
+            with self._lock:   # no complete line yet: still record a new inode / truncation epoch
+                self._db.execute(
+                    "INSERT OR REPLACE INTO checkpoints(file, dev, inode, offset, epoch) VALUES (?,?,?,?,?)",
+                    (fname, cp.dev, cp.inode, cp.offset, cp.epoch))
+                self._db.commit()
+        return n
+
+    def start(self, interval: float, after_poll: Optional[Callable[[], None]] = None) -> None:
+        """
+        Poll in a background thread every `interval` seconds, then call `after_poll` (e.g. to
+        extend the log segments); queries never poll.
+        """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+
+        def _loop() -> None:
+            while not self._stop.wait(interval):
+                try:
+                    self.poll()
+                    if after_poll is not None:
+                        after_poll()
+                except Exception as e:
+                    print("log ingest poll failed:", e)
+
+        self._thread = threading.Thread(target=_loop, name="log-ingest", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(5.0)
+            self._thread = None
+
+    # ---------------- queries ----------------
+    _COLUMNS = "file, offset, line, ts, ts_ms, level, component, corr_id, message, fields"
+
+    @staticmethod
+    def _record(row: tuple) -> LogRecord:
+        return LogRecord(*row[:9], fields=json.loads(row[9] or "{}"))
+
+    def _files_clause(self, files: Optional[Iterable[str]]) -> Tuple[str, List[str]]:
+        if files is None:
+            return "", []
+        files = list(files)
+        return f" AND r.file IN ({','.join('?' * len(files))})", files
+
+    def vessel_names(self) -> Set[str]:
+        """Vessel names ("MV ...") seen in the logs, cached until the next poll that adds records."""
+        gen = self.generation
+        if self._vessels[0] != gen:
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT DISTINCT token FROM record_tokens WHERE token >= 'MV ' AND token < 'MV!'").fetchall()
+            self._vessels = (gen, {r[0] for r in rows})
+        return self._vessels[1]
+
+    def query_tokens(self, text: str, signals: Optional[List[str]] = None) -> Set[str]:
+        """Tokens of the incident (text + signals) that can be looked up in record_tokens."""
+        blob = "\n".join([text or ""] + [s for s in (signals or []) if isinstance(s, str)])
+        tokens = extract_tokens(blob)
+        upper = blob.upper()
+        tokens.update(v for v in self.vessel_names() if v in upper)
+        return tokens
+
+    def candidate_lines(self, text: str, files: Optional[List[str]] = None,
+                        signals: Optional[List[str]] = None, context: int = 2,
+                        max_hits: int = 20) -> Dict[str, List[str]]:
+        """
+        Log lines ranked by the incident tokens they carry, with `context` records either side,
+        per file in log order. Rarer tokens weigh more, so a line with a unique REF-/corrId beats
+        one that only shares an error code. Non-adjacent windows are separated by a "..." line.
+        """
+        where, args = self._files_clause(files)
+        tokens = self.query_tokens(text, signals)
+        hits: Dict[tuple, float] = {}
+        with self._lock:
+            for tok in tokens:
+                rows = self._db.execute(
+                    f"SELECT r.id, r.file, r.inode, r.epoch, r.offset FROM record_tokens t"
+                    f" JOIN records r ON r.id = t.record_id WHERE t.token = ?{where}"
+                    f" ORDER BY r.id DESC LIMIT ?", [tok, *args, CANDIDATE_TOKEN_LIMIT]).fetchall()
+                weight = 1.0 / len(rows) if rows else 0.0
+                for row in rows:
+                    hits[row] = hits.get(row, 0.0) + 1.0 + weight
+            ranked = sorted(hits.items(), key=lambda kv: (-kv[1], kv[0][1], kv[0][0]))[:max_hits]
+
+            # per file: record id -> (line, id of the record that follows it in the file, if known)
+            seen: Dict[str, Dict[int, Tuple[str, Optional[int]]]] = {}
+            for (rid, fname, inode, epoch, off), _ in ranked:
+                before = self._db.execute(
+                    "SELECT id, line FROM records WHERE file=? AND inode=? AND epoch=? AND offset<?"
+                    " ORDER BY offset DESC LIMIT ?", (fname, inode, epoch, off, context)).fetchall()
+                after = self._db.execute(
+                    "SELECT id, line FROM records WHERE file=? AND inode=? AND epoch=? AND offset>=?"
+                    " ORDER BY offset LIMIT ?", (fname, inode, epoch, off, context + 2)).fetchall()
+                window = list(reversed(before)) + after[:context + 1]
+                lookahead = after[context + 1][0] if len(after) > context + 1 else None
+                per_file = seen.setdefault(fname, {})
+                for i, (wid, line) in enumerate(window):
+                    nxt = window[i + 1][0] if i + 1 < len(window) else lookahead
+                    if per_file.get(wid, (None, None))[1] is None:
+                        per_file[wid] = (line, nxt)
+
+        out: Dict[str, List[str]] = {}
+        for fname, per_file in seen.items():
+            lines: List[str] = []
+            expected = None
+            for wid in sorted(per_file):
+                if lines and wid != expected:
+                    lines.append("...")
+                line, expected = per_file[wid]
+                lines.append(line)
+            out[fname] = lines
+        return out
+
+    def records(self, ids: Iterable[int]) -> Dict[int, LogRecord]:
+        """Full records by id (ids no longer stored are left out)."""
+        ids = list(ids)
+        out: Dict[int, LogRecord] = {}
+        with self._lock:
+            for i in range(0, len(ids), 500):
+                part = ids[i:i + 500]
+                for row in self._db.execute(
+                        f"SELECT r.id, {self._COLUMNS} FROM records r WHERE r.id IN ({','.join('?' * len(part))})",
+                        part):
+                    out[row[0]] = self._record(row[1:])
+        return out
+
+    def record_id_range(self) -> Tuple[Optional[int], Optional[int]]:
+        """(lowest, highest) id of the kept records; (None, None) when there are none."""
+        with self._lock:
+            return self._db.execute("SELECT MIN(id), MAX(id) FROM records").fetchone()
+
+    def export_since(self, last_id: int, batch: int = 50000) -> Iterator[Tuple[List[tuple], Dict[int, List[str]]]]:
+        """
+        Records with id > last_id in id order, in batches of
+        (rows of (id, file, ts_ms, level, component, corr_id, messageType), {id: tokens}).
+        """
+        while True:
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT id, file, ts_ms, level, component, corr_id, json_extract(fields, '$.messageType')"
+                    " FROM records WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch)).fetchall()
+                if not rows:
+                    return
+                tokens: Dict[int, List[str]] = {}
+                for rid, tok in self._db.execute(
+                        "SELECT record_id, token FROM record_tokens WHERE record_id BETWEEN ? AND ?",
+                        (rows[0][0], rows[-1][0])):
+                    tokens.setdefault(rid, []).append(tok)
+            yield rows, tokens
+            last_id = rows[-1][0]
+
+    def latest(self, file: str, n: int) -> List[LogRecord]:
+        """The newest `n` records of a file, in log order."""
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {self._COLUMNS} FROM records r WHERE r.file = ? ORDER BY r.id DESC LIMIT ?",
+                (file, n)).fetchall()
+        return [self._record(r) for r in reversed(rows)]
+
+    def fingerprint(self) -> List[str]:
+        """
+        The ingested state readers see: every file's checkpoint and the id range of the kept
+        records. Stored in the database, so it is the same in every process and across restarts.
+        """
+        with self._lock:
+            cps = self._db.execute("SELECT file, dev, inode, epoch, offset FROM checkpoints ORDER BY file").fetchall()
+            lo, hi = self._db.execute("SELECT MIN(id), MAX(id) FROM records").fetchone()
+        return [":".join(map(str, cp)) for cp in cps] + [f"records:{lo}:{hi}"]
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            counts = dict(self._db.execute("SELECT file, COUNT(*) FROM records GROUP BY file").fetchall())
+            cps = self._db.execute("SELECT file, offset FROM checkpoints").fetchall()
+        return {f: {"records": counts.get(f, 0), "offset": off} for f, off in cps}
+
+
+# One service per log directory. Readers only query it; poll() / start() are for the one
+# ingesting process (the app's writer, or the CLI before it correlates).
+_SERVICES: Dict[str, LogIngestService] = {}
+_SERVICES_LOCK = threading.Lock()
+
+
+def get_log_ingest(base_dir: Path) -> LogIngestService:
+    key = os.path.abspath(str(base_dir))
+    with _SERVICES_LOCK:
+        svc = _SERVICES.get(key)
+        if svc is None:
+            svc = _SERVICES[key] = LogIngestService(Path(key))
+    return svc
@@ -0,0 +1,166 @@
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+from module_logs_generator.logs import compile_hint_regexes
+
+# The literal prefilter reads patterns with the stdlib's private regex parser. It is not a
+# public API (renamed in 3.11); if it is missing or changes shape, every pattern is simply
+# searched line by line instead.
+try:
+    import re._parser as _sre_parse
+    import re._constants as _sre_c
+except ImportError:
+    try:  # Python < 3.11
+        import sre_parse as _sre_parse
+        import sre_constants as _sre_c
+    except ImportError:
+        _sre_parse = _sre_c = None
+
+SCAN_CHUNK_SIZE = 4 << 20   # bytes per read; chunks are cut on the last newline
+MIN_ANCHOR_LEN = 3          # shorter literal prefixes would flag too many lines
+
+
+@dataclass
+class LineMatch:
+    line: str
+    patterns: List[str] = field(default_factory=list)   # source patterns that hit this line
+
+
+def _literal_anchor(pattern: str) -> str:
+    """Leading literal run of a regex (after \\b / ^ assertions), lower-cased; "" if none or unknown."""
+    if _sre_parse is None:
+        return ""
+    lit: List[str] = []
+    try:
+        for op, av in _sre_parse.parse(pattern, re.I):
+            if op == _sre_c.AT and not lit:
+                continue
+            if op != _sre_c.LITERAL:
+                break
+            lit.append(chr(av))
+    except Exception:   # re.error, or a parser whose output no longer looks like this
+        return ""
+    return "".join(lit).lower()
+
+
+@dataclass(frozen=True)
+class Scanner:
+    """
+    All category hints + signal tokens for one (category, signals) key, compiled once.
+    Each pattern's leading literal is located with str.find over the lower-cased chunk
+    (a multi-literal prefilter running at C speed); only the lines it flags are checked
+    with the matching pattern's regex, which also tells us which pattern hit.
+    Patterns without a usable literal are run as one alternation over the whole chunk; a
+    line it hits is checked against each of those patterns.
+    """
+    patterns: Tuple[str, ...]
+    regexes: Tuple[re.Pattern, ...]
+    anchors: Tuple[Tuple[str, Tuple[int, ...]], ...]   # literal -> ids of patterns starting with it
+    unanchored: Tuple[int, ...]                          # ids of the patterns without one
+    fallback: Optional[re.Pattern]                       # alternation of the unanchored patterns
+
+    def _candidates(self, text: str) -> Dict[int, List[int]]:
+        """line start offset -> ids of patterns that may match on that line."""
+        cand: Dict[int, List[int]] = {}
+        n = len(text)
+        low = text.lower()
+        if len(low) != n:
+            # non-ASCII case folding changed offsets; check every line against every pattern
+            everything = list(range(len(self.patterns)))
+            pos = 0
+            while pos < n:
+                cand[pos] = everything
+                nl = text.find("\n", pos)
+                pos = n if nl < 0 else nl + 1
+            return cand
+        find, rfind = low.find, low.rfind
+        for lit, ids in self.anchors:
+            i = find(lit)
+            while i != -1:
+                start = rfind("\n", 0, i) + 1
+                end = find("\n", i)
+                if end < 0:
+                    end = n
+                cand.setdefault(start, []).extend(ids)
+                i = find(lit, end)
+        if self.fallback is not None:
+            m = self.fallback.search(text)
+            while m is not None:
+                start = text.rfind("\n", 0, m.start()) + 1
+                cand.setdefault(start, []).extend(self.unanchored)
+                end = text.find("\n", m.start())
+                m = None if end < 0 else self.fallback.search(text, end + 1)
+        return cand
+
+    def scan_text(self, text: str) -> Iterator[LineMatch]:
+        """Matching lines of `text` in order, with the patterns that hit each of them."""
+        cand = self._candidates(text)
+        for start in sorted(cand):
+            end = text.find("\n", start)
+            if end < 0:
+                end = len(text)
+            hit: List[str] = []
+            for pid in dict.fromkeys(cand[start]):
+                if self.regexes[pid].search(text, start, end):
+                    hit.append(self.patterns[pid])
+            if hit:
+                yield LineMatch(text[start:end].rstrip("\r"), hit)
+
+
+@lru_cache(maxsize=256)
+def _compile_scanner(category: str, signals: Tuple[str, ...]) -> Optional[Scanner]:
+    regs = compile_hint_regexes(category, list(signals))
+    if not regs:
+        return None
+    anchors: Dict[str, List[int]] = {}
+    unanchored: List[int] = []
+    for pid, r in enumerate(regs):
+        lit = _literal_anchor(r.pattern)
+        if len(lit) >= MIN_ANCHOR_LEN:
+            anchors.setdefault(lit, []).append(pid)
+        else:
+            unanchored.append(pid)
+    fallback = None
+    if unanchored:
+        fallback = re.compile("|".join(f"(?:{regs[pid].pattern})" for pid in unanchored), re.I)
+    return Scanner(
+        patterns=tuple(r.pattern for r in regs),
+        regexes=tuple(regs),
+        anchors=tuple((lit, tuple(ids)) for lit, ids in anchors.items()),
+        unanchored=tuple(unanchored),
+        fallback=fallback,
+    )
+
+
+def get_scanner(category: str, signals: Optional[List[str]]) -> Optional[Scanner]:
+    """Cached per (category, signal set); None when there is nothing to look for."""
+    key = tuple(sorted({s for s in signals or [] if isinstance(s, str)}))
+    return _compile_scanner(category, key)
+
+
+def scan_file(path: Path, scanner: Scanner, max_lines: Optional[int] = None) -> Iterator[LineMatch]:
+    """Stream `path` in large chunks and yield the matching lines with the patterns that hit them."""
+    n = 0
+    with open(path, "rb") as f:
+        carry = b""
+        while True:
+            chunk = f.read(SCAN_CHUNK_SIZE)
+            if not chunk:
+                data, carry = carry, b""
+            else:
+                buf = carry + chunk
+                cut = buf.rfind(b"\n")
+                if cut < 0:
+                    carry = buf
+                    continue
+                data, carry = buf[:cut], buf[cut + 1:]
+            if data:
+                for lm in scanner.scan_text(data.decode("utf-8", errors="ignore")):
+                    yield lm
+                    n += 1
+                    if max_lines is not None and n >= max_lines:
+                        return
+            if not chunk:
+                return
@@ -0,0 +1,479 @@
+import heapq
+import json
+import mmap
+import os
+import re
+import tempfile
+import threading
+from array import array
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from itertools import islice
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:   # no flock (Windows): a single process, the in-process lock is enough
+    fcntl = None
+
+BASE_DIR = Path(__file__).resolve().parent
+
+# --------------------------------------------------------------------------------------
+# Time-sorted, memory-mapped segment per service log plus a sparse (ts, byte offset)
+# index, so a [t - delta, t + delta] window is two bisects and a short scan, whatever
+# the log size. Appended lines wait in a small sorted tail until they are older than the
+# reorder window, so slightly out-of-order lines never force a re-sort; a new or
+# truncated source is rebuilt with an external merge sort (bounded memory). Only the
+# ingesting process writes segments (under a file lock); every process reads them.
+# --------------------------------------------------------------------------------------
+SEGMENT_DIR    = Path(os.environ.get("LOG_SEGMENT_DIR", str(BASE_DIR / "log_segments")))
+SPARSE_EVERY   = 128           # one index entry per this many lines
+SORT_RUN_BYTES = 64 << 20      # source bytes sorted in memory per run during a rebuild
+READ_BYTES     = 4 << 20
+NO_TS          = -1            # lines before the first timestamp in a file
+REORDER_WINDOW_MS  = int(float(os.environ.get("LOG_SEGMENT_REORDER_SECONDS", "60")) * 1000)
+TAIL_MAX_LINES     = 20000     # tail size beyond which the oldest in-order tail lines are moved to the segment
+LATE_MAX_LINES     = 5000      # lines older than the segment's end merged into it beyond this many
+APPEND_BATCH_LINES = 50000     # source lines absorbed per step
+SEGMENT_VERSION    = 2
+
+TS_RE = re.compile(rb"^(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:Z|[+-]\d{2}:?\d{2})?)\s")
+
+
+def line_ts_ms(line: bytes) -> Optional[int]:
+    """Epoch ms of a line's leading ISO-8601 timestamp, or None."""
+    m = TS_RE.match(line)
+    if not m:
+        return None
+    try:
+        return int(datetime.fromisoformat(m.group(1).decode().replace("Z", "+00:00")).timestamp() * 1000)
+    except ValueError:
+        return None
+
+
+def parse_time_ms(value) -> Optional[int]:
+    """Epoch ms from an ISO-8601 string / datetime (naive = UTC); None if unparsable."""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        dt = value
+    else:
+        try:
+            dt = datetime.fromisoformat(str(value).strip().replace("Z", "+00:00").replace(" ", "T", 1))
+        except ValueError:
+            return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000)
+
+
+def _complete_lines(path: Path, offset: int) -> Iterator[Tuple[bytes, int]]:
+    """(line without EOL, offset after it) for each complete line after `offset`."""
+    with open(path, "rb") as f:
+        f.seek(offset)
+        pos, carry = offset, b""
+        while True:
+            chunk = f.read(READ_BYTES)
+            if not chunk:
+                return
+            buf = carry + chunk
+            cut = buf.rfind(b"\n")
+            if cut < 0:
+                carry = buf
+                continue
+            complete, carry = buf[:cut + 1], buf[cut + 1:]
+            for raw in complete.splitlines(keepends=True):
+                pos += len(raw)
+                yield raw.rstrip(b"\r\n"), pos
+
+
+def _timed_lines(path: Path, offset: int, last_ts: int) -> Iterator[Tuple[int, bytes, int]]:
+    """(ts, line, source offset after it); untimed lines inherit the previous line's ts."""
+    for line, end in _complete_lines(path, offset):
+        if not line.strip() or line.startswith(b"#"):
+            continue
+        ts = line_ts_ms(line)
+        if ts is None:
+            ts = last_ts
+        last_ts = ts
+        yield ts, line, end
+
+
+@contextmanager
+def _file_lock(path: Path) -> Iterator[None]:
+    """Exclusive lock across processes (flock); a no-op where fcntl is missing."""
+    if fcntl is None:
+        yield
+        return
+    with open(path, "a+b") as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _with_ts(lines: Iterable[bytes], ts: int) -> Iterator[Tuple[int, bytes]]:
+    """(ts, line) for sorted segment lines; untimed lines inherit the previous line's ts."""
+    for line in lines:
+        t = line_ts_ms(line)
+        ts = ts if t is None else t
+        yield ts, line
+
+
+class Segment:
+    """
+    One service log's segment: lines sorted by time (.seg) with a sparse index (.idx), the
+    sorted tail of lines not yet in it (.tail: recent lines inside the reorder window and
+    late lines older than the segment's end) and the build state (.meta.json).
+
+    The writer (refresh) appends to .seg / .idx, replaces .tail and then replaces the meta
+    file, which publishes the new state: readers in any process reload when the meta file
+    changes and only look at the seg_bytes / idx_entries it names.
+    """
+
+    def __init__(self, source: Path, seg_dir: Path):
+        self.source = source
+        self.seg_path = seg_dir / f"{source.name}.seg"
+        self.idx_path = seg_dir / f"{source.name}.idx"
+        self.tail_path = seg_dir / f"{source.name}.tail"
+        self.meta_path = seg_dir / f"{source.name}.meta.json"
+        self.meta: Dict[str, Any] = {}     # as last loaded by the reader side
+        self._meta_stamp: Optional[Tuple[int, int, int]] = None
+        self._mm: Optional[mmap.mmap] = None
+        self._ts = array("q")
+        self._off = array("q")
+        self._tail: List[Tuple[int, str]] = []
+        self._lock = threading.Lock()      # reader state
+
+    # ---------------- building (writer only) ----------------
+    def _read_meta(self) -> Dict[str, Any]:
+        try:
+            meta = json.loads(self.meta_path.read_text())
+        except (OSError, ValueError):
+            return {}
+        return meta if meta.get("version") == SEGMENT_VERSION else {}
+
+    def refresh(self) -> bool:
+        """Bring the segment up to date with its source; True if it changed. Caller holds the writer lock."""
+        st = self.source.stat()
+        m = self._read_meta()    # another process may have been the writer before us
+        same_file = (bool(m) and m["inode"] == st.st_ino and m["dev"] == st.st_dev and self.seg_path.exists()
+                     and self.seg_path.stat().st_ino == m["seg_inode"])   # else a merge died before publishing
+        if not same_file or st.st_size < m["source_offset"]:
+            self._rebuild(st)
+            return True
+        if st.st_size == m["source_offset"]:
+            return False
+        self._append(m)
+        return True
+
+    def _append(self, m: Dict[str, Any]) -> None:
+        """Absorb the appended source lines: in-order ones reach the segment once out of the reorder window."""
+        # drop bytes of an append that was never published (writer died before the meta)
+        if self.seg_path.stat().st_size > m["seg_bytes"]:
+            os.truncate(self.seg_path, m["seg_bytes"])
+        if self.idx_path.stat().st_size > m["idx_entries"] * 16:
+            os.truncate(self.idx_path, m["idx_entries"] * 16)
+        tail = self._read_tail()
+        lines = _timed_lines(self.source, m["source_offset"], m["source_ts"])
+        while True:
+            batch = list(islice(lines, APPEND_BATCH_LINES))
+            if not batch:
+                break
+            m["max_ts"] = max(m["max_ts"], max(ts for ts, _, _ in batch))
+            m["source_ts"], m["source_offset"] = batch[-1][0], batch[-1][2]
+            pending = tail + [(ts, line) for ts, line, _ in batch]
+            pending.sort(key=lambda r: r[0])   # stable: arrival order within one timestamp
+            cutoff = m["max_ts"] - REORDER_WINDOW_MS
+            flush = [r for r in pending if m["last_ts"] <= r[0] <= cutoff]
+            late = [r for r in pending if r[0] < m["last_ts"]]
+            recent = [r for r in pending if r[0] >= m["last_ts"] and r[0] > cutoff]
+            excess = len(late) + len(recent) - TAIL_MAX_LINES
+            if excess > 0:
+                flush, recent = flush + recent[:excess], recent[excess:]
+            self._append_sorted(m, flush)
+            if len(late) > LATE_MAX_LINES:
+                self._merge_late(m, late)
+                late = []
+            tail = late + recent
+        self._write_tail(tail)
+        m["tail_lines"] = len(tail)
+        self._write_meta(m)
+
+    def _append_sorted(self, m: Dict[str, Any], lines: List[Tuple[int, bytes]]) -> None:
+        if not lines:
+            return
+        idx = array("q")
+        pos, count = m["seg_bytes"], m["count"]
+        with open(self.seg_path, "ab") as seg:
+            for ts, line in lines:
+                if count % SPARSE_EVERY == 0:
+                    idx.extend((ts, pos))
+                seg.write(line + b"\n")
+                pos += len(line) + 1
+                count += 1
+        with open(self.idx_path, "ab") as f:
+            idx.tofile(f)
+        m.update(seg_bytes=pos, count=count, idx_entries=m["idx_entries"] + len(idx) // 2, last_ts=lines[-1][0])
+
+    def _merge_late(self, m: Dict[str, Any], late: List[Tuple[int, bytes]]) -> None:
+        """Rewrite the segment with the late lines merged in: one sequential pass, the segment is already sorted."""
+        with open(self.seg_path, "rb") as f:
+            main = _with_ts((raw.rstrip(b"\n") for raw in islice(f, m["count"])), NO_TS)
+            self._write_sorted(m, heapq.merge(main, late, key=lambda r: r[0]))
+
+    def _write_sorted(self, m: Dict[str, Any], lines: Iterable[Tuple[int, bytes]]) -> None:
+        """Replace .seg / .idx with `lines` (already sorted); m gets the new sizes."""
+        idx = array("q")
+        count, pos = 0, 0
+        seg_tmp, idx_tmp = self.seg_path.with_suffix(".seg.tmp"), self.idx_path.with_suffix(".idx.tmp")
+        with open(seg_tmp, "wb") as seg:
+            for ts, line in lines:
+                if count % SPARSE_EVERY == 0:
+                    idx.extend((ts, pos))
+                seg.write(line + b"\n")
+                pos += len(line) + 1
+                count += 1
+        with open(idx_tmp, "wb") as f:
+            idx.tofile(f)
+        os.replace(seg_tmp, self.seg_path)
+        os.replace(idx_tmp, self.idx_path)
+        m.update(seg_bytes=pos, count=count, idx_entries=len(idx) // 2)
+
+    def _rebuild(self, st: os.stat_result) -> None:
+        """External merge sort of the whole source into a fresh segment + index, with an empty tail."""
+        runs: List[Path] = []
+        run: List[Tuple[int, int, bytes]] = []
+        run_bytes, seq, last_ts, end = 0, 0, NO_TS, 0
+        tmp_dir = Path(tempfile.mkdtemp(prefix="seg_", dir=self.seg_path.parent))
+        try:
+            for ts, line, end in _timed_lines(self.source, 0, NO_TS):
+                run.append((ts, seq, line))
+                seq += 1
+                last_ts = ts
+                run_bytes += len(line) + 1
+                if run_bytes >= SORT_RUN_BYTES:
+                    runs.append(self._spill(run, tmp_dir / f"run{len(runs)}"))
+                    run, run_bytes = [], 0
+            run.sort(key=lambda r: (r[0], r[1]))
+            sources = [self._read_run(p) for p in runs] + [iter(run)]
+            merged = heapq.merge(*sources, key=lambda r: (r[0], r[1])) if len(sources) > 1 else sources[0]
+            max_ts = [NO_TS]
+
+            def _sorted() -> Iterator[Tuple[int, bytes]]:
+                for ts, _, line in merged:
+                    max_ts[0] = ts
+                    yield ts, line
+
+            m: Dict[str, Any] = {"version": SEGMENT_VERSION, "inode": st.st_ino, "dev": st.st_dev,
+                                 "source_offset": end, "source_ts": last_ts, "tail_lines": 0}
+            self._write_sorted(m, _sorted())
+            m["last_ts"] = m["max_ts"] = max_ts[0] if m["count"] else last_ts
+            self._write_tail([])
+            self._write_meta(m)
+        finally:
+            for p in tmp_dir.iterdir():
+                p.unlink()
+            tmp_dir.rmdir()
+
+    @staticmethod
+    def _spill(run: List[Tuple[int, int, bytes]], path: Path) -> Path:
+        run.sort(key=lambda r: (r[0], r[1]))
+        with open(path, "wb") as f:
+            for ts, seq, line in run:
+                f.write(b"%d %d %s\n" % (ts, seq, line))
+        return path
+
+    @staticmethod
+    def _read_run(path: Path) -> Iterator[Tuple[int, int, bytes]]:
+        with open(path, "rb") as f:
+            for raw in f:
+                ts, seq, line = raw.rstrip(b"\n").split(b" ", 2)
+                yield int(ts), int(seq), line
+
+    def _read_tail(self) -> List[Tuple[int, bytes]]:
+        try:
+            with open(self.tail_path, "rb") as f:
+                return [(int(ts), line) for ts, line in (raw.rstrip(b"\n").split(b" ", 1) for raw in f)]
+        except FileNotFoundError:
+            return []
+
+    def _write_tail(self, tail: List[Tuple[int, bytes]]) -> None:
+        tmp = self.tail_path.with_suffix(".tail.tmp")
+        with open(tmp, "wb") as f:
+            f.writelines(b"%d %s\n" % (ts, line) for ts, line in tail)
+        os.replace(tmp, self.tail_path)
+
+    def _write_meta(self, m: Dict[str, Any]) -> None:
+        m["seg_inode"] = self.seg_path.stat().st_ino
+        tmp = self.meta_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(m))
+        os.replace(tmp, self.meta_path)
+
+    # ---------------- reading (any process) ----------------
+    def _sync(self) -> None:
+        """Load the state the writer last published, if it changed since the previous call (lock held)."""
+        try:
+            st = self.meta_path.stat()
+        except OSError:
+            return
+        stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if stamp == self._meta_stamp:
+            return
+        m = self._read_meta()
+        if not m:
+            return
+        try:
+            if self.seg_path.stat().st_ino != m["seg_inode"]:
+                return   # segment replaced but not published yet: keep what we have
+            mm = None
+            if m["seg_bytes"]:
+                with open(self.seg_path, "rb") as f:
+                    mm = mmap.mmap(f.fileno(), m["seg_bytes"], access=mmap.ACCESS_READ)
+            idx = array("q")
+            with open(self.idx_path, "rb") as f:
+                idx.frombytes(f.read(m["idx_entries"] * 16))
+            tail = [(ts, line.decode("utf-8", errors="ignore")) for ts, line in self._read_tail()]
+        except (OSError, ValueError):
+            return
+        if self._mm is not None:
+            try:
+                self._mm.close()
+            except BufferError:
+                pass  # a caller still holds a window() view; the map is released with it
+        self._mm, self._ts, self._off, self._tail = mm, idx[0::2], idx[1::2], tail
+        self.meta, self._meta_stamp = m, stamp
+
+    def _offset_at(self, t_ms: int) -> int:
+        """Byte offset of the first line with ts >= t_ms (segment size if none)."""
+        mm = self._mm
+        if mm is None:
+            return 0
+        i = bisect_left(self._ts, t_ms)
+        pos = self._off[i - 1] if i > 0 else 0
+        stop = self._off[i] if i < len(self._off) else len(mm)
+        while pos < stop:
+            nl = mm.find(b"\n", pos, stop)
+            nl = stop if nl < 0 else nl
+            ts = line_ts_ms(mm[pos:min(nl, pos + 40)] + b" ")
+            if ts is not None and ts >= t_ms:
+                return pos
+            pos = nl + 1
+        return stop
+
+    def window(self, start_ms: int, end_ms: int) -> memoryview:
+        """Zero-copy view of the sorted segment's lines with start_ms <= ts <= end_ms (not the tail)."""
+        with self._lock:
+            self._sync()
+            if self._mm is None:
+                return memoryview(b"")
+            return memoryview(self._mm)[self._offset_at(start_ms):self._offset_at(end_ms + 1)]
+
+    def around(self, t_ms: int, delta_ms: int, max_lines: int) -> List[str]:
+        """Up to max_lines lines of [t - delta, t + delta] (segment and tail), centred on t."""
+        if max_lines <= 0:
+            return []
+        with self._lock:
+            self._sync()
+            main = self._main_around(t_ms, delta_ms, max_lines)
+            tail = [(ts, line) for ts, line in self._tail if t_ms - delta_ms <= ts <= t_ms + delta_ms]
+        if not tail:
+            return main
+        timed = [(ts, line) for ts, line in _with_ts((ln.encode("utf-8") for ln in main), t_ms - delta_ms)]
+        merged = list(heapq.merge([(ts, ln.decode("utf-8", errors="ignore")) for ts, ln in timed], tail,
+                                  key=lambda r: r[0]))
+        centre = bisect_left([ts for ts, _ in merged], t_ms)
+        start = max(0, min(centre - max_lines // 2, len(merged) - max_lines))
+        return [line for _, line in merged[start:start + max_lines]]
+
+    def _main_around(self, t_ms: int, delta_ms: int, max_lines: int) -> List[str]:
+        mm = self._mm
+        if mm is None:
+            return []
+        lo, mid, hi = self._offset_at(t_ms - delta_ms), self._offset_at(t_ms), self._offset_at(t_ms + delta_ms + 1)
+        a = mid
+        for _ in range(max_lines // 2):
+            if a <= lo:
+                break
+            a = mm.rfind(b"\n", lo, a - 1) + 1 or lo
+        a = max(a, lo)
+        b = mid
+        for _ in range(max_lines - max_lines // 2):
+            if b >= hi:
+                break
+            nl = mm.find(b"\n", b, hi)
+            b = hi if nl < 0 else nl + 1
+        return mm[a:b].decode("utf-8", errors="ignore").splitlines()
+
+    def time_range(self) -> Tuple[Optional[int], Optional[int]]:
+        with self._lock:
+            self._sync()
+            if not self.meta.get("count") and not self._tail:
+                return None, None
+            firsts = [t for t in (next((t for t in self._ts if t != NO_TS), None),
+                                  next((t for t, _ in self._tail if t != NO_TS), None)) if t is not None]
+            return (min(firsts) if firsts else None), self.meta.get("max_ts")
+
+
+class SegmentStore:
+    """
+    Segments for every *.log in a directory. refresh() is for the one ingesting process (it
+    takes a lock file in the segment directory, so a second writer waits instead of
+    interleaving appends); around() only reads what was last published.
+    """
+
+    def __init__(self, base_dir: Path, seg_dir: Optional[Path] = None):
+        self.base_dir = Path(base_dir)
+        if seg_dir is None:
+            seg_dir = SEGMENT_DIR / re.sub(r"\W+", "_", os.path.abspath(str(base_dir))).strip("_")[-80:]
+        self.seg_dir = Path(seg_dir)
+        self.seg_dir.mkdir(parents=True, exist_ok=True)
+        self._segments: Dict[str, Segment] = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def segment(self, fname: str) -> Segment:
+        with self._lock:
+            seg = self._segments.get(fname)
+            if seg is None:
+                seg = self._segments[fname] = Segment(self.base_dir / fname, self.seg_dir)
+            return seg
+
+    def refresh(self, files: Optional[List[str]] = None) -> None:
+        with self._write_lock, _file_lock(self.seg_dir / "writer.lock"):
+            for path in sorted(self.base_dir.glob("*.log")):
+                if files is not None and path.name not in files:
+                    continue
+                try:
+                    self.segment(path.name).refresh()
+                except OSError as e:
+                    print(f"log segments: {path.name} not refreshed: {e}")
+
+    def around(self, fname: str, t_ms: int, delta_ms: int, max_lines: int) -> List[str]:
+        return self.segment(fname).around(t_ms, delta_ms, max_lines)
+
+    def fingerprint(self, files: Iterable[str]) -> List[str]:
+        """The last published build state of the given logs' segments ("" parts for unbuilt ones)."""
+        out: List[str] = []
+        for fname in files:
+            m = self.segment(fname)._read_meta()
+            out.append(":".join(str(m.get(k, "")) for k in ("seg_inode", "inode", "source_offset", "count",
+                                                              "tail_lines", "seg_bytes")) + f":{fname}")
+        return out
+
+
+_STORES: Dict[str, SegmentStore] = {}
+_STORES_LOCK = threading.Lock()
+
+
+def get_segment_store(base_dir: Path) -> SegmentStore:
+    """Per-directory singleton. Does not refresh: the ingest loop does (see app.py)."""
+    key = os.path.abspath(str(base_dir))
+    with _STORES_LOCK:
+        store = _STORES.get(key)
+        if store is None:
+            store = _STORES[key] = SegmentStore(Path(key))
+    return store
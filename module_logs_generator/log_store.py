@@ -0,0 +1,305 @@
+import os
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from module_logs_generator.log_ingest import LogIngestService, LogRecord, get_log_ingest
+
+# --------------------------------------------------------------------------------------
+# Columnar, array-backed projection of the ingested log records: one typed array per
+# field (int64 epoch-ms, small dictionary codes for level/component/messageType/file/
+# corrId) plus side indexes token -> rows and corrId -> rows. A few bytes per field
+# instead of a dict per line; raw text stays in the ingest database and is only fetched
+# for result rows. Identifier and corrId lookups (rule fast path, traces) and
+# field + time-window queries are answered here.
+# --------------------------------------------------------------------------------------
+NO_TS = -1   # ts_ms of lines without a parsable timestamp
+
+
+class _Dictionary:
+    """String <-> small int code; code 0 stands for None."""
+
+    def __init__(self):
+        self.values: List[Optional[str]] = [None]
+        self.codes: Dict[str, int] = {}
+
+    def encode(self, value: Optional[str]) -> int:
+        if value is None:
+            return 0
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def lookup(self, value: str) -> Optional[int]:
+        return self.codes.get(value)
+
+
+@dataclass
+class StoreRow:
+    record_id: int
+    file: str
+    ts_ms: int
+    level: Optional[str]
+    component: Optional[str]
+    message_type: Optional[str]
+    corr_id: Optional[str]
+    line: Optional[str] = None
+
+
+class ColumnarLogStore:
+    """
+    Follows its ingester: every query first pulls the records ingested since the last one
+    (by this process or the writer, see LogIngestService.generation) and forgets the rows
+    the ingester pruned. Rows are appended in record id order; a time-sorted permutation is
+    rebuilt lazily after appends. Pruned rows stay as a dead prefix until they are half of
+    the columns, then the columns are compacted.
+    """
+
+    FIELDS = ("file", "level", "component", "message_type", "corr_id")
+
+    def __init__(self, ingest: LogIngestService):
+        self.ingest = ingest
+        self._lock = threading.RLock()
+        self._generation: Optional[int] = None
+        self._reset()
+
+    def _reset(self) -> None:
+        self.record_id = array("q")
+        self.ts_ms = array("q")
+        self.file = array("H")
+        self.level = array("B")
+        self.component = array("I")
+        self.message_type = array("I")
+        self.corr_id = array("I")
+        self.dicts = {name: _Dictionary() for name in self.FIELDS}
+        self.index: Dict[str, array] = {}           # token (upper-case) -> row numbers, ascending
+        self.corr_rows: Dict[int, array] = {}       # corr_id code -> row numbers, ascending
+        self._order = array("I")                    # live row numbers sorted by ts_ms
+        self._order_ts = array("q")                 # ts_ms in that order, for bisect
+        self._dirty = False
+        self._start = 0                             # rows below this were pruned by the ingester
+        self._last_record_id = 0
+
+    def __len__(self) -> int:
+        return len(self.ts_ms) - self._start
+
+    # ---------------- loading ----------------
+    def sync(self) -> int:
+        """Drop rows the ingester pruned, pull records ingested since the previous sync; returns rows added."""
+        added = 0
+        with self._lock:
+            lo, hi = self.ingest.record_id_range()
+            if hi is None or hi < self._last_record_id:   # emptied or recreated database
+                self._reset()
+            if lo is not None:
+                self._forget_before(lo)
+            d = self.dicts
+            for rows, tokens in self.ingest.export_since(self._last_record_id):
+                for rid, fname, ts, level, component, corr, mtype in rows:
+                    row = len(self.ts_ms)
+                    self.record_id.append(rid)
+                    self.ts_ms.append(NO_TS if ts is None else ts)
+                    self.file.append(d["file"].encode(fname))
+                    self.level.append(d["level"].encode(level))
+                    self.component.append(d["component"].encode(component))
+                    self.message_type.append(d["message_type"].encode(mtype))
+                    code = d["corr_id"].encode(corr)
+                    self.corr_id.append(code)
+                    if code:
+                        self.corr_rows.setdefault(code, array("I")).append(row)
+                    for tok in tokens.get(rid, ()):
+                        posting = self.index.get(tok)
+                        if posting is None:
+                            posting = self.index[tok] = array("I")
+                        posting.append(row)
+                self._last_record_id = rows[-1][0]
+                added += len(rows)
+            if added:
+                self._dirty = True
+        return added
+
+    def _forget_before(self, record_id: int) -> None:
+        """Mark the rows of records below `record_id` dead; compact once they are half the columns."""
+        start = bisect_left(self.record_id, record_id)
+        if start <= self._start:
+            return
+        self._start = start
+        self._dirty = True
+        if start * 2 < len(self.record_id):
+            return
+        for name in ("record_id", "ts_ms", "file", "level", "component", "message_type", "corr_id"):
+            setattr(self, name, getattr(self, name)[start:])
+        for postings in (self.index, self.corr_rows):
+            for key in list(postings):
+                kept = array("I", (r - start for r in postings[key] if r >= start))
+                if kept:
+                    postings[key] = kept
+                else:
+                    del postings[key]
+        self._start = 0
+
+    def _catch_up(self) -> None:
+        gen = self.ingest.generation
+        with self._lock:
+            if gen != self._generation:
+                self.sync()
+                self._generation = gen
+
+    def _ensure_order(self) -> None:
+        if not self._dirty:
+            return
+        ts = self.ts_ms
+        self._order = array("I", sorted(range(self._start, len(ts)), key=ts.__getitem__))
+        self._order_ts = array("q", (ts[i] for i in self._order))
+        self._dirty = False
+
+    # ---------------- queries ----------------
+    def query(
+        self,
+        start_ms: Optional[int] = None,
+        end_ms: Optional[int] = None,
+        token: Optional[str] = None,
+        files: Optional[Iterable[str]] = None,
+        limit: Optional[int] = None,
+        **equals: str,
+    ) -> List[int]:
+        """
+        Row numbers ordered by time. `token` uses the side index (corrId, cntr_no, REF-..., IMO,
+        vessel name, error code); `equals` filters on level / component / message_type / corr_id.
+        Rows without a timestamp never match a time range.
+        """
+        self._catch_up()
+        with self._lock:
+            want: Dict[str, int] = {}
+            for name, value in equals.items():
+                if name not in self.dicts or name == "file":
+                    raise ValueError(f"unknown field {name!r}")
+                code = self.dicts[name].lookup(value)
+                if code is None:
+                    return []
+                want[name] = code
+            file_codes = None
+            if files is not None:
+                file_codes = {c for c in (self.dicts["file"].lookup(f) for f in files) if c is not None}
+                if not file_codes:
+                    return []
+
+            timed = start_ms is not None or end_ms is not None
+            lo = NO_TS + 1 if start_ms is None else start_ms
+            hi = (1 << 62) if end_ms is None else end_ms
+            by_time = False   # candidates already in (ts, row) order
+            if token is not None:
+                candidates = self.index.get(token.upper(), array("I"))
+            elif "corr_id" in want:
+                candidates = self.corr_rows.get(want.pop("corr_id"), array("I"))
+            elif timed:
+                self._ensure_order()
+                a, b = bisect_left(self._order_ts, lo), bisect_right(self._order_ts, hi)
+                candidates, by_time = self._order[a:b], True
+            else:
+                candidates = range(self._start, len(self.ts_ms))
+
+            ts, start = self.ts_ms, self._start
+            columns = [(getattr(self, name), code) for name, code in want.items()]
+            out = [
+                r for r in candidates
+                if r >= start
+                and (not timed or lo <= ts[r] <= hi)
+                and (file_codes is None or self.file[r] in file_codes)
+                and all(col[r] == code for col, code in columns)
+            ]
+            if not by_time:
+                out.sort(key=lambda r: (ts[r], r))
+        return out[:limit] if limit is not None else out
+
+    def around(self, t_ms: int, window_ms: int, **kwargs) -> List[int]:
+        """query() over [t - window, t + window]."""
+        return self.query(start_ms=t_ms - window_ms, end_ms=t_ms + window_ms, **kwargs)
+
+    def rows(self, row_numbers: Iterable[int], with_lines: bool = True) -> List[StoreRow]:
+        """Decode rows (and fetch their raw lines from the ingest database)."""
+        d = self.dicts
+        with self._lock:
+            out = [
+                StoreRow(
+                    record_id=self.record_id[r],
+                    file=d["file"].values[self.file[r]],
+                    ts_ms=self.ts_ms[r],
+                    level=d["level"].values[self.level[r]],
+                    component=d["component"].values[self.component[r]],
+                    message_type=d["message_type"].values[self.message_type[r]],
+                    corr_id=d["corr_id"].values[self.corr_id[r]],
+                )
+                for r in row_numbers
+            ]
+        if with_lines and out:
+            records = self.ingest.records(r.record_id for r in out)
+            for r in out:
+                rec = records.get(r.record_id)
+                r.line = rec.line if rec is not None else None
+        return out
+
+    def records(self, row_numbers: List[int]) -> List[LogRecord]:
+        """The full ingested records of the rows, in the given order (rows pruned meanwhile are skipped)."""
+        with self._lock:
+            ids = [self.record_id[r] for r in row_numbers]
+        found = self.ingest.records(ids)
+        return [found[i] for i in ids if i in found]
+
+    def find_tokens(self, tokens: Iterable[str], files: Optional[Iterable[str]] = None,
+                    limit: int = 200) -> Dict[str, List[LogRecord]]:
+        """Records carrying each identifier token (cntr_no, REF-, corrId, IMO, vessel name ...), oldest first."""
+        files = None if files is None else list(files)
+        out: Dict[str, List[LogRecord]] = {}
+        with self._lock:   # row numbers stay valid until the records are fetched
+            for tok in tokens:
+                rows = self.query(token=tok, files=files, limit=limit)
+                if rows:
+                    out[tok.upper()] = self.records(rows)
+        return out
+
+    def by_corr_id(self, corr_ids: Iterable[str], files: Optional[Iterable[str]] = None,
+                   limit: int = 500) -> List[LogRecord]:
+        """Every record of the given corrIds, ordered by time."""
+        files = None if files is None else list(files)
+        rows: List[int] = []
+        with self._lock:
+            for corr_id in dict.fromkeys(corr_ids):
+                rows += self.query(files=files, corr_id=corr_id)
+            ts = self.ts_ms
+            rows.sort(key=lambda r: (ts[r], r))
+            return self.records(rows[:limit])
+
+    def memory_stats(self) -> Dict[str, float]:
+        """Bytes held by the columns and the side indexes (dictionaries excluded)."""
+        with self._lock:
+            cols = [self.record_id, self.ts_ms, self.file, self.level, self.component, self.message_type, self.corr_id]
+            column_bytes = sum(a.itemsize * len(a) for a in cols)
+            index_bytes = sum(a.itemsize * len(a) for idx in (self.index, self.corr_rows) for a in idx.values())
+            n = len(self)
+        return {
+            "rows": n,
+            "column_bytes": column_bytes,
+            "index_bytes": index_bytes,
+            "bytes_per_row": round((column_bytes + index_bytes) / n, 1) if n else 0.0,
+        }
+
+
+# One store per log directory, over that directory's ingester. Readers never poll: the
+# store only catches up with what the ingesting process has committed.
+_STORES: Dict[str, ColumnarLogStore] = {}
+_STORES_LOCK = threading.Lock()
+
+
+def get_log_store(base_dir: Path) -> ColumnarLogStore:
+    key = os.path.abspath(str(base_dir))
+    with _STORES_LOCK:
+        store = _STORES.get(key)
+        if store is None:
+            store = _STORES[key] = ColumnarLogStore(get_log_ingest(Path(key)))
+    return store
@@ -0,0 +1,177 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from module_logs_generator.log_index import EXACT_ID_KINDS, extract_tokens
+from module_logs_generator.log_ingest import LogRecord
+from module_logs_generator.log_store import ColumnarLogStore, get_log_store
+
+# --------------------------------------------------------------------------------------
+# Trace stitching: every ingested record carrying the same corrId, across all service
+# logs, ordered by timestamp, with the gap between hops and the durationMs the services
+# report. Incident identifiers (cntr_no, REF-..., corrId) are resolved to corrIds through
+# the columnar store's token index, so a lookup is a few in-memory postings, never a file scan.
+# --------------------------------------------------------------------------------------
+TRACE_MAX_TRACES   = int(os.environ.get("TRACE_MAX_TRACES", "5"))   # traces returned per incident
+TRACE_MAX_HOPS     = 50      # records kept per trace
+TRACE_DETAIL_CHARS = 160     # key=value text shown per hop
+TRACE_CACHE_SIZE   = 256     # stitched traces kept per directory (dropped whenever new records are ingested)
+
+BULKY_FIELDS = ("payloadDigest",)    # left out of the hop detail
+BARE_CORR_ID_RE = re.compile(r"^[0-9a-f]{12,32}$", re.I)   # corrIds as they appear in signals
+
+
+def _iso(ts_ms: Optional[int]) -> Optional[str]:
+    if ts_ms is None:
+        return None
+    return datetime.fromtimestamp(ts_ms / 1000, tz=timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+def _int_field(rec: LogRecord, key: str) -> Optional[int]:
+    try:
+        return int(rec.fields[key])
+    except (KeyError, ValueError):
+        return None
+
+
+def _detail(rec: LogRecord) -> str:
+    parts = [f"{k}={v}" for k, v in rec.fields.items() if k not in BULKY_FIELDS and k != "corrId"]
+    if rec.message:
+        parts.insert(0, rec.message)
+    text = " ".join(parts)
+    return text if len(text) <= TRACE_DETAIL_CHARS else text[:TRACE_DETAIL_CHARS - 3] + "..."
+
+
+def _is_error(rec: LogRecord) -> bool:
+    status = _int_field(rec, "httpStatus")
+    return rec.level in ("ERROR", "FATAL") or (status is not None and status >= 400)
+
+
+def stitch(corr_id: str, records: List[LogRecord]) -> Dict[str, Any]:
+    """One trace from the records of a corrId (already ordered by time)."""
+    hops: List[Dict[str, Any]] = []
+    start = next((r.ts_ms for r in records if r.ts_ms is not None), None)
+    prev = start
+    for rec in records[:TRACE_MAX_HOPS]:
+        hops.append({
+            "ts": rec.ts,
+            "file": rec.file,
+            "component": rec.component,
+            "level": rec.level,
+            "offset_ms": rec.ts_ms - start if rec.ts_ms is not None and start is not None else None,
+            "gap_ms": rec.ts_ms - prev if rec.ts_ms is not None and prev is not None else None,
+            "duration_ms": _int_field(rec, "durationMs"),
+            "error": _is_error(rec),
+            "detail": _detail(rec),
+        })
+        if rec.ts_ms is not None:
+            prev = rec.ts_ms
+    end = max((r.ts_ms for r in records if r.ts_ms is not None), default=None)
+    reported = [d for d in (_int_field(r, "durationMs") for r in records) if d is not None]
+    return {
+        "corr_id": corr_id,
+        "start": _iso(start),
+        "end": _iso(end),
+        "span_ms": end - start if start is not None and end is not None else None,
+        "reported_duration_ms": max(reported) if reported else None,
+        "files": list(OrderedDict.fromkeys(r.file for r in records)),
+        "components": list(OrderedDict.fromkeys(r.component for r in records if r.component)),
+        "error": any(h["error"] for h in hops),
+        "hop_count": len(records),
+        "hops": hops,
+    }
+
+
+class TraceIndex:
+    """
+    trace(corr_id) stitches one correlation id; for_incident(text, signals) resolves the
+    incident's identifiers to corrIds first. Stitched traces are cached until the ingester
+    has added records (its generation changed).
+    """
+
+    def __init__(self, store: ColumnarLogStore):
+        self.store = store
+        self.ingest = store.ingest
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._generation = store.ingest.generation
+        self._lock = threading.Lock()
+
+    def traces(self, corr_ids: Iterable[str]) -> List[Dict[str, Any]]:
+        """Stitched traces for the given corrIds (unknown ids are skipped), oldest first."""
+        wanted = list(OrderedDict.fromkeys(corr_ids))
+        with self._lock:
+            if self._generation != self.ingest.generation:
+                self._cache.clear()
+                self._generation = self.ingest.generation
+            found = {c: self._cache[c] for c in wanted if c in self._cache}
+        missing = [c for c in wanted if c not in found]
+        if missing:
+            grouped: Dict[str, List[LogRecord]] = {}
+            for rec in self.store.by_corr_id(missing, limit=TRACE_MAX_HOPS * len(missing) * 4):
+                grouped.setdefault(rec.corr_id, []).append(rec)
+            with self._lock:
+                for corr_id, records in grouped.items():
+                    found[corr_id] = self._cache[corr_id] = stitch(corr_id, records)
+                while len(self._cache) > TRACE_CACHE_SIZE:
+                    self._cache.popitem(last=False)
+        return sorted((found[c] for c in wanted if c in found), key=lambda t: t["start"] or "")
+
+    def trace(self, corr_id: str) -> Optional[Dict[str, Any]]:
+        out = self.traces([corr_id])
+        return out[0] if out else None
+
+    def corr_ids_for(self, text: str = "", signals: Optional[List[str]] = None) -> List[str]:
+        """corrIds of the records that carry the identifiers named in the incident text / signals."""
+        if isinstance(signals, str):
+            signals = [signals]
+        signals = [s for s in (signals or []) if isinstance(s, str)]
+        tokens = extract_tokens(" ".join([text or "", *signals]), kinds=EXACT_ID_KINDS)
+        corr_ids: List[str] = [s.strip() for s in signals if BARE_CORR_ID_RE.match(s.strip())]
+        for records in self.store.find_tokens(sorted(tokens)).values():
+            corr_ids.extend(r.corr_id for r in records if r.corr_id)
+        return list(OrderedDict.fromkeys(corr_ids))
+
+    def for_incident(self, text: str = "", signals: Optional[List[str]] = None,
+                     limit: int = TRACE_MAX_TRACES) -> List[Dict[str, Any]]:
+        """The stitched traces an incident points at; failing traces first, then newest."""
+        traces = self.traces(self.corr_ids_for(text, signals))
+        traces.sort(key=lambda t: t["start"] or "", reverse=True)
+        traces.sort(key=lambda t: not t["error"])
+        return traces[:limit]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"cached_traces": len(self._cache), "generation": self._generation}
+
+
+def format_trace(trace: Dict[str, Any]) -> str:
+    """Compact timeline, one line per hop, for the LLM context."""
+    head = f"corrId={trace['corr_id']} {trace['start']} span={trace['span_ms']}ms"
+    if trace["reported_duration_ms"] is not None:
+        head += f" durationMs={trace['reported_duration_ms']}"
+    head += f" files={','.join(trace['files'])}" + (" ERROR" if trace["error"] else "")
+    lines = [head]
+    for h in trace["hops"]:
+        off = "?" if h["offset_ms"] is None else f"+{h['offset_ms']}ms"
+        lines.append(f"  {off:>9} {h['level'] or '-':5} {h['component'] or '-'} [{h['file']}] {h['detail']}")
+    if trace["hop_count"] > len(trace["hops"]):
+        lines.append(f"  ... {trace['hop_count'] - len(trace['hops'])} more records")
+    return "\n".join(lines)
+
+
+# One trace index per log directory, over that directory's columnar store
+_INDEXES: Dict[str, TraceIndex] = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def get_trace_index(base_dir: Path) -> TraceIndex:
+    key = os.path.abspath(str(base_dir))
+    with _INDEXES_LOCK:
+        index = _INDEXES.get(key)
+        if index is None:
+            index = _INDEXES[key] = TraceIndex(get_log_store(Path(key)))
+    return index
@@ -1,11 +1,23 @@
-import os, json, re, base64, requests
+import os, json, re, base64, sqlite3, threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from pathlib import Path
 from typing import List, Dict, Any, Tuple, Optional
+from module_logs_generator.log_index import EXACT_ID_KINDS, extract_tokens
+from module_logs_generator.log_ingest import get_log_ingest
+from module_logs_generator.log_store import get_log_store
+from module_logs_generator.log_segments import get_segment_store, parse_time_ms
+from module_logs_generator.log_traces import format_trace, get_trace_index
+from module_logs_generator.completion_cache import get_completion_cache, make_key
+from module_logs_generator.context_packer import (Candidate, count_tokens, pack, record_packing, signal_hits,
+                                                  time_proximity, truncate_to_tokens, token_budget as deployment_budget)
+from module_logs_generator import http_client, metrics
+from module_logs_generator.singleflight import get_singleflight, normalize_text
 
-ENDPOINT        = "https://psacodesprint2025.azure-api.net"
+ENDPOINT        = os.environ.get("AZURE_OPENAI_ENDPOINT", "https://psacodesprint2025.azure-api.net")
 DEPLOYMENT_ID   = "gpt-4.1-mini"
 API_VERSION     = "2025-01-01-preview"
-API_KEY         = "ae8ca593ce0e4bf983cd8730fbc15df4"
+API_KEY         = os.environ.get("AZURE_OPENAI_API_KEY", "ae8ca593ce0e4bf983cd8730fbc15df4")
 
 RESPONSES_URL = f"{ENDPOINT}/openai/deployments/{DEPLOYMENT_ID}/responses?api-version={API_VERSION}"
 CHAT_URL      = f"{ENDPOINT}/openai/deployments/{DEPLOYMENT_ID}/chat/completions?api-version={API_VERSION}"
@@ -18,6 +30,36 @@ CATEGORY_TO_LOGS: Dict[str, List[str]] = {
     "EA":   ["api_event_service.log", "edi_adivce_service.log"],  
 }
 
+# Category-level hints to surface the most relevant lines
+HINTS: Dict[str, List[str]] = {
+    "CNTR": [r"\bcontainer\b", r"\bcntr[_-]?no\b", r"\bstatus\b",
+             r"\bgate[_ -]?in\b", r"\bgate[_ -]?out\b", r"\bload(ed|ing)?\b", r"\bdischarge(d|ing)?\b"],
+    "VS":   [r"\bvessel\b", r"\bIMO\b", r"\bvessel[_ -]?advice\b", r"\bberth\b", r"\bsystem[_ -]?vessel[_ -]?name\b"],
+    "EA":   [r"\bEDI\b", r"\bCOPARN\b", r"\bCOARRI\b", r"\bCODECO\b", r"\bIFTMIN\b", r"\bIFTMCS\b",
+             r"\bapi[-_\s]?event\b", r"\bhttp\b", r"\bcorrelation\b"],
+}
+
+# What the correlator sends per log: ranked windows around identifier hits from the local index
+CANDIDATE_MAX_HITS      = 20   # top-ranked matching lines kept per call
+CANDIDATE_CONTEXT_LINES = 2    # lines of context either side of a hit
+FALLBACK_TAIL_LINES     = 50   # no identifier hit and no incident time: send only the newest records of the log
+CORRELATION_WINDOW_MINUTES = int(os.environ.get("CORRELATION_WINDOW_MINUTES", "15"))   # +/- around the incident time
+WINDOW_MAX_LINES        = 60   # lines of the time window kept per log
+# Line relevance for the token budget (context_packer): identifiers of the report found in the
+# line, plus closeness to the incident time (0..1); identifier windows outrank plain time-window lines
+LINE_SIGNAL_WEIGHT      = 2.0
+HIT_LINE_BONUS          = 0.5
+
+INCIDENT_TS_RE = re.compile(r"\b\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:Z|[+-]\d{2}:?\d{2})?\b")
+
+def compile_hint_regexes(category: str, signals: List[str]) -> List[re.Pattern]:
+    regs: List[re.Pattern] = [re.compile(h, re.I) for h in HINTS.get(category, [])]
+    # Add short signal tokens that look like IDs/refs (e.g., CMAU..., REF-..., IFTMIN, COPARN, etc.)
+    for s in signals or []:
+        if isinstance(s, str) and 1 < len(s) <= 64 and re.search(r"[A-Z]{3,}\w*\d+|REF-|IFT|COPARN|CODECO|COARRI|IMO|MV", s, re.I):
+            regs.append(re.compile(re.escape(s), re.I))
+    return regs
+
 def _b64(path: Path) -> str:
     with open(path, "rb") as f:
         return base64.b64encode(f.read()).decode("utf-8")
@@ -37,7 +79,14 @@ You are a log correlation assistant.
 
 You will receive:
 - An INCIDENT REPORT (may be text or PDF content).
-- Several LOG FILES (raw text contents), each labeled by file name.
+- Several LOG FILES, each labeled by file name. Logs are sent as EXCERPTS: the lines
+  around identifiers found in the report (a "..." line marks skipped lines), followed by a
+  "--- lines within ±N min of <time> ---" section when the incident time is known. When
+  nothing in the report matched a log, you get only that time window, or else the newest
+  lines of the log.
+- Possibly TRACES: the records sharing a corrId with an identifier in the report, stitched
+  across ALL service logs and ordered by time ("+Nms" = time since the first record of the
+  trace, durationMs = what the service reported). Use them to follow one request end to end.
 
 Goal: Determine if the incident report REFERs TO (or is ABOUT) events that are present in ANY of the log files.
 
@@ -66,33 +115,204 @@ Rules:
 - No extra prose outside the JSON.
 """
 
+def _incident_time_ms(incident_report: str, incident_time: Optional[str] = None) -> Optional[int]:
+    """Epoch ms of the incident: the extracted timestamp, else the first ISO-like time in the text."""
+    t = parse_time_ms(incident_time)
+    if t is None:
+        m = INCIDENT_TS_RE.search(incident_report or "")
+        t = parse_time_ms(m.group(0)) if m else None
+    return t
+
+
+def _line_time_ms(line: str) -> Optional[int]:
+    return parse_time_ms(line.split(" ", 1)[0]) if line[:1].isdigit() else None
+
+
+def pack_log_excerpts(
+    incident_report: str,
+    log_paths: List[Path],
+    token_budget: int,
+    incident_time: Optional[str] = None,
+    signals: Optional[List[str]] = None,
+    max_chars_per_log: int = 400000,
+    prompt: str = "correlate",
+) -> Tuple[Dict[str, str], Dict[str, int]]:
+    """
+    Per existing log file, the candidate lines worth showing the model: windows around the
+    report's identifiers (cntr_no, corrId, REF-..., IMO, vessel names, error codes), found in
+    the ingested records' token index, plus the lines within CORRELATION_WINDOW_MINUTES of the incident
+    time (from the time-sorted log segments), or the newest ingested records when neither is
+    available. The lines of all logs compete for `token_budget` tokens (see context_packer):
+    identifier hits first, then closeness to the incident time. Returns the excerpts and the
+    packer's kept / dropped counts (also counted under `prompt` in context_tokens_total, unless "").
+    """
+    t_ms = _incident_time_ms(incident_report, incident_time)
+    delta_ms = CORRELATION_WINDOW_MINUTES * 60_000
+    blob = "\n".join([incident_report or ""] + [s for s in (signals or []) if isinstance(s, str)])
+    tokens = {t.lower() for t in extract_tokens(blob)}
+    candidates: List[Candidate] = []
+    window_headers: Dict[str, Tuple[int, str]] = {}
+    order = 0
+    for p in log_paths:
+        if not p.exists():
+            continue
+        try:
+            ingest = get_log_ingest(p.parent)
+            hit_lines = ingest.candidate_lines(
+                incident_report,
+                files=[p.name],
+                signals=signals,
+                context=CANDIDATE_CONTEXT_LINES,
+                max_hits=CANDIDATE_MAX_HITS,
+            ).get(p.name) or []
+            window: List[str] = []
+            if t_ms is not None:
+                seen = set(hit_lines)
+                window = [ln for ln in get_segment_store(p.parent).around(
+                    p.name, t_ms, delta_ms, WINDOW_MAX_LINES) if ln not in seen]
+            tail: List[str] = []
+            if not hit_lines and not window:
+                tail = [rec.line for rec in ingest.latest(p.name, FALLBACK_TAIL_LINES)]
+        except (OSError, sqlite3.Error) as e:
+            print(f"log excerpts: skipped {p.name}: {e}")
+            continue
+        for ln in hit_lines:
+            order += 1          # a "..." keeps the windows on either side non-adjacent
+            if ln != "...":
+                score = (HIT_LINE_BONUS + LINE_SIGNAL_WEIGHT * signal_hits(ln, tokens)
+                         + time_proximity(_line_time_ms(ln), t_ms, delta_ms))
+                candidates.append(Candidate(ln, score, order, p.name))
+        if window:
+            order += 1
+            at = datetime.fromtimestamp(t_ms / 1000, tz=timezone.utc).isoformat(timespec="seconds")
+            window_headers[p.name] = (order, f"--- lines within ±{CORRELATION_WINDOW_MINUTES} min of {at} ---")
+            for ln in window:
+                order += 1
+                score = LINE_SIGNAL_WEIGHT * signal_hits(ln, tokens) + time_proximity(_line_time_ms(ln), t_ms, delta_ms)
+                candidates.append(Candidate(ln, score, order, p.name))
+        for i, ln in enumerate(tail):
+            order += 1
+            candidates.append(Candidate(ln, (i + 1) / len(tail), order, p.name))   # newest first
+        order += 1
+
+    packed = pack(candidates, token_budget, DEPLOYMENT_ID, prompt=prompt)
+    excerpts: Dict[str, str] = {}
+    for name, items in packed.by_group().items():
+        header = window_headers.get(name)
+        lines: List[str] = []
+        prev = None
+        for c in items:
+            if header is not None and c.order > header[0]:
+                lines.append(header[1])
+                header, prev = None, c.order - 1
+            if prev is not None and c.order != prev + 1:
+                lines.append("...")
+            lines.append(c.text)
+            prev = c.order
+        excerpts[name] = "\n".join(lines)[:max_chars_per_log]
+    return excerpts, packed.stats()
+
+
+def build_log_excerpts(
+    incident_report: str,
+    log_paths: List[Path],
+    max_chars_per_log: int = 400000,
+    incident_time: Optional[str] = None,
+    token_budget: Optional[int] = None,
+    signals: Optional[List[str]] = None,
+) -> Dict[str, str]:
+    """pack_log_excerpts without the stats; `token_budget` defaults to half the deployment's budget."""
+    if token_budget is None:
+        token_budget = deployment_budget(DEPLOYMENT_ID) // 2
+    return pack_log_excerpts(incident_report, log_paths, token_budget, incident_time, signals, max_chars_per_log)[0]
+
+
 def cross_reference_with_openai_text_only(
     incident_report: str,
     log_paths: List[Path],
-    max_chars_per_log: int = 400000
+    max_chars_per_log: int = 400000,
+    incident_time: Optional[str] = None,
+    signals: Optional[List[str]] = None,
 ) -> Dict[str, Any]:
     """
     Ask OpenAI to decide if the incident report (text) refers to any of the provided logs.
-    Sends incident text + each log file content (capped) via the Responses API; falls back to chat if needed.
+    Sends incident text + a ranked excerpt of each log (see pack_log_excerpts) + the corrId
+    traces the report's identifiers lead to, via the Responses API; falls back to chat if needed.
+    Cached by report text, incident time, signals and the ingested state of the logs (see
+    _log_state), so a verdict is re-checked as soon as new lines have been ingested.
+    Concurrent calls for the same (normalized) report, signals and log versions share one request.
     Returns JSON: {refers_to_logs: bool, signals: [...], matched_logs: [{file, confidence, reasons}...]}
     """
-    # Build input content
-    contents = [{"type": "input_text", "text": XREF_PROMPT}]
-    contents.append({"type": "input_text", "text": f"INCIDENT REPORT (text):\n{incident_report[:200000]}"})
+    state = _log_state(log_paths)
+    key = make_key(DEPLOYMENT_ID, XREF_PROMPT,
+                   [incident_report, str(max_chars_per_log), incident_time or "", json.dumps(signals or []), state])
+    flight_key = make_key(DEPLOYMENT_ID, XREF_PROMPT,
+                          [normalize_text(incident_report), str(max_chars_per_log), incident_time or "",
+                           json.dumps(sorted(normalize_text(str(s)) for s in signals or [])), state])
+    return get_singleflight("correlate").do(flight_key, lambda: get_completion_cache().get_or_call(
+        key, lambda: _cross_reference_with_openai_text_only(
+            incident_report, log_paths, max_chars_per_log, incident_time, signals)))
 
-    # Attach logs as files (capped)
-    for p in log_paths:
-        # print("p exist or not: ", p)
-        if not p.exists():
-            continue
+
+def _log_state(log_paths: List[Path]) -> str:
+    """
+    What a correlation reads, for its cache key: the directory's ingest checkpoints (excerpt
+    hits and traces come from every ingested log) and the published segments of the
+    category's logs (time windows). Not the files' stat: they run ahead of the ingester.
+    """
+    parts: List[str] = [json.dumps(sorted(p.name for p in log_paths if p.exists()))]
+    for d in dict.fromkeys(p.parent for p in log_paths):
         try:
-            with open(p, "r", encoding="utf-8", errors="ignore") as f:
-                txt = f.read(max_chars_per_log)
-            data_b64 = base64.b64encode(txt.encode("utf-8")).decode("utf-8")
-        except Exception:
-            # last-resort raw bytes
-            data_b64 = _b64(p)
-        contents.append({"type": "input_text", "text": f"LOG FILE: {p.name}"})
+            parts += get_log_ingest(d).fingerprint()
+            parts += get_segment_store(d).fingerprint(p.name for p in log_paths if p.parent == d)
+        except (OSError, sqlite3.Error) as e:
+            parts.append(f"unreadable: {e}")
+    return "\n".join(parts)
+
+
+def build_trace_context(incident_report: str, base_dir: Path, signals: Optional[List[str]] = None) -> str:
+    """The stitched corrId traces for the incident as text ("" when its identifiers lead nowhere)."""
+    try:
+        traces = get_trace_index(base_dir).for_incident(incident_report, signals)
+    except (OSError, sqlite3.Error) as e:
+        print(f"trace context: skipped {base_dir}: {e}")
+        return ""
+    return "\n\n".join(format_trace(t) for t in traces)
+
+
+def _cross_reference_with_openai_text_only(
+    incident_report: str,
+    log_paths: List[Path],
+    max_chars_per_log: int,
+    incident_time: Optional[str] = None,
+    signals: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    budget = deployment_budget(DEPLOYMENT_ID)
+    report = f"INCIDENT REPORT (text):\n{truncate_to_tokens(incident_report, budget // 4, DEPLOYMENT_ID)}"
+    with metrics.span("correlate.traces"):
+        traces = build_trace_context(incident_report, log_paths[0].parent, signals) if log_paths else ""
+        traces = truncate_to_tokens(traces, budget // 4, DEPLOYMENT_ID)
+    log_budget = budget - sum(count_tokens(t, DEPLOYMENT_ID) for t in (XREF_PROMPT, report, traces))
+    with metrics.span("correlate.excerpts"):
+        excerpts, packing = pack_log_excerpts(incident_report, log_paths, log_budget, incident_time, signals,
+                                              max_chars_per_log)
+    result = _ask_correlator(XREF_PROMPT, report, excerpts, traces)
+    result["context"] = packing
+    return result
+
+
+def _ask_correlator(prompt: str, report_text: str, excerpts: Dict[str, str], traces: str) -> Dict[str, Any]:
+    """One correlation request: Responses API with the excerpts attached as files, chat/completions as fallback."""
+    # Build input content
+    contents = [{"type": "input_text", "text": prompt}]
+    contents.append({"type": "input_text", "text": report_text})
+    if traces:
+        contents.append({"type": "input_text", "text": f"TRACES:\n{traces}"})
+
+    # Attach log excerpts as files
+    for name, txt in excerpts.items():
+        data_b64 = base64.b64encode(txt.encode("utf-8")).decode("utf-8")
+        contents.append({"type": "input_text", "text": f"LOG FILE: {name}"})
         contents.append({"type": "input_file", "mime_type": "text/plain", "data": data_b64})
 
     # Try Responses API first
@@ -102,9 +322,11 @@ def cross_reference_with_openai_text_only(
         "response_format": {"type": "json_object"},
         "input": [{"role": "user", "content": contents}],
     }
-    r = requests.post(RESPONSES_URL, headers=HEADERS, data=json.dumps(body), timeout=240)
+    with metrics.span("correlate.llm"):
+        r = http_client.post(RESPONSES_URL, headers=HEADERS, data=json.dumps(body), timeout=240)
     if r.status_code == 200:
         data = r.json()
+        metrics.record_usage("correlate", data)
         text = data.get("output_text") or ""
         if not text:
             parts = (data.get("output", {}) or {}).get("content", [])
@@ -112,48 +334,354 @@ def cross_reference_with_openai_text_only(
         return _force_json(text)
 
     # Fallback: chat/completions with concatenated text
-    logs_concat = []
-    for p in log_paths:
-        if p.exists():
-            try:
-                with open(p, "r", encoding="utf-8", errors="ignore") as f:
-                    logs_concat.append(f"\n\n===== {p.name} =====\n" + f.read(max_chars_per_log))
-            except Exception:
-                pass
+    logs_concat = [f"\n\n===== {name} =====\n" + txt for name, txt in excerpts.items()]
     chat_body = {
         "model": DEPLOYMENT_ID,
         "temperature": 0.0,
         "response_format": {"type": "json_object"},
         "messages": [
             {"role": "system", "content": "You are a precise cross-referencer. Output strict JSON only."},
-            {"role": "user", "content": XREF_PROMPT},
-            {"role": "user", "content": f"INCIDENT REPORT:\n{incident_report[:200000]}"},
-            {"role": "user", "content": "LOG FILES:\n" + "\n".join(logs_concat)[:400000]},
+            {"role": "user", "content": prompt},
+            {"role": "user", "content": report_text},
+            {"role": "user", "content": "LOG FILES:\n" + truncate_to_tokens(
+                "\n".join(logs_concat), deployment_budget(DEPLOYMENT_ID), DEPLOYMENT_ID)},
         ],
     }
-    rc = requests.post(CHAT_URL, headers=HEADERS, data=json.dumps(chat_body), timeout=240)
+    if traces:
+        chat_body["messages"].append({"role": "user", "content": f"TRACES:\n{traces}"})
+    with metrics.span("correlate.llm"):
+        rc = http_client.post(CHAT_URL, headers=HEADERS, data=json.dumps(chat_body), timeout=240)
     rc.raise_for_status()
     resp = rc.json()
+    metrics.record_usage("correlate", resp)
     content = resp["choices"][0]["message"]["content"]
     return _force_json(content)
 
 
+# --------------------------------------------------------------------------------------
+# Deterministic fast path: exact identifiers found verbatim in the mapped logs
+# --------------------------------------------------------------------------------------
+RULE_CONFIDENCE      = 0.9    # an exact cntr_no / REF- / corrId hit
+RULE_HINT_CONFIDENCE = 0.97   # ... and the hit lines also match the category HINTS
+
+_VERDICT_SOURCES: Dict[str, int] = {"rules": 0, "llm": 0}
+_VERDICT_SOURCES_LOCK = threading.Lock()
+
+
+def _count_verdict_source(source: str) -> None:
+    with _VERDICT_SOURCES_LOCK:
+        _VERDICT_SOURCES[source] = _VERDICT_SOURCES.get(source, 0) + 1
+
+
+def verdict_source_stats() -> Dict[str, Any]:
+    """How many verdicts came from the rule stage vs the LLM, and the resulting bypass rate."""
+    with _VERDICT_SOURCES_LOCK:
+        counts = dict(_VERDICT_SOURCES)
+    total = sum(counts.values())
+    return {"counts": counts, "total": total, "llm_bypass_rate": (counts.get("rules", 0) / total) if total else 0.0}
+
+
+def rule_based_verdict(
+    category: str,
+    incident_report: str,
+    base_dir: Path,
+    signals: Optional[List[str]] = None,
+    incident_time: Optional[str] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Decide without the LLM when the case names a container number, EDI message ref or
+    corrId that appears verbatim in one of the category's logs. Returns a result in the
+    XREF_PROMPT shape, or None when the rules cannot decide (the LLM must then judge).
+    Only positive verdicts are made here: a missing ID does not prove the logs are unrelated.
+    Hits within CORRELATION_WINDOW_MINUTES of the incident time are counted in the reasons.
+    """
+    log_names = [f for f in CATEGORY_TO_LOGS.get(category, []) if (base_dir / f).exists()]
+    if not log_names:
+        return None
+    blob = "\n".join([incident_report or ""] + [s for s in (signals or []) if isinstance(s, str)])
+    ids = extract_tokens(blob, kinds=EXACT_ID_KINDS)
+    if not ids:
+        return None
+
+    # columnar projection of the ingested records (newest ingested lines included)
+    store = get_log_store(base_dir)
+    hits = store.find_tokens(sorted(ids), files=log_names)
+    t_ms = _incident_time_ms(incident_report, incident_time)
+    hints = compile_hint_regexes(category, signals or [])
+    matched: Dict[str, Dict[str, Any]] = {}
+    found: List[str] = []
+    for tok, records in sorted(hits.items()):
+        by_file: Dict[str, List[Any]] = {}
+        for rec in records:
+            by_file.setdefault(rec.file, []).append(rec)
+        for fname, recs in by_file.items():
+            found.append(tok)
+            m = matched.setdefault(fname, {"file": fname, "confidence": RULE_CONFIDENCE, "reasons": []})
+            reason = f"{tok} appears verbatim ({len(recs)} line(s))"
+            if t_ms is not None:
+                near = store.around(t_ms, CORRELATION_WINDOW_MINUTES * 60_000, token=tok, files=[fname])
+                if near:
+                    reason += f", {len(near)} within ±{CORRELATION_WINDOW_MINUTES} min of the incident"
+            m["reasons"].append(reason)
+            # Corroborate with the category hints on the hit lines
+            if any(r.search(rec.line) for rec in recs for r in hints):
+                m["confidence"] = RULE_HINT_CONFIDENCE
+    if not matched:
+        return None
+    return {
+        "refers_to_logs": True,
+        "signals": sorted(set(found)),
+        "matched_logs": list(matched.values()),
+        "verdict_source": "rules",
+    }
+
+
 def fetch_related_logs_with_openai_verdict(
     category: str,
     incident_report_text: str,
     base_dir: Path,
+    signals: Optional[List[str]] = None,
+    incident_time: Optional[str] = None,
 ) -> Tuple[bool, List[str], Dict[str, Any]]:
     """
+    Runs the rule-based fast path first and only asks the LLM when it cannot decide.
+    `incident_time` (ISO-8601, e.g. the extracted case timestamp) adds a time window to the excerpts.
     Returns:
       - verdict (bool): True if the incident refers to any system logs
       - matched_files (List[str]): list of log file names that match
-      - raw (Dict): raw JSON from the model
+      - raw (Dict): raw JSON from the rules or the model; "verdict_source" says which ("rules" | "llm")
     """
-    log_files = [base_dir / f for f in CATEGORY_TO_LOGS.get(category, [])]
-    result = cross_reference_with_openai_text_only(
-        incident_report=incident_report_text,
-        log_paths=log_files
-    )
+    with metrics.span("correlate.rules"):
+        result = rule_based_verdict(category, incident_report_text, base_dir, signals=signals,
+                                    incident_time=incident_time)
+    if result is None:
+        log_files = [base_dir / f for f in CATEGORY_TO_LOGS.get(category, [])]
+        result = cross_reference_with_openai_text_only(
+            incident_report=incident_report_text,
+            log_paths=log_files,
+            incident_time=incident_time,
+            signals=signals,
+        )
+        result["verdict_source"] = "llm"
+    return _verdict(result)
+
+
+def _verdict(result: Dict[str, Any]) -> Tuple[bool, List[str], Dict[str, Any]]:
+    _count_verdict_source(result["verdict_source"])
     matched = [m.get("file") for m in result.get("matched_logs", []) if m.get("file")]
     verdict = bool(result.get("refers_to_logs")) and len(matched) > 0
     return verdict, matched, result
+
+
+# --------------------------------------------------------------------------------------
+# Batched correlation: the cases of one upload that share a category are judged against
+# that category's logs in one call (log context sent once), split to fit a token budget
+# --------------------------------------------------------------------------------------
+# prompt tokens per batched call (0: the deployment's budget, see context_packer)
+BATCH_TOKEN_BUDGET = int(os.environ.get("CORRELATION_BATCH_TOKEN_BUDGET", "0")) or deployment_budget(DEPLOYMENT_ID)
+BATCH_MAX_CASES    = max(1, int(os.environ.get("CORRELATION_BATCH_MAX_CASES", "10")))
+BATCH_CONCURRENCY  = 4   # batches of one category sent at the same time
+
+BATCH_XREF_PROMPT = XREF_PROMPT.replace(
+    "- An INCIDENT REPORT (may be text or PDF content).",
+    "- Several numbered INCIDENT REPORTS ([0], [1], ...), judged independently against the same logs.",
+).replace(
+    "Goal: Determine if the incident report REFERs TO",
+    "Goal: For EACH incident report, determine if it REFERs TO",
+).replace(
+    """Output STRICT JSON ONLY with this exact shape:
+{
+  "refers_to_logs": true | false,""",
+    """Output STRICT JSON ONLY with this exact shape, one entry per report, "i" = its number:
+{"results": [{
+  "i": 0,
+  "refers_to_logs": true | false,""",
+).replace(
+    """      "reasons": ["short", "bullets"]
+    }
+  ]
+}""",
+    """      "reasons": ["short", "bullets"]
+    }
+  ]
+}]}""",
+)
+
+
+def _merge_excerpts(parts: List[Dict[str, str]], max_chars_per_log: int) -> Dict[str, str]:
+    """Per log, the union of the cases' excerpt lines (first occurrence order)."""
+    merged: Dict[str, List[str]] = {}
+    seen: Dict[str, set] = {}
+    for excerpts in parts:
+        for name, text in excerpts.items():
+            lines, known = merged.setdefault(name, []), seen.setdefault(name, set())
+            for ln in text.split("\n"):
+                if ln not in known or ln == "...":
+                    known.add(ln)
+                    lines.append(ln)
+    return {name: "\n".join(lines)[:max_chars_per_log] for name, lines in merged.items()}
+
+
+def _plan_batches(contexts: Dict[int, Dict[str, Any]], budget: int, max_cases: int) -> List[List[int]]:
+    """
+    Greedy split of the cases (by index, in order) into batches whose report text + merged excerpts +
+    distinct traces stay within `budget` tokens. A case that alone exceeds the budget gets its own batch.
+    """
+    batches: List[List[int]] = []
+    current: List[int] = []
+    seen: set = set()        # excerpt lines and trace texts already in the current batch
+    used = 0
+
+    def cost(ctx: Dict[str, Any], new_lines: set) -> int:
+        return (count_tokens(ctx["report"], DEPLOYMENT_ID)
+                + (count_tokens(ctx["traces"], DEPLOYMENT_ID) if ("", ctx["traces"]) in new_lines else 0)
+                + sum(count_tokens(ln, DEPLOYMENT_ID) + 1 for name, ln in new_lines if name))
+
+    for i, ctx in contexts.items():
+        lines = {(name, ln) for name, text in ctx["excerpts"].items() for ln in text.split("\n")}
+        lines.add(("", ctx["traces"]))   # the call sends identical traces once
+        c = cost(ctx, lines - seen)
+        if current and (used + c > budget or len(current) >= max_cases):
+            batches.append(current)
+            current, seen, used = [], set(), 0
+            c = cost(ctx, lines)
+        current.append(i)
+        seen |= lines
+        used += c
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _incident_block(i: int, incident: Dict[str, Any]) -> str:
+    head = f"[{i}]"
+    if incident.get("incident_time"):
+        head += f" (reported at {incident['incident_time']})"
+    report = truncate_to_tokens(incident.get("incident_report_text") or "", deployment_budget(DEPLOYMENT_ID) // 4,
+                                DEPLOYMENT_ID)
+    return f"{head}\n{report}"
+
+
+def _case_context(i: int, incident: Dict[str, Any], log_paths: List[Path], case_token_budget: int,
+                  max_chars_per_log: int = 400000) -> Dict[str, Any]:
+    """
+    Report block, packed excerpts (with their packing stats) and traces of one incident of a
+    batch. The traces are capped at a quarter of the deployment budget, as in the single call.
+    """
+    text = incident.get("incident_report_text") or ""
+    with metrics.span("correlate.excerpts"):
+        excerpts, packing = pack_log_excerpts(text, log_paths, case_token_budget, incident.get("incident_time"),
+                                              incident.get("signals"), max_chars_per_log, prompt="")
+    with metrics.span("correlate.traces"):
+        traces = build_trace_context(text, log_paths[0].parent, incident.get("signals")) if log_paths else ""
+        traces = truncate_to_tokens(traces, deployment_budget(DEPLOYMENT_ID) // 4, DEPLOYMENT_ID)
+    return {"report": _incident_block(i, incident), "excerpts": excerpts, "packing": packing, "traces": traces}
+
+
+def cross_reference_batch(
+    incidents: List[Dict[str, Any]],
+    log_paths: List[Path],
+    case_token_budget: int,
+    max_chars_per_log: int = 400000,
+    contexts: Optional[List[Dict[str, Any]]] = None,
+) -> List[Optional[Dict[str, Any]]]:
+    """
+    One call for several incidents against the same logs: each incident's excerpts (packed
+    into `case_token_budget` tokens) and traces are merged, so a log line shared by several
+    cases is sent once. `incidents` hold incident_report_text / signals / incident_time.
+    `contexts` are the per-incident excerpts / packing / traces when the caller already built
+    them (see _case_context); they are built here otherwise.
+    Returns one XREF_PROMPT-shaped result per incident, None where the model skipped one.
+    Cached (and coalesced) like the single call.
+    """
+    inputs = [json.dumps([inc.get("incident_report_text") or "", inc.get("incident_time") or "",
+                          inc.get("signals") or []], sort_keys=True) for inc in incidents]
+    key = make_key(DEPLOYMENT_ID, BATCH_XREF_PROMPT,
+                   [str(max_chars_per_log), str(case_token_budget), _log_state(log_paths)] + inputs)
+
+    def _call() -> List[Optional[Dict[str, Any]]]:
+        ctxs = contexts
+        if ctxs is None:
+            ctxs = [_case_context(i, inc, log_paths, case_token_budget, max_chars_per_log)
+                    for i, inc in enumerate(incidents)]
+        for ctx in ctxs:
+            record_packing("correlate", ctx["packing"])
+        excerpts = _merge_excerpts([ctx["excerpts"] for ctx in ctxs], max_chars_per_log)
+        packing = {k: sum(ctx["packing"][k] for ctx in ctxs) for k in ctxs[0]["packing"]}
+        traces = [ctx["traces"] for ctx in ctxs]
+        traces_text = "\n\n".join(dict.fromkeys(t for t in traces if t))
+        reports = "INCIDENT REPORTS:\n\n" + "\n\n".join(_incident_block(i, inc) for i, inc in enumerate(incidents))
+        data = _ask_correlator(BATCH_XREF_PROMPT, reports, excerpts, traces_text)
+        by_index: Dict[int, Dict[str, Any]] = {}
+        for item in data.get("results", []) if isinstance(data, dict) else []:
+            try:
+                i = int(item.pop("i"))
+            except (KeyError, TypeError, ValueError):
+                continue
+            if 0 <= i < len(incidents):
+                item["context"] = packing
+                by_index[i] = item
+        return [by_index.get(i) for i in range(len(incidents))]
+
+    return get_singleflight("correlate").do(key, lambda: get_completion_cache().get_or_call(key, _call))
+
+
+def fetch_related_logs_batch(
+    category: str,
+    incidents: List[Dict[str, Any]],
+    base_dir: Path,
+    token_budget: int = BATCH_TOKEN_BUDGET,
+    max_cases: int = BATCH_MAX_CASES,
+) -> List[Tuple[bool, List[str], Dict[str, Any]]]:
+    """
+    fetch_related_logs_with_openai_verdict for several cases of one category. Each incident
+    holds incident_report_text / signals / incident_time. The rule fast path runs per case;
+    the rest are correlated in batches (see cross_reference_batch) within `token_budget`
+    prompt tokens and `max_cases` cases each; every case gets an equal share of the budget
+    for its log lines. A case the model leaves out of its batch answer
+    is retried on its own. Results are in input order; raw["batch_size"] says how many cases
+    shared the call.
+    """
+    results: List[Optional[Dict[str, Any]]] = []
+    pending: List[int] = []
+    for i, inc in enumerate(incidents):
+        with metrics.span("correlate.rules"):
+            result = rule_based_verdict(category, inc.get("incident_report_text"), base_dir, signals=inc.get("signals"),
+                                        incident_time=inc.get("incident_time"))
+        results.append(result)
+        if result is None:
+            pending.append(i)
+
+    log_files = [base_dir / f for f in CATEGORY_TO_LOGS.get(category, [])]
+    case_budget = max(1, (token_budget - count_tokens(BATCH_XREF_PROMPT, DEPLOYMENT_ID)) // max_cases)
+
+    def single(i: int) -> Dict[str, Any]:
+        inc = incidents[i]
+        return cross_reference_with_openai_text_only(
+            incident_report=inc.get("incident_report_text"), log_paths=log_files,
+            incident_time=inc.get("incident_time"), signals=inc.get("signals"))
+
+    def run_batch(batch: List[int]) -> List[Tuple[int, Dict[str, Any], int]]:
+        if len(batch) == 1:
+            return [(batch[0], single(batch[0]), 1)]
+        answers = cross_reference_batch([incidents[i] for i in batch], log_files, case_budget,
+                                        contexts=[contexts[i] for i in batch])
+        return [(i, dict(a) if a is not None else single(i), len(batch) if a is not None else 1)
+                for i, a in zip(batch, answers)]
+
+    if pending:
+        with metrics.span("correlate.plan"):
+            contexts = {i: _case_context(i, incidents[i], log_files, case_budget) for i in pending}
+            batches = _plan_batches(contexts, token_budget, max_cases)
+        if len(batches) == 1:
+            done = [run_batch(batches[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=min(BATCH_CONCURRENCY, len(batches)),
+                                    thread_name_prefix="xref-batch") as pool:
+                done = list(pool.map(metrics.propagate(run_batch), batches))
+        for batch_results in done:
+            for i, result, size in batch_results:
+                result["verdict_source"] = "llm"
+                result["batch_size"] = size
+                results[i] = result
+    return [_verdict(r) for r in results]
@@ -0,0 +1,224 @@
+import contextvars
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# --------------------------------------------------------------------------------------
+# Process-wide counters / histograms in the Prometheus text format (GET /metrics), and
+# per-request traces: every span() adds to the stage histogram and, when a trace is
+# active in the current context, to that request's timings.
+# --------------------------------------------------------------------------------------
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self._values: Dict[LabelValues, float] = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.label_names)
+        with self._lock:
+            self._values[key] += amount
+
+    def value(self, **labels: str) -> float:
+        key = tuple(str(labels.get(n, "")) for n in self.label_names)
+        with self._lock:
+            return self._values.get(key, 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, v in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.label_names, key)} {_fmt(v)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = STAGE_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [count per bucket (+Inf last)], sum, count
+        self._series: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.label_names)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = ([0] * (len(self.buckets) + 1), [0.0, 0.0])
+            series[0][i] += 1
+            series[1][0] += value
+            series[1][1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, (total, n)) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, c in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += c
+                    le = "+Inf" if bound == float("inf") else _fmt(bound)
+                    bucket_labels = _labels(self.label_names, key, 'le="%s"' % le)
+                    lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_fmt(total)}")
+                lines.append(f"{self.name}_count{_labels(self.label_names, key)} {_fmt(n)}")
+        return lines
+
+
+_REGISTRY: List[Any] = []
+
+
+def register(metric):
+    _REGISTRY.append(metric)
+    return metric
+
+
+STAGE_SECONDS = register(Histogram(
+    "pipeline_stage_seconds", "Wall time of each pipeline stage.", ("stage",)))
+LLM_TOKENS = register(Counter(
+    "llm_tokens_total", "Tokens reported in the usage block of Azure OpenAI responses.", ("operation", "kind")))
+UPLOAD_BYTES = register(Counter(
+    "pipeline_upload_bytes_total", "Bytes received from clients (PDF uploads, case text).", ("endpoint",)))
+AZURE_BYTES = register(Counter(
+    "azure_http_bytes_total", "Request / response body bytes exchanged with Azure OpenAI.", ("endpoint", "direction")))
+AZURE_SECONDS = register(Histogram(
+    "azure_http_request_seconds", "Duration of each Azure OpenAI HTTP attempt (retries included).",
+    ("endpoint", "status")))
+CACHE_REQUESTS = register(Counter(
+    "cache_requests_total", "Lookups in the completion and embedding caches.", ("cache", "result")))
+REQUESTS = register(Histogram(
+    "http_server_request_seconds", "Duration of requests served by the API.", ("route", "status")))
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    lines: List[str] = []
+    for metric in _REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --------------------------------------------------------------------------------------
+# Per-request traces
+# --------------------------------------------------------------------------------------
+class Trace:
+    """Timings, token and cache counts of one request; shared by every thread working on it."""
+
+    def __init__(self, trace_id: Optional[str] = None):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.started = time.perf_counter()
+        self._stages: Dict[str, List[float]] = defaultdict(lambda: [0, 0.0])
+        self._counts: Dict[str, float] = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def add_span(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            s = self._stages[stage]
+            s[0] += 1
+            s[1] += seconds
+
+    def add(self, name: str, amount: float) -> None:
+        with self._lock:
+            self._counts[name] += amount
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Per stage: calls and total ms (stages of concurrent cases overlap, so they can exceed the wall time)."""
+        with self._lock:
+            return {
+                "trace_id": self.trace_id,
+                "elapsed_ms": round((time.perf_counter() - self.started) * 1000.0, 1),
+                "stages": {k: {"count": int(c), "total_ms": round(t * 1000.0, 1)} for k, (c, t) in sorted(self._stages.items())},
+                "counters": {k: v for k, v in sorted(self._counts.items())},
+            }
+
+
+_current: "contextvars.ContextVar[Optional[Trace]]" = contextvars.ContextVar("pipeline_trace", default=None)
+
+
+def start_trace(trace_id: Optional[str] = None) -> Trace:
+    """Make a new trace current for this context (and the tasks / propagated threads it starts)."""
+    trace = Trace(trace_id)
+    _current.set(trace)
+    return trace
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+def propagate(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """Wrap `fn` to run in (a copy of) the caller's context, for thread pools that do not copy it."""
+    ctx = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return ctx.copy().run(fn, *args, **kwargs)
+    return run
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        trace = _current.get()
+        if trace is not None:
+            trace.add_span(stage, elapsed)
+
+
+def count(metric: Counter, amount: float = 1.0, trace_name: Optional[str] = None, **labels: str) -> None:
+    """metric.inc(), and add the amount to the current trace under `trace_name` if given."""
+    metric.inc(amount, **labels)
+    trace = _current.get()
+    if trace is not None and trace_name:
+        trace.add(trace_name, amount)
+
+
+def record_usage(operation: str, response: Dict[str, Any]) -> None:
+    """Token counts from a chat/completions, responses or embeddings body ("usage")."""
+    usage = response.get("usage") or {}
+    prompt = usage.get("prompt_tokens", usage.get("input_tokens")) or 0
+    completion = usage.get("completion_tokens", usage.get("output_tokens")) or 0
+    if prompt:
+        count(LLM_TOKENS, prompt, "prompt_tokens", operation=operation, kind="prompt")
+    if completion:
+        count(LLM_TOKENS, completion, "completion_tokens", operation=operation, kind="completion")
+
+
+def record_cache(cache: str, hits: int, misses: int) -> None:
+    if hits:
+        count(CACHE_REQUESTS, hits, f"{cache}_cache_hits", cache=cache, result="hit")
+    if misses:
+        count(CACHE_REQUESTS, misses, f"{cache}_cache_misses", cache=cache, result="miss")
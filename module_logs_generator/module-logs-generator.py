@@ -4,20 +4,30 @@ import csv
 import json
 import base64
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Dict, List, Any
-import requests
+from module_logs_generator import http_client, metrics
 from module_logs_generator.logs import fetch_related_logs_with_openai_verdict
+from module_logs_generator.log_ingest import get_log_ingest
+from module_logs_generator.log_segments import get_segment_store
+from module_logs_generator.log_scanner import LineMatch, get_scanner, scan_file
+from module_logs_generator.completion_cache import get_completion_cache, make_key
+from module_logs_generator.singleflight import get_singleflight
 from module_logs_generator.ai_engine.rag_setup import RAG_chunk_data_producer
 
 
 
-ENDPOINT        = "https://psacodesprint2025.azure-api.net"
+ENDPOINT        = os.environ.get("AZURE_OPENAI_ENDPOINT", "https://psacodesprint2025.azure-api.net")
 DEPLOYMENT_ID   = "gpt-4.1-mini"
 API_VERSION     = "2025-01-01-preview"
-API_KEY         = "ae8ca593ce0e4bf983cd8730fbc15df4"
+API_KEY         = os.environ.get("AZURE_OPENAI_API_KEY", "ae8ca593ce0e4bf983cd8730fbc15df4")
 
 url = f"{ENDPOINT}/openai/deployments/{DEPLOYMENT_ID}/chat/completions?api-version={API_VERSION}"
+# Whole-PDF extraction (scans without a text layer) goes through the v1 Responses API, which
+# routes by "model" = deployment name and needs a newer api-version than chat/completions
+RESPONSES_API_VERSION = os.environ.get("AZURE_OPENAI_RESPONSES_API_VERSION", "2025-03-01-preview")
+RESPONSES_URL = f"{ENDPOINT}/openai/responses?api-version={RESPONSES_API_VERSION}"
 HEADERS  = {
     "Content-Type": "application/json",
     "api-key": API_KEY,
@@ -34,15 +44,6 @@ CATEGORY_TO_LOGS: Dict[str, List[str]] = {
     "EA":   ["api_event_service.log", "edi_adivce_service.log"],  # (name preserved as provided)
 }
 
-# Category-level hints to surface the most relevant lines
-HINTS: Dict[str, List[str]] = {
-    "CNTR": [r"\bcontainer\b", r"\bcntr[_-]?no\b", r"\bstatus\b",
-             r"\bgate[_ -]?in\b", r"\bgate[_ -]?out\b", r"\bload(ed|ing)?\b", r"\bdischarge(d|ing)?\b"],
-    "VS":   [r"\bvessel\b", r"\bIMO\b", r"\bvessel[_ -]?advice\b", r"\bberth\b", r"\bsystem[_ -]?vessel[_ -]?name\b"],
-    "EA":   [r"\bEDI\b", r"\bCOPARN\b", r"\bCOARRI\b", r"\bCODECO\b", r"\bIFTMIN\b", r"\bIFTMCS\b",
-             r"\bapi[-_\s]?event\b", r"\bhttp\b", r"\bcorrelation\b"],
-}
-
 # The prompt the model sees
 EXTRACTION_PROMPT = """\
 You are given a PDF of product support test cases.
@@ -57,6 +58,7 @@ Extract each distinct test case and output STRICT JSON ONLY:
       "summary": "1–3 sentences: scenario/goal + expected behavior",
       "signals": ["concrete keywords like container numbers, EDI types, 'berth', 'advice', 'gate in', 'load', 'discharge', etc."],
       "category": "CNTR|VS|EA",
+      "timestamp": "ISO-8601 time of the incident if stated (e.g. 2025-10-04T08:10:00Z), else null",
       "rationale": "a RAG-style search query or embedding prompt combining the incident description, category context, and key signals — written as a natural question or statement that can be used to retrieve related incidents, fixes, or procedures from historical data or the knowledge base"
     }
   ]
@@ -89,85 +91,166 @@ def _force_json(text: str) -> dict:
 
 def extract_cases_with_openai(pdf_path: Path) -> dict:
     """
-    Primary path: Azure OpenAI Responses API with input_file (PDF).
-    Fallback: local text extraction sent to chat if Responses isn't enabled.
+    Cached by PDF content: uploading the same PDF again skips the LLM (see completion_cache),
+    and concurrent uploads of the same PDF share one extraction.
     """
     if not pdf_path.exists():
         raise FileNotFoundError(f"PDF not found: {pdf_path}")
+    with open(pdf_path, "rb") as f:
+        key = make_key(DEPLOYMENT_ID, EXTRACTION_PROMPT, [f.read()])
+    return get_singleflight("extract").do(
+        key, lambda: get_completion_cache().get_or_call(key, lambda: _extract_cases_with_openai(pdf_path)))
 
-    # ---- Responses API payload with input_file (PDF as base64) ----
+def _extract_cases_with_openai(pdf_path: Path) -> dict:
+    """
+    Primary path: local per-page text, split on test-case boundaries into chunks that are
+    extracted concurrently and merged (see extract_cases_chunked) — nothing is truncated.
+    Fallback for PDFs without a text layer (scans): Responses API with the PDF as input_file.
+    """
+    try:
+        with metrics.span("extract.pdf_text"):
+            pages = _pdf_pages_text(pdf_path)
+    except Exception:
+        pages = []
+    if any(p.strip() for p in pages):
+        return extract_cases_chunked(pages)
+    return _extract_cases_from_pdf_file(pdf_path)
+
+class PdfNotReadable(ValueError):
+    """The PDF has no text layer and the whole-file Responses extraction did not work either."""
+
+
+def _extract_cases_from_pdf_file(pdf_path: Path) -> dict:
+    # ---- Responses API payload with input_file (PDF as a base64 data URL) ----
     body = {
-        "model": DEPLOYMENT_ID,      # harmless; routing via deployment in URL
+        "model": DEPLOYMENT_ID,      # the deployment name: routes the request
         "temperature": 0.0,
-        "response_format": {"type": "json_object"},
+        "text": {"format": {"type": "json_object"}},
         "input": [{
             "role": "user",
             "content": [
                 {"type": "input_text", "text": EXTRACTION_PROMPT},
                 {
                     "type": "input_file",
-                    "mime_type": "application/pdf",
-                    "data": _b64(pdf_path)
+                    "filename": pdf_path.name,
+                    "file_data": f"data:application/pdf;base64,{_b64(pdf_path)}",
                 }
             ]
         }]
     }
 
-    r = requests.post(url, headers=HEADERS, data=json.dumps(body), timeout=180)
-    if r.status_code == 200:
-        data = r.json()
-        # Responses API returns a convenience string at top-level sometimes:
-        # prefer the flattened output text if present
-        content_text = data.get("output_text")
-        if not content_text:
-            # or assemble from content parts
-            parts = (data.get("output", {}) or {}).get("content", [])
-            content_text = "".join(p.get("text","") for p in parts if p.get("type") in ("output_text","text"))
-        parsed = _force_json(content_text)
-        if "cases" not in parsed or not isinstance(parsed["cases"], list):
-            raise ValueError("Extractor did not return a 'cases' array.")
-        return parsed
-
-    # ---------------- Fallback path (if 400/404 etc.) ----------------
-    # If your gateway doesn’t enable Responses yet, we’ll extract text locally and
-    # send that as plain text to chat/completions (no file upload).
-    # (Uses pdfminer.six if available; otherwise PyPDF2.)
-    try:
-        try:
-            from pdfminer.high_level import extract_text as _pdf_text
-            pdf_text = _pdf_text(str(pdf_path))
-        except Exception:
-            from PyPDF2 import PdfReader
-            pdf_text = "\n".join((p.extract_text() or "") for p in PdfReader(str(pdf_path)).pages)
-    except Exception as e:
-        raise RuntimeError(f"Responses API not available (status {r.status_code}), and PDF local extraction failed: {e}\nBody: {r.text}")
-
-    # call chat/completions with the extracted text
-    CHAT_URL = f"{ENDPOINT}/openai/deployments/{DEPLOYMENT_ID}/chat/completions?api-version={API_VERSION}"
-    chat_body = {
-        "model": DEPLOYMENT_ID,
-        "temperature": 0.0, 
-        "response_format": {"type": "json_object"},
-        "messages": [
-            {"role": "system", "content": "You are a precise extractor that outputs strict JSON only."},
-            {"role": "user", "content": EXTRACTION_PROMPT},
-            {"role": "user", "content": pdf_text[:200000]}  # hard cap to avoid token overflow
-        ]
-    }
-    rc = requests.post(CHAT_URL, headers=HEADERS, data=json.dumps(chat_body), timeout=180)
-    rc.raise_for_status()
-    data = rc.json()
-    content = data["choices"][0]["message"]["content"]
-    parsed = _force_json(content)
+    with metrics.span("extract.llm"):
+        r = http_client.post(RESPONSES_URL, headers=HEADERS, data=json.dumps(body), timeout=180)
+    if r.status_code != 200:
+        raise PdfNotReadable(f"PDF has no extractable text and the Responses API rejected it "
+                             f"(status {r.status_code}): {r.text[:500]}")
+    data = r.json()
+    metrics.record_usage("extract", data)
+    # Responses API returns a convenience string at top-level sometimes:
+    # prefer the flattened output text if present
+    content_text = data.get("output_text")
+    if not content_text:
+        # or assemble from the message items' content parts
+        content_text = "".join(p.get("text", "") for item in data.get("output") or [] if isinstance(item, dict)
+                               for p in item.get("content") or [] if p.get("type") in ("output_text", "text"))
+    parsed = _force_json(content_text)
     if "cases" not in parsed or not isinstance(parsed["cases"], list):
         raise ValueError("Extractor did not return a 'cases' array.")
     return parsed
 
+# --------------------------------------------------------------------------------------
+# Page-aware chunking for large PDFs
+# --------------------------------------------------------------------------------------
+EXTRACT_CHUNK_CHARS  = int(os.environ.get("EXTRACT_CHUNK_CHARS", "6000"))   # target text per extraction call
+EXTRACT_CONCURRENCY  = max(1, int(os.environ.get("EXTRACT_CONCURRENCY", "4")))
+# "Test Case 3 (...)", "TC-03:", "Test case #3" at the start of a line
+CASE_BOUNDARY_RE = re.compile(r"^[ \t]*(?:test[ \t]*case|tc)[ \t#:.-]*\d+\b", re.I | re.M)
+
+def _pdf_pages_text(pdf_path: Path) -> List[str]:
+    """Text of each page (empty strings for pages without a text layer)."""
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        from PyPDF2 import PdfReader
+    return [(p.extract_text() or "") for p in PdfReader(str(pdf_path)).pages]
+
+def _split_case_blocks(pages: List[str]) -> List[str]:
+    """One block per test case (text before the first boundary joins the first block); pages if no boundaries."""
+    text = "\n".join(pages)
+    starts = [m.start() for m in CASE_BOUNDARY_RE.finditer(text)]
+    if not starts:
+        return [p for p in pages if p.strip()]
+    starts[0] = 0
+    return [text[a:b] for a, b in zip(starts, starts[1:] + [len(text)]) if text[a:b].strip()]
+
+def _pack_chunks(blocks: List[str], max_chars: int) -> List[str]:
+    """Greedily pack whole blocks into chunks of <= max_chars; an oversized block is cut on line breaks."""
+    pieces: List[str] = []
+    for b in blocks:
+        while len(b) > max_chars:
+            cut = b.rfind("\n", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            pieces.append(b[:cut])
+            b = b[cut:]
+        pieces.append(b)
+    chunks: List[str] = []
+    cur = ""
+    for piece in pieces:
+        if cur and len(cur) + len(piece) > max_chars:
+            chunks.append(cur)
+            cur = ""
+        cur += piece if not cur else "\n" + piece
+    if cur.strip():
+        chunks.append(cur)
+    return chunks
+
+def _case_key(value: Any) -> str:
+    return re.sub(r"\W+", " ", str(value or "")).strip().lower()
+
+def _merge_cases(per_chunk: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    Concatenate in document order, dropping repeats of the same (id, title) — a case cut
+    across two chunks comes back from both. Ids still clashing afterwards are renumbered.
+    """
+    seen = set()
+    merged: List[Dict[str, Any]] = []
+    for cases in per_chunk:
+        for c in cases:
+            key = (_case_key(c.get("id")), _case_key(c.get("title")))
+            if key in seen:
+                continue
+            seen.add(key)
+            merged.append(c)
+    used = set()
+    for i, c in enumerate(merged, 1):
+        if not c.get("id") or c["id"] in used:
+            c["id"] = f"TC-{i:02d}"
+            while c["id"] in used:
+                c["id"] += "b"
+        used.add(c["id"])
+    return merged
+
+def extract_cases_chunked(pages: List[str], max_chars: int = EXTRACT_CHUNK_CHARS) -> dict:
+    """Run EXTRACTION_PROMPT over case-aligned chunks concurrently (each cached by its text) and merge."""
+    chunks = _pack_chunks(_split_case_blocks(pages), max_chars)
+    if len(chunks) == 1:
+        return extract_cases_from_text(chunks[0])
+    note = "(Part {i} of {n} of a larger document. Keep test case numbers exactly as written.)\n\n"
+    inputs = [note.format(i=i, n=len(chunks)) + c for i, c in enumerate(chunks, 1)]
+    with ThreadPoolExecutor(max_workers=min(EXTRACT_CONCURRENCY, len(inputs)), thread_name_prefix="extract") as pool:
+        results = list(pool.map(metrics.propagate(extract_cases_from_text), inputs))
+    return {"cases": _merge_cases([r.get("cases", []) for r in results]), "chunks": len(chunks)}
+
 def extract_cases_from_text(input_text: str) -> dict:
     """
     Extract structured cases directly from a text string using Azure OpenAI.
-    (Bypasses PDF extraction entirely.)
+    (Bypasses PDF extraction entirely.) Cached by input text; identical concurrent calls share one request.
     """
+    key = make_key(DEPLOYMENT_ID, EXTRACTION_PROMPT, [input_text])
+    return get_singleflight("extract").do(
+        key, lambda: get_completion_cache().get_or_call(key, lambda: _extract_cases_from_text(input_text)))
+
+def _extract_cases_from_text(input_text: str) -> dict:
     CHAT_URL = f"{ENDPOINT}/openai/deployments/{DEPLOYMENT_ID}/chat/completions?api-version={API_VERSION}"
 
     chat_body = {
@@ -181,10 +264,12 @@ def extract_cases_from_text(input_text: str) -> dict:
         ]
     }
 
-    response = requests.post(CHAT_URL, headers=HEADERS, data=json.dumps(chat_body), timeout=180)
+    with metrics.span("extract.llm"):
+        response = http_client.post(CHAT_URL, headers=HEADERS, data=json.dumps(chat_body), timeout=180)
     response.raise_for_status()
 
     data = response.json()
+    metrics.record_usage("extract", data)
     content = data["choices"][0]["message"]["content"]
     parsed = _force_json(content)
 
@@ -198,32 +283,21 @@ def extract_cases_from_text(input_text: str) -> dict:
 # --------------------------------------------------------------------------------------
 # Log search (category hints + dynamic signals)
 # --------------------------------------------------------------------------------------
-def compile_hint_regexes(category: str, signals: List[str]) -> List[re.Pattern]:
-    regs: List[re.Pattern] = [re.compile(h, re.I) for h in HINTS.get(category, [])]
-    # Add short signal tokens that look like IDs/refs (e.g., CMAU..., REF-..., IFTMIN, COPARN, etc.)
-    for s in signals or []:
-        if isinstance(s, str) and 1 < len(s) <= 64 and re.search(r"[A-Z]{3,}\w*\d+|REF-|IFT|COPARN|CODECO|COARRI|IMO|MV", s, re.I):
-            regs.append(re.compile(re.escape(s), re.I))
-    return regs
-
-
-def fetch_related_logs(category: str, signals: List[str], base_dir: Path, max_lines: int) -> Dict[str, List[str]]:
-    out: Dict[str, List[str]] = {}
+def fetch_related_logs_attributed(category: str, signals: List[str], base_dir: Path, max_lines: int) -> Dict[str, List[LineMatch]]:
+    """Like fetch_related_logs, but each line comes with the hint/signal patterns that matched it."""
+    scanner = get_scanner(category, signals)
+    out: Dict[str, List[LineMatch]] = {}
     for fname in CATEGORY_TO_LOGS.get(category, []):
         path = base_dir / fname
-        matches: List[str] = []
-        if path.exists():
-            regs = compile_hint_regexes(category, signals)
-            with open(path, "r", encoding="utf-8", errors="ignore") as f:
-                for line in f:
-                    if any(r.search(line) for r in regs):
-                        matches.append(line.rstrip("\n"))
-                        if len(matches) >= max_lines:
-                            break
-        out[fname] = matches
+        out[fname] = list(scan_file(path, scanner, max_lines)) if scanner and path.exists() else []
     return out
 
 
+def fetch_related_logs(category: str, signals: List[str], base_dir: Path, max_lines: int) -> Dict[str, List[str]]:
+    hits = fetch_related_logs_attributed(category, signals, base_dir, max_lines)
+    return {fname: [m.line for m in matches] for fname, matches in hits.items()}
+
+
 # --------------------------------------------------------------------------------------
 # Output helpers
 # --------------------------------------------------------------------------------------
@@ -287,7 +361,9 @@ def main():
     print(f"Found {len(cases)} case(s) in {pdf_path}.")
     
 
-    # 2) For each case, fetch logs and print
+    # 2) For each case, fetch logs and print (ingest what was appended to the logs first)
+    get_log_ingest(log_dir).poll()
+    get_segment_store(log_dir).refresh()
     for i, c in enumerate(cases, 1):
         print_case(i, c)
         # log_hits = fetch_related_logs(c.get("category", ""), c.get("signals") or [], log_dir, MAX_LINES)
@@ -297,6 +373,8 @@ def main():
             category=c.get("category", ""),
             incident_report_text=c.get("title"),
             base_dir=log_dir,
+            signals=c.get("signals"),
+            incident_time=c.get("timestamp"),
         )
         # print_log_hits(log_hits)
         # print("rationale is ->", c.get("rationale"))
@@ -305,7 +383,7 @@ def main():
         # print("Details        ->", json.dumps(details, indent=2))
 
         # RAG solution
-        rag_result = RAG_chunk_data_producer(c.get("title"))
+        rag_result = RAG_chunk_data_producer(c.get("title"), c.get("category"))
         c["rag_suggestion"] = rag_result["rag_suggestion"]
         c["rag_sources"] = rag_result["sources"]
 
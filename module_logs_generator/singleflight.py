@@ -0,0 +1,93 @@
+import copy
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from module_logs_generator import metrics
+
+# --------------------------------------------------------------------------------------
+# Single-flight: while a call for a key is running, identical calls (other cases of the
+# same upload, other users' requests) wait for it and share its result instead of
+# sending their own request upstream. Nothing is kept once the call returns; the
+# completion cache covers repeats after that.
+# --------------------------------------------------------------------------------------
+COALESCED_CALLS = metrics.register(metrics.Counter(
+    "singleflight_coalesced_total", "Calls that waited for an identical in-flight call instead of running.", ("group",)))
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """Case- and whitespace-insensitive form of a report / query, for coalescing keys."""
+    return " ".join((text or "").split()).casefold()
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.coalesced = 0
+        self._in_flight: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """
+        fn() once per key at a time. Waiters get a deep copy of the leader's result (callers
+        may mutate it) or the leader's exception.
+        """
+        with self._lock:
+            self.calls += 1
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self._in_flight[key] = _Call()
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+        if not leader:
+            metrics.count(COALESCED_CALLS, 1, "coalesced_calls", group=self.name)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+                shared = call.waiters > 0
+            call.done.set()
+        return copy.deepcopy(call.result) if shared else call.result
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"calls": self.calls, "coalesced": self.coalesced, "in_flight": len(self._in_flight)}
+
+
+_groups: Dict[str, SingleFlight] = {}
+_groups_lock = threading.Lock()
+
+
+def get_singleflight(name: str) -> SingleFlight:
+    """One SingleFlight per call site ("extract", "correlate", "rag"), shared by every thread in the process."""
+    with _groups_lock:
+        group = _groups.get(name)
+        if group is None:
+            group = _groups[name] = SingleFlight(name)
+        return group
+
+
+def singleflight_stats() -> Dict[str, Dict[str, int]]:
+    with _groups_lock:
+        groups = list(_groups.values())
+    return {g.name: g.stats() for g in groups}
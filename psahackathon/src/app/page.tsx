@@ -487,6 +487,25 @@ useEffect(() => {
     .catch(err => console.error("Error fetching:", err));
 }, []);
 
+// Yields one parsed event per line of an application/x-ndjson response body
+async function* readNdjson(body: ReadableStream<Uint8Array>) {
+  const reader = body.getReader();
+  const decoder = new TextDecoder();
+  let buf = "";
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buf += decoder.decode(value, { stream: true });
+    let nl;
+    while ((nl = buf.indexOf("\n")) >= 0) {
+      const line = buf.slice(0, nl).trim();
+      buf = buf.slice(nl + 1);
+      if (line) yield JSON.parse(line);
+    }
+  }
+  if (buf.trim()) yield JSON.parse(buf);
+}
+
 const extractSummary = (resp: any) =>
   resp?.results?.find((r: any) => r?.case?.summary)?.case.summary
   ?? "No summary found";
@@ -508,9 +527,10 @@ const handleAnalyzeAndCreate = async (severity: Severity) => {
     const extracted = simulateAIExtraction(rawInput);
     mark(0);
 
-    // step 2: backend RAG
+    // step 2: backend pipeline, streamed — the case list arrives first, then
+    // each case's verdict / RAG suggestion as soon as it is ready
     const res = await fetchWithTimeout(
-      "http://localhost:8000/pipeline/import-text",
+      "http://localhost:8000/pipeline/import-text/stream",
       {
         method: "POST",
         headers: { "Content-Type": "application/json" },
@@ -520,9 +540,25 @@ const handleAnalyzeAndCreate = async (severity: Severity) => {
       60000 // 60s timeout
     );
 
-    if (!res.ok) throw new Error(`Backend returned ${res.status}`);
-    setData(await res.json());
-    console.log("Extraction result:", data);
+    if (!res.ok || !res.body) throw new Error(`Backend returned ${res.status}`);
+    const events = readNdjson(res.body);
+    const first = await events.next();
+    if (first.done || first.value.event !== "cases") throw new Error("Unexpected stream start");
+    const cases: any[] = first.value.cases ?? [];
+    // same shape as /pipeline/import-text: results[] holds case entries and RAG entries
+    let streamed: any = { ok: true, results: cases.map((c: any) => ({ case: c })) };
+    setData(streamed);
+    void (async () => {
+      for await (const ev of events) {
+        if (ev.event === "verdict" || ev.event === "rag") {
+          const { event, index, ...entry } = ev;
+          streamed = { ...streamed, results: [...streamed.results, entry] };
+          setData(streamed);
+        } else if (ev.event === "error") {
+          console.error(`Pipeline ${ev.stage} failed for case ${ev.index}:`, ev.detail);
+        }
+      }
+    })().catch(err => console.error("Pipeline stream error:", err));
     mark(1);
 
     // step 3: create incident locally/Firestore
@@ -532,7 +568,7 @@ const handleAnalyzeAndCreate = async (severity: Severity) => {
       title: extracted.title || "New Incident",
       module: extracted.module || "General",
       severity,
-      description: extractSummary(data),
+      description: extractSummary(streamed),
       assignee: extracted.assignee || "Ops Team Duty",
       containerId: extracted.containerId || undefined,
       vessel: extracted.vessel || undefined,
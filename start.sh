@@ -1,5 +1,10 @@
 #!/usr/bin/env bash
+# --preload imports the app (and its heavy libraries) once in the master; workers are forked
+# from it and share those pages. Each worker opens Chroma and serves requests; the first one to
+# lock WRITER_LOCK_PATH also ingests the knowledge base, tails the logs and runs the job queue.
+export PRELOAD_HEAVY_IMPORTS=${PRELOAD_HEAVY_IMPORTS:-1}
 gunicorn app:app \
   -k uvicorn.workers.UvicornWorker \
   --bind 0.0.0.0:${PORT:-8000} \
-  --workers 2 --threads 8 --timeout 120
+  --workers 2 --threads 8 --timeout 120 \
+  --preload
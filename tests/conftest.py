@@ -0,0 +1,19 @@
+import os
+import tempfile
+
+# Keep every on-disk state file of the modules under test out of the source tree. The
+# modules read these at import time, so they are set before any test module imports them.
+_STATE_DIR = tempfile.mkdtemp(prefix="mlg_tests_")
+for _name, _path in {
+    "COMPLETION_CACHE_PATH": "completion_cache.sqlite3",
+    "LOG_INGEST_DIR": "log_ingest",
+    "LOG_SEGMENT_DIR": "log_segments",
+    "JOB_DB_PATH": "jobs.sqlite3",
+    "CATEGORIZE_STATE_PATH": "categorize_state.sqlite3",
+    "EMBEDDING_CACHE_PATH": "embedding_cache.sqlite3",
+    "CHROMA_PATH": "chroma_db",
+    "WRITER_LOCK_PATH": "writer.lock",
+    "JOB_UPLOAD_DIR": "job_uploads",
+}.items():
+    os.environ.setdefault(_name, os.path.join(_STATE_DIR, _path))
+os.environ.setdefault("COMPLETION_CACHE_BACKEND", "memory")
@@ -0,0 +1,42 @@
+import os
+
+from module_logs_generator.completion_cache import CompletionCache, MemoryBackend, make_key
+
+
+def test_key_depends_on_every_input():
+    base = make_key("gpt", "prompt", ["a", "b"])
+    assert make_key("gpt", "prompt", ["a", "b"]) == base
+    assert make_key("other", "prompt", ["a", "b"]) != base
+    assert make_key("gpt", "prompt v2", ["a", "b"]) != base
+    assert make_key("gpt", "prompt", ["a", "c"]) != base
+    assert make_key("gpt", "prompt", ["b", "a"]) != base
+
+
+def test_key_changes_when_a_file_changes(tmp_path):
+    log = tmp_path / "svc.log"
+    log.write_text("line 1\n")
+    key = make_key("gpt", "prompt", ["report"], files=[log])
+    assert make_key("gpt", "prompt", ["report"], files=[log]) == key
+
+    with open(log, "a") as f:            # size changes
+        f.write("line 2\n")
+    grown = make_key("gpt", "prompt", ["report"], files=[log])
+    assert grown != key
+
+    st = log.stat()                      # same size, new mtime
+    os.utime(log, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    assert make_key("gpt", "prompt", ["report"], files=[log]) != grown
+
+
+def test_missing_files_are_ignored(tmp_path):
+    assert make_key("gpt", "p", ["x"], files=[tmp_path / "nope.log"]) == make_key("gpt", "p", ["x"])
+
+
+def test_cache_get_or_call_uses_the_key():
+    cache = CompletionCache(MemoryBackend())
+    calls = []
+    fn = lambda: calls.append(1) or {"answer": len(calls)}
+    assert cache.get_or_call("k1", fn) == {"answer": 1}
+    assert cache.get_or_call("k1", fn) == {"answer": 1}
+    assert cache.get_or_call("k2", fn) == {"answer": 2}
+    assert len(calls) == 2
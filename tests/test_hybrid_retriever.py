@@ -0,0 +1,63 @@
+from module_logs_generator.ai_engine.hybrid_retriever import HybridRetriever, allowed_categories, tokenize
+
+
+class FakeCollection:
+    """The slice of the Chroma collection API the retriever uses; dense ranking = shared terms."""
+
+    def __init__(self, docs):
+        self.ids = [d[0] for d in docs]
+        self.documents = [d[1] for d in docs]
+        self.metadatas = [{"category": d[2]} for d in docs]
+
+    def count(self):
+        return len(self.ids)
+
+    def get(self, include=None):
+        return {"ids": self.ids, "documents": self.documents, "metadatas": self.metadatas}
+
+    def query(self, query_texts, n_results, include=None):
+        terms = set(tokenize(query_texts[0]))
+        order = sorted(range(len(self.ids)), key=lambda i: (-len(terms & set(tokenize(self.documents[i]))), i))
+        order = order[:n_results]
+        return {"ids": [[self.ids[i] for i in order]],
+                "documents": [[self.documents[i] for i in order]],
+                "metadatas": [[self.metadatas[i] for i in order]],
+                "distances": [[1.0 / (1 + rank) for rank in range(len(order))]]}
+
+
+DOCS = [
+    ("edi-1", "COPARN message rejected by EDI parser", "EDI_ERRORS"),
+    ("edi-2", "CODECO ack missing for container", "EDI_ERRORS, DATA_SYNC"),
+    ("api-1", "API gateway timeout on container event", "API_FAILURES"),
+    ("vsl-1", "Vessel advice conflict for vessel name", "VESSEL_CONFLICTS"),
+    ("kb-1", "General escalation guidelines for container issues", "GENERAL_GUIDELINES"),
+]
+
+
+def test_category_filter_keeps_fitting_documents():
+    retriever = HybridRetriever(FakeCollection(DOCS), category_filter=True)
+    hits = retriever.search("container EDI message", k=3, category="EA")
+    assert {h.id for h in hits} <= {"edi-1", "edi-2", "api-1", "kb-1"}
+    assert len(hits) == 3
+
+
+def test_category_filter_falls_back_when_too_few_fit():
+    retriever = HybridRetriever(FakeCollection(DOCS), category_filter=True)
+    # VS fits vsl-1 and the guidelines only: fewer than min(k, CATEGORY_MIN_HITS) -> unfiltered ranking
+    hits = retriever.search("container EDI message", k=4, category="VS")
+    unfiltered = HybridRetriever(FakeCollection(DOCS), category_filter=False).search("container EDI message", k=4)
+    assert [h.id for h in hits] == [h.id for h in unfiltered]
+    assert any(h.id.startswith("edi") for h in hits)
+
+
+def test_unknown_category_is_not_filtered():
+    assert allowed_categories("nope") is None
+    retriever = HybridRetriever(FakeCollection(DOCS), category_filter=True)
+    hits = retriever.search("vessel conflict", k=5, category="nope")
+    assert len(hits) == 5
+
+
+def test_lexical_side_finds_exact_identifiers():
+    docs = DOCS + [("ref-1", "Duplicate REF-IFT-0007 in inbound queue", "EDI_ERRORS")]
+    retriever = HybridRetriever(FakeCollection(docs), mode="bm25")
+    assert retriever.search("what happened to REF-IFT-0007", k=1)[0].id == "ref-1"
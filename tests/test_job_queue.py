@@ -0,0 +1,70 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from module_logs_generator.job_queue import DONE, QUEUED, RUNNING, JobQueue, QueueFull
+
+
+def _dead_pid():
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    return proc.pid
+
+
+def _wait_for(queue, job_id, status, timeout=10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get(job_id)
+        if job["status"] == status:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} still {queue.get(job_id)['status']}")
+
+
+def _mark_running(queue, job_id, pid):
+    queue._db.execute("UPDATE jobs SET status=?, started_at=?, owner_pid=? WHERE id=?",
+                      (RUNNING, time.time(), pid, job_id))
+
+
+def test_orphaned_running_jobs_are_requeued_on_start(tmp_path):
+    queue = JobQueue(tmp_path / "jobs.sqlite3", workers=1)
+    queue.register("echo", lambda ctx, payload: payload)
+    orphan = queue.submit("echo", {"n": 1})
+    alive = queue.submit("echo", {"n": 2})
+    _mark_running(queue, orphan, _dead_pid())      # its process died mid-job
+    _mark_running(queue, alive, os.getpid())       # still owned by a live process
+
+    queue.start()
+    try:
+        assert _wait_for(queue, orphan, DONE)["result"] == {"n": 1}
+        assert queue.get(alive)["status"] == RUNNING
+    finally:
+        queue.stop(5)
+
+
+def test_restarted_queue_finishes_jobs_of_a_dead_process(tmp_path):
+    first = JobQueue(tmp_path / "jobs.sqlite3", workers=1)
+    first.register("echo", lambda ctx, payload: payload)
+    job_id = first.submit("echo", {"n": 3})
+    _mark_running(first, job_id, _dead_pid())
+
+    second = JobQueue(tmp_path / "jobs.sqlite3", workers=1)
+    second.register("echo", lambda ctx, payload: payload)
+    second.start()
+    try:
+        assert _wait_for(second, job_id, DONE)["result"] == {"n": 3}
+    finally:
+        second.stop(5)
+
+
+def test_submit_is_bounded_by_the_queue_depth(tmp_path):
+    queue = JobQueue(tmp_path / "jobs.sqlite3", workers=1, max_depth=2)
+    queue.register("echo", lambda ctx, payload: payload)
+    queue.submit("echo", {})
+    queue.submit("echo", {})
+    with pytest.raises(QueueFull):
+        queue.submit("echo", {})
+    assert queue.stats()[QUEUED] == 2
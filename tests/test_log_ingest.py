@@ -0,0 +1,94 @@
+import json
+import os
+
+from module_logs_generator.log_ingest import LogIngestService
+
+
+def _line(i, tag="svc"):
+    return f"2025-10-09T08:{i // 60:02d}:{i % 60:02d}.000Z INFO  {tag} Event seq={i} correlation_id=corr-{i:04d}\n"
+
+
+def _seqs(ingest, fname="app.log"):
+    rows = ingest._db.execute("SELECT fields FROM records WHERE file=? ORDER BY id", (fname,)).fetchall()
+    return [int(json.loads(f)["seq"]) for (f,) in rows]
+
+
+def _service(tmp_path):
+    log_dir = tmp_path / "logs"
+    log_dir.mkdir()
+    return log_dir, LogIngestService(log_dir, tmp_path / "ingest.sqlite3")
+
+
+def test_only_appended_lines_are_ingested(tmp_path):
+    log_dir, ingest = _service(tmp_path)
+    log = log_dir / "app.log"
+    log.write_text("".join(_line(i) for i in range(5)))
+    assert ingest.poll() == {"app.log": 5}
+    assert ingest.poll() == {}
+
+    with open(log, "a") as f:
+        f.write(_line(5) + _line(6) + "2025-10-09T08:00:07.000Z INFO  svc partial")   # no newline yet
+    assert ingest.poll() == {"app.log": 2}
+    with open(log, "a") as f:
+        f.write(" seq=7\n")
+    assert ingest.poll() == {"app.log": 1}
+    assert _seqs(ingest) == list(range(8))
+
+
+def test_resume_from_checkpoint_after_restart(tmp_path):
+    log_dir, ingest = _service(tmp_path)
+    log = log_dir / "app.log"
+    log.write_text("".join(_line(i) for i in range(3)))
+    ingest.poll()
+    with open(log, "a") as f:
+        f.write(_line(3))
+
+    restarted = LogIngestService(log_dir, tmp_path / "ingest.sqlite3")
+    assert restarted.poll() == {"app.log": 1}
+    assert _seqs(restarted) == [0, 1, 2, 3]
+
+
+def test_truncation_starts_a_new_epoch(tmp_path):
+    log_dir, ingest = _service(tmp_path)
+    log = log_dir / "app.log"
+    log.write_text("".join(_line(i) for i in range(4)))
+    ingest.poll()
+
+    log.write_text(_line(10))            # truncated in place: same inode, smaller size
+    assert ingest.poll() == {"app.log": 1}
+    with open(log, "a") as f:
+        f.write(_line(11))
+    assert ingest.poll() == {"app.log": 1}
+    assert _seqs(ingest) == [0, 1, 2, 3, 10, 11]
+    (epoch,) = ingest._db.execute("SELECT epoch FROM checkpoints WHERE file='app.log'").fetchone()
+    assert epoch == 1
+
+
+def test_rotation_finishes_the_old_file_then_reads_the_new_one(tmp_path):
+    log_dir, ingest = _service(tmp_path)
+    log = log_dir / "app.log"
+    log.write_text("".join(_line(i) for i in range(3)))
+    ingest.poll()
+
+    with open(log, "a") as f:            # written just before the rotation, never polled
+        f.write(_line(3))
+    os.rename(log, log_dir / "app.log.1")
+    log.write_text(_line(4) + _line(5))
+    assert ingest.poll() == {"app.log": 3}
+    assert _seqs(ingest) == [0, 1, 2, 3, 4, 5]
+
+    with open(log, "a") as f:
+        f.write(_line(6))
+    assert ingest.poll() == {"app.log": 1}
+    assert _seqs(ingest) == list(range(7))
+
+
+def test_generation_moves_when_records_are_added(tmp_path):
+    log_dir, ingest = _service(tmp_path)
+    (log_dir / "app.log").write_text(_line(0))
+    g = ingest.generation
+    ingest.poll()
+    assert ingest.generation != g
+    g = ingest.generation
+    ingest.poll()
+    assert ingest.generation == g
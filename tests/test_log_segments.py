@@ -0,0 +1,53 @@
+from module_logs_generator import log_segments
+from module_logs_generator.log_segments import Segment, line_ts_ms
+
+
+def _line(sec, seq):
+    return f"2025-10-09T08:{sec // 60:02d}:{sec % 60:02d}.000Z INFO  svc Event seq={seq}\n"
+
+
+def _segment_ts(seg):
+    return [line_ts_ms(raw + b" ") for raw in seg.seg_path.read_bytes().splitlines()]
+
+
+def test_late_lines_are_merged_in_time_order(tmp_path, monkeypatch):
+    monkeypatch.setattr(log_segments, "REORDER_WINDOW_MS", 0)
+    monkeypatch.setattr(log_segments, "LATE_MAX_LINES", 2)
+    log = tmp_path / "app.log"
+    log.write_text("".join(_line(s, s) for s in range(0, 100, 10)))
+    seg_dir = tmp_path / "seg"
+    seg_dir.mkdir()
+    seg = Segment(log, seg_dir)
+    assert seg.refresh()
+
+    merges = []
+    merge_late = Segment._merge_late
+    monkeypatch.setattr(Segment, "_merge_late", lambda self, m, late: merges.append(len(late)) or merge_late(self, m, late))
+
+    # lines older than the segment's end arrive late, beyond LATE_MAX_LINES: merged into the segment
+    with open(log, "a") as f:
+        f.write(_line(15, 100) + _line(35, 101) + _line(5, 102) + _line(120, 103))
+    assert seg.refresh()
+
+    assert merges == [3]
+    m = seg._read_meta()
+    assert (m["count"], m["tail_lines"]) == (14, 0)
+    ts = _segment_ts(seg)
+    assert len(ts) == 14 and ts == sorted(ts)
+    seqs = [ln.rsplit("=", 1)[-1] for ln in seg.seg_path.read_text().splitlines()]
+    assert seqs == ["0", "102", "10", "100", "20", "30", "101", "40", "50", "60", "70", "80", "90", "103"]
+
+
+def test_window_reads_only_the_requested_range(tmp_path, monkeypatch):
+    monkeypatch.setattr(log_segments, "REORDER_WINDOW_MS", 0)
+    log = tmp_path / "app.log"
+    log.write_text("".join(_line(s, s) for s in (30, 10, 20, 0, 40)))   # out of order on disk
+    seg_dir = tmp_path / "seg"
+    seg_dir.mkdir()
+    seg = Segment(log, seg_dir)
+    seg.refresh()
+
+    t0 = line_ts_ms(_line(0, 0).encode())
+    view = seg.window(t0 + 10_000, t0 + 30_000)
+    assert [ln.rsplit("=", 1)[-1] for ln in bytes(view).decode().splitlines()] == ["10", "20", "30"]
+    view.release()
@@ -0,0 +1,50 @@
+from module_logs_generator.log_ingest import LogIngestService
+from module_logs_generator.log_store import ColumnarLogStore
+
+
+def _line(i, level="INFO"):
+    corr = f"corr-{i % 3}"
+    return f"2025-10-09T08:{i // 60:02d}:{i % 60:02d}.000Z {level:5} svc Event seq={i} cntr_no=MSCU{i:07d} correlation_id={corr}\n"
+
+
+def _store(tmp_path, n):
+    log_dir = tmp_path / "logs"
+    log_dir.mkdir()
+    (log_dir / "app.log").write_text("".join(_line(i, "ERROR" if i % 5 == 0 else "INFO") for i in range(n)))
+    ingest = LogIngestService(log_dir, tmp_path / "ingest.sqlite3")
+    ingest.poll()
+    return log_dir, ingest, ColumnarLogStore(ingest)
+
+
+def test_lookups_match_the_ingested_records(tmp_path):
+    _, ingest, store = _store(tmp_path, 30)
+    hits = store.find_tokens(["MSCU0000007", "MSCU9999999"])
+    assert list(hits) == ["MSCU0000007"]
+    assert [r.fields["seq"] for r in hits["MSCU0000007"]] == ["7"]
+
+    trace = store.by_corr_id(["corr-1"])
+    assert [int(r.fields["seq"]) for r in trace] == list(range(1, 30, 3))
+
+    t10 = trace[3].ts_ms   # seq 10
+    rows = store.around(t10, 5000, level="ERROR")
+    assert [store.records([r])[0].fields["seq"] for r in rows] == ["5", "10", "15"]
+
+
+def test_store_follows_appends_and_pruning(tmp_path):
+    log_dir, ingest, store = _store(tmp_path, 10)
+    assert len(store.query()) == 10
+
+    with open(log_dir / "app.log", "a") as f:
+        f.write(_line(10) + _line(11))
+    ingest.poll()
+    assert len(store.query()) == 12     # caught up through the ingester's generation
+
+    ingest._prune(max_records=8)
+    store.sync()
+    assert len(store) == 8 and store._start == 4          # dead prefix, not compacted yet
+    assert store.find_tokens(["MSCU0000002"]) == {}
+    ingest._prune(max_records=3)
+    store.sync()
+    assert len(store) == 3 and store._start == 0          # compacted
+    assert [r.fields["seq"] for r in store.find_tokens(["MSCU0000011"])["MSCU0000011"]] == ["11"]
+    assert store.memory_stats()["rows"] == 3
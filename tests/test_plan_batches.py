@@ -0,0 +1,60 @@
+import random
+
+from module_logs_generator.context_packer import count_tokens
+from module_logs_generator.logs import DEPLOYMENT_ID, _plan_batches
+
+
+def _ctx(report, excerpts=None, traces=""):
+    return {"report": report, "excerpts": excerpts or {}, "traces": traces}
+
+
+def _batch_cost(contexts, batch):
+    """Tokens the batch call sends: every report, each distinct excerpt line and trace text once."""
+    lines = {(name, ln) for i in batch for name, text in contexts[i]["excerpts"].items() for ln in text.split("\n")}
+    traces = {contexts[i]["traces"] for i in batch}
+    return (sum(count_tokens(contexts[i]["report"], DEPLOYMENT_ID) for i in batch)
+            + sum(count_tokens(t, DEPLOYMENT_ID) for t in traces)
+            + sum(count_tokens(ln, DEPLOYMENT_ID) + 1 for _, ln in lines))
+
+
+def _random_contexts(seed, n=40):
+    rng = random.Random(seed)
+    shared = [f"2025-10-09T08:00:{s:02d}Z ERROR svc shared line {s}" for s in range(30)]
+    contexts = {}
+    for i in range(n):
+        lines = rng.sample(shared, rng.randint(0, 10)) + [f"own line {i} {'x' * rng.randint(0, 200)}"]
+        traces = rng.choice(["", "corrId=abc hop 1\n  +5ms hop 2", f"corrId={i:04x} own trace"])
+        contexts[i] = _ctx(f"[{i}] report " + "word " * rng.randint(5, 80),
+                           {rng.choice(["a.log", "b.log"]): "\n".join(lines)}, traces)
+    return contexts
+
+
+def test_batches_cover_every_case_in_order():
+    contexts = _random_contexts(1)
+    batches = _plan_batches(contexts, budget=800, max_cases=6)
+    assert [i for b in batches for i in b] == list(contexts)
+
+
+def test_batches_stay_within_budget_and_case_limit():
+    for seed in range(20):
+        contexts = _random_contexts(seed)
+        for budget in (200, 800, 3000):
+            for batch in _plan_batches(contexts, budget=budget, max_cases=5):
+                assert len(batch) <= 5
+                if len(batch) > 1:
+                    assert _batch_cost(contexts, batch) <= budget, (seed, budget, batch)
+
+
+def test_oversized_case_gets_its_own_batch():
+    contexts = {0: _ctx("small"), 1: _ctx("huge " * 2000), 2: _ctx("small")}
+    assert _plan_batches(contexts, budget=100, max_cases=10) == [[0], [1], [2]]
+
+
+def test_shared_lines_and_traces_are_counted_once():
+    excerpt = {"a.log": "\n".join(f"shared line {n} " + "y" * 40 for n in range(20))}
+    trace = "corrId=abc " + "hop " * 100
+    contexts = {i: _ctx(f"report {i}", excerpt, trace) for i in range(4)}
+    one = _batch_cost(contexts, [0])
+    # four copies would not fit, but the call sends the lines and the trace once
+    assert 4 * one > one + 100
+    assert _plan_batches(contexts, budget=one + 100, max_cases=10) == [[0, 1, 2, 3]]
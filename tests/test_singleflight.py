@@ -0,0 +1,97 @@
+import threading
+import time
+
+import pytest
+
+from module_logs_generator.singleflight import SingleFlight, get_singleflight, normalize_text
+
+
+def test_concurrent_identical_calls_run_once():
+    group = SingleFlight("test")
+    release = threading.Event()
+    calls, results = [], []
+
+    def fn():
+        calls.append(1)
+        release.wait(5)
+        return {"cases": [1, 2]}
+
+    def caller():
+        results.append(group.do("same", fn))
+
+    threads = [threading.Thread(target=caller) for _ in range(8)]
+    for t in threads:
+        t.start()
+    deadline = time.time() + 5
+    while group.stats()["coalesced"] < 7 and time.time() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for t in threads:
+        t.join(10)
+
+    assert len(calls) == 1
+    assert results == [{"cases": [1, 2]}] * 8
+    # every caller gets its own copy
+    assert len({id(r) for r in results}) == 8
+    assert group.stats() == {"calls": 8, "coalesced": 7, "in_flight": 0}
+
+
+def test_leader_error_reaches_every_waiter():
+    group = SingleFlight("test-errors")
+    release = threading.Event()
+    errors = []
+
+    def fn():
+        release.wait(5)
+        raise RuntimeError("upstream down")
+
+    def caller():
+        try:
+            group.do("same", fn)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=caller) for _ in range(4)]
+    for t in threads:
+        t.start()
+    deadline = time.time() + 5
+    while group.stats()["coalesced"] < 3 and time.time() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for t in threads:
+        t.join(10)
+    assert errors == ["upstream down"] * 4
+
+    # the failed flight is gone: the next call runs again
+    assert group.do("same", lambda: "ok") == "ok"
+
+
+def test_different_keys_do_not_coalesce():
+    group = SingleFlight("test-keys")
+    calls = []
+    lock = threading.Lock()
+
+    def caller(key):
+        def fn():
+            with lock:
+                calls.append(key)
+            time.sleep(0.05)
+            return key
+        return group.do(key, fn)
+
+    threads = [threading.Thread(target=caller, args=(k,)) for k in ("a", "b", "c")]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    assert sorted(calls) == ["a", "b", "c"]
+
+
+def test_groups_are_shared_per_name():
+    assert get_singleflight("extract") is get_singleflight("extract")
+    assert get_singleflight("extract") is not get_singleflight("rag")
+
+
+@pytest.mark.parametrize("a,b", [("Vessel  DELAY\n", "vessel delay"), ("", None)])
+def test_normalize_text(a, b):
+    assert normalize_text(a) == (b or "")